@@ -0,0 +1,7 @@
+"""
+__main__.py - `python -m flyn` entrypoint (uses the daemon when one is running)
+"""
+
+from flyn.cli.client import main
+
+main()
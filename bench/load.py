@@ -0,0 +1,130 @@
+"""
+load.py
+Offline load test of the generation pipeline through the replay backend.
+
+Fires --requests instructions from a transcript at generate_structured_async
+with --concurrency in flight, and reports throughput, latency percentiles and
+flyn's own overhead (measured latency minus the injected backend latency).
+No network is used; the response cache is bypassed.
+
+    python -m flyn.bench.load --synthesize 1000 --requests 20000 --concurrency 500
+    python -m flyn.bench.load --transcript ~/.local/share/flyn/transcripts.jsonl --latency-ms 50 --error-rate 0.01
+
+Record a real transcript first with backend.provider = "replay" and
+replay.mode = "record" (every show/run then goes to replay.record_provider and is saved).
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from flyn.config.loader import get_config
+from flyn.core.generation_backends.replay import ReplayBackend, transcript_key
+from flyn.core.generator import generate_structured_async
+from flyn.bench.parser_bench import load_corpus
+
+def synthesize(path: Path, n: int) -> None:
+    """
+    Write n distinct transcript entries: well-formed replies built from the parser
+    corpus commands, with every fourth one the corpus' original (messier) model text.
+    """
+    corpus = [c for c in load_corpus() if c["command"]]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            instruction = f"synthetic request {i}"
+            case = corpus[i % len(corpus)]
+            raw = case["text"] if i % 4 == 3 else json.dumps(
+                {"command": case["command"], "explanation": case["id"], "confidence": 0.95, "risk_tags": []})
+            f.write(json.dumps({"key": transcript_key(instruction), "instruction": instruction,
+                                "raw": raw, "latency_ms": 0}) + "\n")
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+async def _drive(backend: ReplayBackend, instructions: list[str], concurrency: int) -> tuple[list[float], dict, float]:
+    import asyncio
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    outcomes = {"ok": 0, "rejected": 0, "backend_errors": 0}
+
+    async def one(instruction: str) -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            res = await generate_structured_async(instruction, "replay", use_cache=False, backend=backend)
+            latencies.append(time.perf_counter() - t0)
+        if res.get("ok"):
+            outcomes["ok"] += 1
+        elif str(res.get("reason", "")).startswith("backend error"):
+            outcomes["backend_errors"] += 1
+        else:
+            outcomes["rejected"] += 1  # parsed, but refused by validation (e.g. low confidence)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in instructions))
+    return latencies, outcomes, time.perf_counter() - t0
+
+def run(transcript: Path, requests: int, concurrency: int, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+        error_rate: float = 0.0) -> dict:
+    import asyncio
+    cfg = get_config()
+    cfg.set("cache.enabled", False)
+    cfg.set("replay.latency_ms", latency_ms)
+    cfg.set("replay.latency_jitter_ms", jitter_ms)
+    cfg.set("replay.error_rate", error_rate)
+    backend = ReplayBackend(mode="replay", path=str(transcript))
+    pool = list(backend.index.instructions())
+    if not pool:
+        raise SystemExit(f"transcript {transcript} has no entries")
+    instructions = [random.choice(pool) for _ in range(requests)]
+    latencies, outcomes, wall = asyncio.run(_drive(backend, instructions, concurrency))
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "transcript_entries": len(pool),
+        "seconds": round(wall, 3),
+        "requests_per_s": round(requests / wall, 1),
+        **outcomes,
+        "latency_ms": {q: round(_percentile(latencies, p) * 1000, 3)
+                       for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+        "overhead_ms_mean": round((mean * 1000) - latency_ms - jitter_ms / 2, 3),
+    }
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m flyn.bench.load")
+    ap.add_argument("--transcript", help="transcript JSONL (default: replay.path)")
+    ap.add_argument("--synthesize", type=int, metavar="N", help="use a temporary transcript of N synthetic entries")
+    ap.add_argument("--requests", type=int, default=10_000)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="flyn-load-") as tmp:
+        if args.synthesize:
+            transcript = Path(tmp) / "transcripts.jsonl"
+            synthesize(transcript, args.synthesize)
+        else:
+            transcript = Path(args.transcript or get_config().get("replay.path")).expanduser()
+        res = run(transcript, args.requests, args.concurrency, args.latency_ms, args.jitter_ms, args.error_rate)
+    if args.json:
+        print(json.dumps(res, indent=2))
+    else:
+        lat = res["latency_ms"]
+        print(f"{res['requests']} requests, concurrency {res['concurrency']}: {res['requests_per_s']} req/s "
+              f"in {res['seconds']}s ({res['ok']} ok, {res['rejected']} rejected, {res['backend_errors']} backend errors)")
+        print(f"latency p50 {lat['p50']} ms  p95 {lat['p95']} ms  p99 {lat['p99']} ms  max {lat['max']} ms; "
+              f"flyn overhead {res['overhead_ms_mean']} ms/request")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
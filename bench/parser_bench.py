@@ -0,0 +1,96 @@
+"""
+parser_bench.py
+Correctness and throughput check for core/parser.py against the model-output corpus.
+
+Every corpus entry ({"id", "text", "command"}) must parse to its expected command;
+throughput is then measured over the corpus and over generated adversarial
+inputs (deep/unbalanced braces, many small objects, huge prose) that must stay
+roughly linear in size.
+
+    python -m flyn.bench.parser_bench [--check] [--repeat 200] [--json]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from flyn.core.parser import parse_command_from_model
+
+CORPUS = Path(__file__).resolve().parent / "corpus" / "model_outputs.jsonl"
+
+def load_corpus(path: Path = CORPUS) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def adversarial(size: int) -> dict[str, str]:
+    """
+    Inputs built to trip up regex/backtracking extractors, about `size` chars each.
+    The real answer always sits at the end.
+    """
+    tail = '\n{"command": "ls", "explanation": "x"}'
+    n = size // 2
+    return {
+        "open-braces": "{" * n + tail,
+        "nested": "{" * (n // 2) + "}" * (n // 2) + tail,
+        "many-objects": '{"a": 1} ' * (size // 9) + tail,
+        "unterminated-string": '{"x": "' + "a" * size + tail,
+        "prose": ("lorem ipsum dolor sit amet " * (size // 27)) + tail,
+    }
+
+def check(corpus: list[dict]) -> list[str]:
+    failures = []
+    for case in corpus:
+        got = parse_command_from_model(case["text"])
+        if got != case["command"]:
+            failures.append(f"{case['id']}: expected {case['command']!r}, got {got!r}")
+    return failures
+
+def _throughput(texts: list[str], repeat: int) -> dict:
+    nbytes = sum(len(t.encode("utf-8")) for t in texts) * repeat
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for t in texts:
+            parse_command_from_model(t)
+    elapsed = time.perf_counter() - t0
+    return {"seconds": round(elapsed, 6), "mb_per_s": round(nbytes / elapsed / 1e6, 2) if elapsed else None,
+            "calls_per_s": round(len(texts) * repeat / elapsed) if elapsed else None}
+
+def run(repeat: int = 200) -> dict:
+    corpus = load_corpus()
+    results = {"corpus": _throughput([c["text"] for c in corpus], repeat)}
+    # scaling: a linear extractor keeps time(4x) / time(x) near 4
+    for name in adversarial(1):
+        small = adversarial(50_000)[name]
+        big = adversarial(200_000)[name]
+        a = _throughput([small], 3)["seconds"]
+        b = _throughput([big], 3)["seconds"]
+        results[name] = {"seconds_200k": b, "scaling_4x": round(b / a, 2) if a else None}
+    return results
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m flyn.bench.parser_bench")
+    ap.add_argument("--check", action="store_true", help="only verify the corpus")
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args(argv)
+
+    failures = check(load_corpus())
+    for f in failures:
+        print(f"FAIL {f}", file=sys.stderr)
+    if failures or args.check:
+        if not failures:
+            print(f"corpus ok ({len(load_corpus())} cases)")
+        return 1 if failures else 0
+
+    results = run(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, r in results.items():
+            print(f"{name:22} " + "  ".join(f"{k}={v}" for k, v in r.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+startup.py
+Startup-time budget check for the cheap CLI paths.
+
+Runs each probe in a fresh interpreter, takes the best of N runs and fails
+(exit code 1) when the import cost over a bare interpreter exceeds the budget,
+or when a probe imports a module it should never need.
+
+    python -m flyn.bench.startup [--budget-ms 120] [--runs 5]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# argv -> modules that must stay unloaded for that command
+PROBES: dict[tuple[str, ...], tuple[str, ...]] = {
+    ("--help",): ("pydantic", "toml", "asyncio", "flyn.core.generator", "flyn.core.validator"),
+    ("config", "get", "general.safe_mode"): ("pydantic", "toml", "asyncio", "flyn.core.generator", "flyn.core.validator"),
+}
+
+_PROBE_SRC = """
+import sys, json
+sys.argv = ["flyn"] + json.loads(sys.argv[1])
+from flyn.cli.main import app
+try:
+    app(prog_name="flyn")
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print("\\n" + json.dumps(sorted(sys.modules)))
+"""
+
+def _best_wall(args: list[str], runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _loaded_modules(argv: tuple[str, ...]) -> set[str]:
+    proc = subprocess.run([sys.executable, "-c", _PROBE_SRC, json.dumps(list(argv))],
+                          capture_output=True, text=True, check=False)
+    last = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else "[]"
+    try:
+        return set(json.loads(last))
+    except ValueError:
+        return set()
+
+def measure(runs: int = 5) -> dict[str, dict]:
+    """
+    Return {probe: {"ms": import overhead in ms, "unexpected": [modules]}}.
+    """
+    bare = _best_wall([sys.executable, "-c", "pass"], runs)
+    out = {}
+    for argv, forbidden in PROBES.items():
+        wall = _best_wall([sys.executable, "-m", "flyn", *argv], runs)
+        loaded = _loaded_modules(argv)
+        out[" ".join(argv)] = {
+            "ms": round((wall - bare) * 1000, 1),
+            "unexpected": sorted(m for m in forbidden if m in loaded),
+        }
+    return out
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--budget-ms", type=float, default=120.0, help="max import overhead per probe")
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    failed = False
+    for probe, res in measure(args.runs).items():
+        over = res["ms"] > args.budget_ms
+        status = "FAIL" if over or res["unexpected"] else "ok"
+        failed = failed or status == "FAIL"
+        extra = f"  unexpected imports: {', '.join(res['unexpected'])}" if res["unexpected"] else ""
+        print(f"{status:4}  flyn {probe:<28} {res['ms']:7.1f} ms (budget {args.budget_ms:.0f} ms){extra}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
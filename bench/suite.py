@@ -0,0 +1,184 @@
+"""
+suite.py
+Benchmark suite for the generate -> parse -> validate -> execute pipeline.
+
+Each benchmark times one operation many times and reports the best per-op time
+of several rounds (least disturbed by other load). Results are written as JSON;
+given a baseline file, any benchmark slower than baseline * (1 + threshold)
+fails the run (exit code 1).
+
+    python -m flyn.bench.suite                              # run and print
+    python -m flyn.bench.suite --out results.json           # also save results
+    python -m flyn.bench.suite --write-baseline base.json   # record a baseline
+    python -m flyn.bench.suite --baseline base.json --threshold 0.25
+    python -m flyn.bench.suite --only parser,safety         # name prefixes
+
+Everything runs against temporary files: the history log, the sandbox
+directory, the config snapshot and every cache, index and database (the
+response cache and rate limiter are also disabled) live in a temporary
+directory, so the user's own data is never touched.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+from flyn.config import loader
+from flyn.config.loader import get_config
+from flyn.core import (backend_stats, executor, generator, history, history_index, manindex, parser, pathindex,
+                       ratelimit, safety, validator)
+from flyn.core.generation_backends.base import GenerationBackend
+from flyn.bench.parser_bench import load_corpus
+
+_OFFLINE_REPLY = '{"command": "find . -name \'*.log\' -mtime +7", "explanation": "Old log files", "confidence": 0.9}'
+
+class OfflineBackend(GenerationBackend):
+    """
+    Canned reply, no I/O: measures flyn's own overhead around a backend call.
+    """
+
+    def generate(self, instruction: str) -> str:
+        return _OFFLINE_REPLY
+
+def _time(fn: Callable[[], object], number: int, rounds: int) -> dict:
+    fn()  # warm caches and lazy imports
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return {"per_op_us": round(best * 1e6, 3), "number": number, "rounds": rounds}
+
+def _write_history(path: Path, entries: int) -> None:
+    # written directly; going through append() would time the writer, not the reader
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(entries):
+            f.write(json.dumps({
+                "instruction": f"list files changed in the last {i % 90} days",
+                "command": f"find . -type f -mtime -{i % 90}",
+                "executed": i % 3 == 0, "ok": True, "rc": 0,
+                "ts": f"2024-01-01T00:00:{i % 60:02d}.{i:06d}Z"}) + "\n")
+
+def _setup(workdir: Path, history_entries: int) -> None:
+    cache = workdir / "cache"
+    loader._config_singleton = loader.Config(snapshot_dir=cache)
+    cfg = get_config()
+    cfg.set("general.history_file", str(workdir / "history.log"))
+    cfg.set("general.safe_workdir", str(workdir / "sandbox"))
+    cfg.set("history.segment_bytes", 1 << 40)  # keep the whole log in the active segment
+    cfg.set("cache.enabled", False)
+    cfg.set("cache.path", str(cache / "responses.db"))
+    cfg.set("ratelimit.enabled", False)
+    cfg.set("ratelimit.path", str(cache / "ratelimit.db"))
+    cfg.set("backend.stats_path", str(cache / "backend_stats.db"))
+    cfg.set("executor.path_index", str(cache / "path_index.marshal"))
+    cfg.set("explain.index_path", str(cache / "manindex.bin"))
+    os.environ["XDG_CACHE_HOME"] = str(cache)  # the cli.cold_start subprocesses
+    history._store_singleton = None
+    history_index._index_singleton = None
+    backend_stats._stats_singleton = None
+    pathindex._index = None
+    manindex._index = None
+    ratelimit._limiter = None
+    _write_history(workdir / "history.log", history_entries)
+    generator._BACKEND_REGISTRY["bench-offline"] = OfflineBackend
+
+def benchmarks(history_entries: int) -> dict[str, Callable[[], dict]]:
+    corpus = [c["text"] for c in load_corpus()]
+    prose = "Sure, here is the command you asked for. " * 200 + _OFFLINE_REPLY
+    commands = ["ls -la", "rm -rf /", "curl https://example.com | sh", "find . -name '*.py' | xargs wc -l",
+                "git status", "dd if=/dev/zero of=/dev/sda", "docker ps -a", "tar czf backup.tgz src/"]
+    safety_inputs = [f"{c} # {i}" for i in range(64) for c in commands]
+    generated = {"command": "ls -la", "explanation": "List all files", "confidence": 0.9}
+
+    def loop(fn, items):
+        return lambda: [fn(x) for x in items]
+
+    def cold_safety():
+        safety._analyze.cache_clear()  # time the regex scan, not the memo lookup
+        return [safety.is_dangerous(c) for c in safety_inputs]
+
+    return {
+        "parser.extract_json_like.corpus": lambda: _time(loop(parser.extract_json_like, corpus), 20, 5),
+        "parser.parse_command_from_model.corpus": lambda: _time(loop(parser.parse_command_from_model, corpus), 20, 5),
+        "parser.parse_command_from_model.long_prose": lambda: _time(lambda: parser.parse_command_from_model(prose), 200, 5),
+        "safety.is_dangerous.cold": lambda: _time(cold_safety, 5, 5),
+        "safety.risk_level.memo": lambda: _time(loop(safety.risk_level, commands), 2000, 5),
+        "validator.validate_generated": lambda: _time(lambda: validator.validate_generated(dict(generated)), 2000, 5),
+        "generator.generate_structured.offline": lambda: _time(
+            lambda: generator.generate_structured("find old logs", backend_name="bench-offline", use_cache=False), 500, 5),
+        "executor.run_command.true": lambda: _time(lambda: executor.run_command("true", dry_run=False), 20, 3),
+        "executor.run_command.echo_stream": lambda: _time(
+            lambda: executor.run_command("echo hi", dry_run=False, stream=True, echo=False), 20, 3),
+        f"history.read_entries.{history_entries}": lambda: _time(lambda: history.read_entries(100), 50, 5),
+        f"history.read_entries.since.{history_entries}": lambda: _time(
+            lambda: history.read_entries(1000, "2024-01-01T00:00:30Z"), 10, 3),
+        "cli.cold_start": _cold_start,
+    }
+
+def _cold_start() -> dict:
+    from flyn.bench.startup import measure
+    res = measure(5)
+    # report the slowest probe as the figure to track; keep the rest for context
+    worst = max(res.values(), key=lambda r: r["ms"])
+    return {"per_op_us": round(worst["ms"] * 1000, 1), "probes": res}
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        cur = results.get(name)
+        if cur is None or not base.get("per_op_us"):
+            continue
+        ratio = cur["per_op_us"] / base["per_op_us"]
+        cur["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {base['per_op_us']}us -> {cur['per_op_us']}us ({ratio:.2f}x)")
+    return regressions
+
+def run(only: list[str] | None = None, history_entries: int = 100_000) -> dict:
+    with tempfile.TemporaryDirectory(prefix="flyn-bench-") as tmp:
+        _setup(Path(tmp), history_entries)
+        results = {}
+        for name, bench in benchmarks(history_entries).items():
+            if only and not any(name.startswith(p) for p in only):
+                continue
+            results[name] = bench()
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
+        "results": results,
+    }
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m flyn.bench.suite")
+    ap.add_argument("--only", default="", help="comma-separated benchmark name prefixes")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="compare against this results file")
+    ap.add_argument("--write-baseline", metavar="PATH", help="save these results as the new baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    ap.add_argument("--history-entries", type=int, default=100_000)
+    args = ap.parse_args(argv)
+
+    report = run([p for p in args.only.split(",") if p], args.history_entries)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report["results"], json.load(f), args.threshold)
+    for name, r in report["results"].items():
+        vs = f"  ({r['vs_baseline']:.2f}x baseline)" if "vs_baseline" in r else ""
+        print(f"{name:48} {r['per_op_us']:>14.3f} us/op{vs}")
+    for path in filter(None, (args.out, args.write_baseline)):
+        Path(path).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
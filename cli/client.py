@@ -0,0 +1,123 @@
+"""
+client.py
+Thin client for the resident flyn daemon (`flyn serve`).
+
+Only the standard library is imported here: when a daemon is listening, a
+`flyn show/run/exp` call is forwarded over the Unix socket and never loads
+typer, pydantic or the config. The request carries this process's cwd and
+FLYN__ variables so the daemon answers with the config a local run would see.
+Otherwise `main()` falls back to the in-process CLI.
+"""
+
+from __future__ import annotations
+import json
+import os
+import socket
+import sys
+
+# subcommands the daemon answers
+DAEMON_COMMANDS = ("show", "run", "exp")
+
+# options whose value is a path; made absolute because the daemon has its own cwd
+_PATH_OPTIONS = ("--batch", "--spill-dir", "--trace")
+
+# always run in-process (positional paths relative to this cwd, a process pool of their own)
+_LOCAL_FLAGS = ("--audit",)
+
+# prefix of the config override variables (config.loader.ENV_PREFIX)
+_ENV_PREFIX = "FLYN__"
+
+# top-level options that may precede the subcommand: flag -> number of values
+_GLOBAL_OPTIONS = {"--profile": 0, "--trace": 1}
+
+_CONNECT_TIMEOUT = 0.2
+
+def socket_path() -> str:
+    if os.getenv("FLYN_SOCKET"):
+        return os.environ["FLYN_SOCKET"]
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "flyn.sock")
+    return os.path.join(os.path.expanduser("~"), ".local", "share", "flyn", "flyn.sock")
+
+def _prepare_argv(argv: list[str]) -> list[str] | None:
+    out = list(argv)
+    if any(arg in _LOCAL_FLAGS for arg in out):
+        return None
+    for i, arg in enumerate(out):
+        if arg in _PATH_OPTIONS and i + 1 < len(out):
+            if out[i + 1] == "-":
+                return None  # stdin belongs to this process; run in-process
+            out[i + 1] = os.path.abspath(out[i + 1])
+        elif "=" in arg and arg.split("=", 1)[0] in _PATH_OPTIONS:
+            opt, val = arg.split("=", 1)
+            if val == "-":
+                return None
+            out[i] = f"{opt}={os.path.abspath(val)}"
+    return out
+
+def _command_name(argv: list[str]) -> str | None:
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg.split("=", 1)[0] in _GLOBAL_OPTIONS:
+            i += 1 if "=" in arg else 1 + _GLOBAL_OPTIONS[arg]
+            continue
+        return arg
+    return None
+
+def try_daemon(argv: list[str]) -> int | None:
+    """
+    Forward argv to the daemon and relay its output. Returns the exit code, or
+    None when the command should run in-process (no daemon, unsupported command).
+    """
+    if _command_name(argv) not in DAEMON_COMMANDS or os.getenv("FLYN_NO_DAEMON"):
+        return None
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+    forwarded = _prepare_argv(argv)
+    if forwarded is None:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(_CONNECT_TIMEOUT)
+        sock.connect(path)
+        sock.settimeout(None)
+        request = {
+            "argv": forwarded,
+            "tty": sys.stdout.isatty(),
+            "err_tty": sys.stderr.isatty(),
+            "cwd": os.getcwd(),
+            "env": {k: v for k, v in os.environ.items() if k.startswith(_ENV_PREFIX)},
+        }
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        reader = sock.makefile("r", encoding="utf-8")
+    except OSError:
+        sock.close()
+        return None  # stale socket or daemon gone
+    with sock, reader:
+        try:
+            for line in reader:
+                msg = json.loads(line)
+                if "exit" in msg:
+                    return int(msg["exit"])
+                stream = sys.stderr if msg.get("stream") == "err" else sys.stdout
+                stream.write(msg.get("data", ""))
+                stream.flush()
+        except BrokenPipeError:
+            # our stdout was closed (e.g. piped into `head`)
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+    # connection dropped mid-request
+    sys.stderr.write("flyn: lost connection to daemon\n")
+    return 1
+
+def main() -> None:
+    rc = try_daemon(sys.argv[1:])
+    if rc is not None:
+        sys.exit(rc)
+    from flyn.cli.main import app
+    app(prog_name="flyn")
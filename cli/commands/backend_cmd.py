@@ -0,0 +1,74 @@
+"""
+backend_cmd.py - per-backend win rates and latency from hedged generation, and rate limit state
+"""
+
+from __future__ import annotations
+import json
+import typer
+from flyn.core.backend_stats import get_stats
+from flyn.core import ratelimit
+
+app = typer.Typer()
+
+@app.command("stats")
+def stats(as_json: bool = typer.Option(False, "--json", help="Print the summary as JSON")):
+    """
+    Attempts, wins and latency percentiles per provider (backend.providers hedging).
+    """
+    summary = get_stats().summary()
+    if as_json:
+        typer.echo(json.dumps(summary, indent=2))
+        return
+    if not summary:
+        typer.echo("no hedged requests recorded")
+        return
+    typer.echo(f"{'provider':16} {'attempts':>8} {'wins':>6} {'win rate':>9} {'invalid':>8} {'errors':>7} "
+               f"{'cancelled':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for provider, s in sorted(summary.items(), key=lambda kv: -kv[1]["win_rate"]):
+        p50 = f"{s['p50_ms']:.0f}" if s["p50_ms"] is not None else "-"
+        p95 = f"{s['p95_ms']:.0f}" if s["p95_ms"] is not None else "-"
+        typer.echo(f"{provider:16} {s['attempts']:>8} {s['win']:>6} {s['win_rate']:>9.1%} {s['invalid']:>8} "
+                   f"{s['error']:>7} {s['cancelled']:>9} {p50:>8} {p95:>8}")
+
+@app.command("reset")
+def reset():
+    """
+    Forget all recorded attempts.
+    """
+    get_stats().clear()
+    typer.echo("backend stats cleared")
+
+@app.command("limits")
+def limits(as_json: bool = typer.Option(False, "--json", help="Print the state as JSON"),
+           clear: bool = typer.Option(False, "--clear", help="Reset all buckets, leases and waiters")):
+    """
+    Host-wide rate limit state per provider: tokens, pause after a 429, calls in flight and waiting.
+    """
+    limiter = ratelimit.get_limiter()
+    if limiter is None:
+        typer.echo("rate limiting is disabled (ratelimit.enabled)")
+        return
+    if clear:
+        limiter.clear()
+        typer.echo("rate limit state cleared")
+        return
+    state = limiter.status()
+    for provider, row in state.items():
+        row["limits"] = ratelimit.limits_for(provider)
+    if as_json:
+        typer.echo(json.dumps(state, indent=2))
+        return
+    if not state:
+        typer.echo("no rate limited calls recorded")
+        return
+    typer.echo(f"{'provider':16} {'rpm':>6} {'tokens':>7} {'paused s':>9} {'in flight':>12} {'waiting':>10}")
+    for provider, s in sorted(state.items()):
+        lim = s["limits"]
+        rpm = f"{lim['rate'] * 60:.0f}" if lim and lim["rate"] else "-"
+        tokens = f"{s['tokens']:.1f}" if s["tokens"] is not None else "-"
+        flight = f"{s['in_flight']['interactive']}+{s['in_flight']['batch']}"
+        if lim and lim["concurrent"]:
+            flight += f"/{lim['concurrent']}"
+        waiting = f"{s['waiting']['interactive']}+{s['waiting']['batch']}"
+        typer.echo(f"{provider:16} {rpm:>6} {tokens:>7} {s['blocked_seconds']:>9.1f} {flight:>12} {waiting:>10}")
+    typer.echo("(in flight / waiting: interactive+batch)")
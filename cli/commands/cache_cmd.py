@@ -0,0 +1,31 @@
+"""
+cache_cmd.py - inspect and clear the response cache
+"""
+
+from __future__ import annotations
+import typer
+from flyn.core.cache import get_cache
+
+app = typer.Typer()
+
+@app.command("stats")
+def stats():
+    store = get_cache()
+    if store is None:
+        typer.echo("cache disabled")
+        return
+    s = store.stats()
+    total = s["hits"] + s["misses"]
+    rate = (s["hits"] / total) if total else 0.0
+    typer.echo(f"entries: {s['entries']}")
+    typer.echo(f"hits: {s['hits']}  misses: {s['misses']}  hit rate: {rate:.1%}")
+    typer.echo(f"path: {s['path']}")
+
+@app.command("clear")
+def clear():
+    store = get_cache()
+    if store is None:
+        typer.echo("cache disabled")
+        return
+    store.clear()
+    typer.echo("cache cleared")
@@ -1,21 +1,97 @@
 """
-exp.py - explain a raw command using parser + safety (lightweight)
+exp.py - explain a raw command using parser + safety + the local man page index,
+or audit whole trees of scripts (--audit)
 """
 
 from __future__ import annotations
+import time
+from typing import List, Optional
 import typer
 from flyn.core.parser import parse_command_from_model
-from flyn.core import safety
-from flyn.cli.render.blocks import command_block, risk_block, notes_block
+from flyn.core import safety, manindex
+from flyn.config.loader import get_config
+from flyn.cli.render.blocks import command_block, risk_block, notes_block, finding_line, audit_summary_block
+from flyn.cli.render.records import RecordWriter, check_format
 
 app = typer.Typer()
 
 @app.command()
-def explain(raw_text: str):
+def explain(raw_text: Optional[List[str]] = typer.Argument(None, help="Command to explain, or paths with --audit"),
+            reindex: bool = typer.Option(False, "--reindex", help="Rebuild the man page index from scratch"),
+            run_help: Optional[bool] = typer.Option(None, "--run-help/--no-help", help="Run '<cmd> --help' for commands without a man page (default: explain.help_fallback)"),
+            audit: bool = typer.Option(False, "--audit", help="Audit the shell scripts, CI YAML and Dockerfiles under the given paths"),
+            min_risk: Optional[str] = typer.Option(None, "--min-risk", help="With --audit: lowest risk reported (default: audit.min_risk)"),
+            jobs: Optional[int] = typer.Option(None, "--jobs", "-j", help="With --audit: worker processes (default: audit.jobs, 0 = all cores)"),
+            fmt: str = typer.Option("text", "--format", help="Output format: text, ndjson or json")):
     """
-    Explain a raw command or model text: show command + risk.
+    Explain a raw command or model text: show command, risk and what each flag does.
     """
+    check_format(fmt)
+    if audit:
+        _audit(raw_text or ["."], min_risk, jobs, fmt)
+        return
+    raw_text = " ".join(raw_text) if raw_text else None
+    if reindex:
+        stats = manindex.build_index(manindex.index_path(), force=True)
+        typer.echo(f"indexed {stats['pages']} man pages ({stats['failed']} unreadable)", err=fmt != "text")
+        if raw_text is None:
+            return
+    if raw_text is None:
+        typer.secho("Missing command to explain.", fg=typer.colors.RED)
+        raise typer.Exit(code=2)
     cmd = parse_command_from_model(raw_text) or raw_text
+    if fmt != "text":
+        verdict = safety.analyze(cmd)
+        stages = manindex.explain_command(cmd, run_help)
+        with RecordWriter(fmt, many=False) as out:
+            out.write({"command": cmd, "risk": verdict.risk, "safety_rules": list(verdict.matched_rules),
+                       "dangerous": verdict.dangerous,
+                       "stages": [{**st, "flags": [{"flag": f, "description": d} for f, d in st["flags"]]}
+                                  for st in stages]})
+        return
     typer.echo(command_block(cmd))
     typer.echo(risk_block(safety.risk_level(cmd), 0.0))
-    typer.echo(notes_block("Explanation not available (use generator for full explanation)"))
+    if manindex.is_stale(manindex.index_path()):
+        typer.secho("Indexing man pages (first run, or installed pages changed)...", fg=typer.colors.BLUE, err=True)
+    text = manindex.describe(cmd, run_help)
+    typer.echo(notes_block(text or "No local documentation found."))
+
+def _audit(paths: List[str], min_risk: Optional[str], jobs: Optional[int], fmt: str) -> None:
+    """
+    Stream findings per file as workers finish (in walk order), then the summary.
+    Exits 1 when any command is high risk, so the audit can gate CI.
+    """
+    from flyn.core import audit
+    cfg = get_config()
+    min_risk = min_risk or cfg.get("audit.min_risk", "medium")
+    if min_risk not in audit.RISKS:
+        typer.secho(f"Unknown risk {min_risk!r} (choose from {', '.join(audit.RISKS)}).", fg=typer.colors.RED, err=True)
+        raise typer.Exit(code=2)
+    floor = audit.RISKS.index(min_risk)
+    jobs = int(cfg.get("audit.jobs", 0) if jobs is None else jobs)
+    t0 = time.perf_counter()
+    results = []
+    out = RecordWriter(fmt) if fmt != "text" else None
+    for res in audit.audit_paths(paths, jobs=jobs, max_file_bytes=int(cfg.get("audit.max_file_bytes", 0)),
+                                 parallel_min_bytes=int(cfg.get("audit.parallel_min_bytes", 1 << 20))):
+        results.append(res)
+        if res["error"] is not None and out is None:
+            typer.secho(f"{res['path']}: {res['error']}", fg=typer.colors.YELLOW, err=True)
+        for line, cmd, risk, rules in res["findings"]:
+            if audit.RISKS.index(risk) < floor:
+                continue
+            if out is None:
+                typer.echo(finding_line(res["path"], line, cmd, risk, rules))
+            else:
+                out.write({"type": "finding", "path": res["path"], "line": line, "command": cmd,
+                           "risk": risk, "safety_rules": rules})
+    summary = audit.summarize(results)
+    seconds = time.perf_counter() - t0
+    if out is None:
+        typer.echo(audit_summary_block(summary, seconds))
+    else:
+        errors = [{"path": r["path"], "error": r["error"]} for r in results if r["error"] is not None]
+        out.write({"type": "summary", **summary, "seconds": round(seconds, 3), "unreadable": errors})
+        out.close()
+    if summary["counts"]["high"]:
+        raise typer.Exit(code=1)
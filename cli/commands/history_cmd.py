@@ -0,0 +1,85 @@
+"""
+history_cmd.py - list and search history entries
+"""
+
+from __future__ import annotations
+import json
+from typing import Optional
+import typer
+from flyn.core.history import read_entries, parse_since, get_store, search_entries
+from flyn.core import tracing
+from flyn.core.history_index import get_index
+from flyn.cli.render.blocks import history_line
+
+app = typer.Typer()
+
+@app.callback(invoke_without_command=True)
+def history(ctx: typer.Context,
+            limit: int = typer.Option(20, "--limit", "-n", help="Number of most recent entries"),
+            since: Optional[str] = typer.Option(None, "--since", help="Only entries newer than this (e.g. 2h, 7d, 2024-05-01)"),
+            as_json: bool = typer.Option(False, "--json", help="One JSON object per line")):
+    """
+    Show recent instructions and commands, oldest first.
+    """
+    if ctx.invoked_subcommand is not None:
+        return
+    try:
+        since_ts = parse_since(since) if since else None
+    except ValueError:
+        typer.secho(f"Invalid --since value: {since}", fg=typer.colors.RED)
+        raise typer.Exit(code=2)
+    for entry in read_entries(limit, since_ts):
+        typer.echo(json.dumps(entry, ensure_ascii=False) if as_json else history_line(entry))
+
+@app.command("search")
+def search(query: str,
+           limit: int = typer.Option(20, "--limit", "-n"),
+           executed: Optional[bool] = typer.Option(None, "--executed/--dry", help="Only executed (or only dry-run) entries"),
+           ok: Optional[bool] = typer.Option(None, "--ok/--failed", help="Only successful (or only failed) runs"),
+           rc: Optional[int] = typer.Option(None, "--rc", help="Only entries with this exit code"),
+           as_json: bool = typer.Option(False, "--json", help="One JSON object per line")):
+    """
+    Full-text search over past instructions and commands, best match first.
+    """
+    results = search_entries(query, limit=limit, executed=executed, ok=ok, rc=rc)
+    if results is None:
+        typer.secho("History index disabled (history.index = false).", fg=typer.colors.YELLOW)
+        raise typer.Exit(code=1)
+    for entry in results:
+        typer.echo(json.dumps(entry, ensure_ascii=False) if as_json else history_line(entry))
+
+@app.command("timings")
+def timings(since: Optional[str] = typer.Option(None, "--since", help="Only entries newer than this (e.g. 2h, 7d, 2024-05-01)"),
+            as_json: bool = typer.Option(False, "--json", help="Print the summary as JSON")):
+    """
+    Per-stage latency percentiles from the timings stored with history entries.
+    """
+    try:
+        since_ts = parse_since(since) if since else None
+    except ValueError:
+        typer.secho(f"Invalid --since value: {since}", fg=typer.colors.RED)
+        raise typer.Exit(code=2)
+    summary = tracing.summarize(e["timings"] for e in get_store().iter_forward()
+                                if e.get("timings") and (since_ts is None or e.get("ts", "") >= since_ts))
+    if as_json:
+        typer.echo(json.dumps(summary, indent=2))
+        return
+    if not summary:
+        typer.echo("No timings recorded yet.")
+        return
+    typer.echo(f"{'stage':<16}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'max ms':>12}")
+    for name, row in summary.items():
+        typer.echo(f"{name:<16}{row['count']:>8}{row['p50_ms']:>12.2f}{row['p95_ms']:>12.2f}"
+                   f"{row['p99_ms']:>12.2f}{row['max_ms']:>12.2f}")
+
+@app.command("reindex")
+def reindex():
+    """
+    Rebuild the search index from the history log and its rotated segments.
+    """
+    index = get_index()
+    if index is None:
+        typer.secho("History index disabled (history.index = false).", fg=typer.colors.YELLOW)
+        raise typer.Exit(code=1)
+    n = index.rebuild(get_store().iter_forward())
+    typer.echo(f"indexed {n} entries")
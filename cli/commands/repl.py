@@ -0,0 +1,248 @@
+"""
+repl.py - interactive session: one warm pipeline and one shell for many instructions
+
+Config, compiled safety rules, the pydantic model and the backend client are
+loaded once. Accepted commands run in a persistent execution context
+(repl.mode, default the shell session), so `cd` and exports carry over between
+prompts. `!cmd` runs cmd there directly.
+
+With speculation on (--speculate or repl.speculate), generation starts when
+typing pauses for repl.speculate_after_ms; the attempt is cancelled as soon
+as the line changes, and Enter on the same text picks up its answer.
+"""
+
+from __future__ import annotations
+import codecs
+import contextvars
+import os
+import select
+import sys
+import threading
+from typing import Optional
+import typer
+from flyn.core import generator, executor, safety, tracing, validator
+from flyn.core.history import append_entry
+from flyn.config.loader import get_config
+from flyn.cli.render.blocks import command_block, risk_block, output_block, notes_block, early_risk_block, flags_block
+
+try:
+    import termios
+except ImportError:  # Windows
+    termios = None
+
+app = typer.Typer()
+
+_EXIT_WORDS = ("exit", "quit", ":q")
+
+class _Attempt:
+    __slots__ = ("text", "cancel", "done", "result")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.cancel = threading.Event()
+        self.done = threading.Event()
+        self.result: Optional[dict] = None
+
+class Speculator:
+    """
+    At most one speculative generation in flight, for the text last passed to `start`.
+    """
+
+    def __init__(self, use_cache: bool = True):
+        self.use_cache = use_cache
+        self._attempt: Optional[_Attempt] = None
+
+    def start(self, text: str) -> None:
+        if self._attempt is not None and self._attempt.text == text:
+            return
+        self.cancel()
+        attempt = self._attempt = _Attempt(text)
+        threading.Thread(target=self._work, args=(attempt,), name="flyn-speculate", daemon=True).start()
+
+    def _work(self, attempt: _Attempt) -> None:
+        try:
+            attempt.result = generator.generate_speculative(attempt.text, attempt.cancel, self.use_cache)
+        except Exception:
+            attempt.result = None  # the real request reports the error
+        finally:
+            attempt.done.set()
+
+    def changed(self, text: str) -> None:
+        if self._attempt is not None and self._attempt.text != text:
+            self.cancel()
+
+    def cancel(self) -> None:
+        if self._attempt is not None:
+            self._attempt.cancel.set()
+            self._attempt = None
+
+    def take(self, text: str) -> Optional[dict]:
+        """
+        The answer for text if one was started for exactly this text (waiting for
+        it if still running), else None.
+        """
+        attempt, self._attempt = self._attempt, None
+        if attempt is None or attempt.text != text:
+            if attempt is not None:
+                attempt.cancel.set()
+            return None
+        with tracing.span("speculation.wait", ready=attempt.done.is_set()):
+            attempt.done.wait()
+        return attempt.result
+
+def _write(s: str) -> None:
+    sys.stdout.write(s)
+    sys.stdout.flush()
+
+def _read_line_tty(prompt: str, spec: Optional[Speculator], pause: float, min_chars: int) -> Optional[str]:
+    """
+    Minimal line editor in non-canonical mode (printable keys, backspace, Ctrl-U,
+    Ctrl-D on an empty line = EOF). Returns None at EOF.
+    """
+    fd = sys.stdin.fileno()
+    saved = termios.tcgetattr(fd)
+    mode = termios.tcgetattr(fd)
+    mode[3] &= ~(termios.ICANON | termios.ECHO)  # keep ISIG: Ctrl-C still interrupts
+    mode[6][termios.VMIN], mode[6][termios.VTIME] = 1, 0
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buf: list[str] = []
+    speculated = ""
+    termios.tcsetattr(fd, termios.TCSADRAIN, mode)
+    try:
+        _write(prompt)
+        while True:
+            text = "".join(buf).strip()
+            wait = pause if spec is not None and text != speculated and len(text) >= min_chars else None
+            ready, _, _ = select.select([fd], [], [], wait)
+            if not ready:
+                # typing paused: start generating what is there so far
+                spec.start(text)
+                speculated = text
+                continue
+            data = os.read(fd, 64)
+            if not data:
+                return None
+            for ch in decoder.decode(data):
+                if ch in "\r\n":
+                    _write("\n")
+                    return "".join(buf)
+                if ch == "\x04":
+                    if not buf:
+                        _write("\n")
+                        return None
+                elif ch in "\x7f\x08":
+                    if buf:
+                        buf.pop()
+                        _write("\b \b")
+                elif ch == "\x15":
+                    _write("\b \b" * len(buf))
+                    buf.clear()
+                elif ch == "\x1b":
+                    # swallow escape sequences (arrow keys etc.)
+                    while select.select([fd], [], [], 0.01)[0]:
+                        os.read(fd, 64)
+                    break
+                elif ch.isprintable():
+                    buf.append(ch)
+                    _write(ch)
+            if spec is not None:
+                spec.changed("".join(buf).strip())
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+
+def _read_line_plain(prompt: str) -> Optional[str]:
+    _write(prompt)
+    line = sys.stdin.readline()
+    return None if not line else line.rstrip("\n")
+
+def _warm(mode: str) -> None:
+    validator._gen_output_model()
+    safety.analyze("true")
+    generator._choose_backend()
+    if mode == "session" and os.name == "posix":
+        from flyn.core.shell_session import get_session
+        get_session().run("true", timeout=5)
+
+def _execute(cmd: str, mode: str) -> dict:
+    result = executor.run_command(cmd, dry_run=False, stream=True, mode=mode)
+    if not result.get("streamed"):
+        typer.echo(output_block(result.get("stdout", ""), result.get("stderr", "")))
+    if not result.get("ok"):
+        typer.secho(f"exit status {result.get('rc')}", fg=typer.colors.YELLOW)
+    return result
+
+def _handle(instruction: str, spec: Optional[Speculator], use_cache: bool, mode: str, ask: bool, yes: bool) -> None:
+    tracing.start_trace("repl")
+    if instruction.startswith("!"):
+        cmd = instruction[1:].strip()
+        if cmd:
+            result = _execute(cmd, mode)
+            append_entry({"instruction": instruction, "command": cmd, "executed": True,
+                          "result": {"ok": result.get("ok"), "rc": result.get("rc")}})
+        return
+
+    res = spec.take(instruction) if spec is not None else None
+    shown: dict = {}
+    if res is None:
+        def on_command(cmd: str, verdict) -> None:
+            shown["command"] = cmd
+            typer.echo(command_block(cmd))
+            early = early_risk_block(verdict.risk, verdict.matched_rules)
+            if early:
+                typer.echo(early)
+
+        res = generator.generate_structured(instruction, use_cache=use_cache, on_command=on_command)
+    if not res.get("ok"):
+        typer.secho(f"Rejected: {res.get('reason')}", fg=typer.colors.RED)
+        return
+    cmd = res["command"]
+    if shown.get("command") != cmd:
+        typer.echo(command_block(cmd))
+    typer.echo(risk_block(res.get("risk", "low"), res.get("confidence", 0.0)))
+    typer.echo(notes_block(res.get("raw", {}).get("explanation", "")))
+    if res.get("flags"):
+        typer.echo(flags_block(res["flags"]))
+
+    risky = bool(res.get("need_confirmation")) or safety.is_dangerous(cmd)
+    if risky:
+        typer.secho("Command is flagged as risky.", fg=typer.colors.YELLOW)
+    if (yes and not risky) or (ask and typer.confirm("Run it?", default=False)):
+        result = _execute(cmd, mode)
+        executed, outcome = True, {"ok": result.get("ok"), "rc": result.get("rc")}
+    else:
+        executed, outcome = False, {"ok": True, "rc": None}
+    append_entry({"instruction": instruction, "command": cmd, "executed": executed, "result": outcome})
+
+@app.command()
+def repl(speculate: Optional[bool] = typer.Option(None, "--speculate/--no-speculate", help="Generate while typing pauses (default: repl.speculate)"),
+         yes: bool = typer.Option(False, "--yes", "-y", help="Run accepted, non-risky commands without asking"),
+         no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the response cache"),
+         mode: Optional[str] = typer.Option(None, "--mode", help="Execution context: session or spawn (default: repl.mode)")):
+    """
+    Interactive prompt: enter instructions one after another with a warm pipeline.
+    """
+    cfg = get_config()
+    mode = mode or cfg.get("repl.mode", "session")
+    tty = termios is not None and sys.stdin.isatty() and sys.stdout.isatty()
+    if speculate is None:
+        speculate = bool(cfg.get("repl.speculate", False))
+    spec = Speculator(use_cache=not no_cache) if speculate and tty else None
+    pause = max(0.05, float(cfg.get("repl.speculate_after_ms", 400)) / 1000.0)
+    min_chars = int(cfg.get("repl.speculate_min_chars", 8))
+    prompt = cfg.get("repl.prompt", "flyn> ")
+    _warm(mode)
+    typer.echo(notes_block("Describe a task; '!cmd' runs cmd directly; Ctrl-D or 'exit' quits."))
+    while True:
+        try:
+            line = _read_line_tty(prompt, spec, pause, min_chars) if tty else _read_line_plain(prompt)
+            if line is None or line.strip() in _EXIT_WORDS:
+                break
+            if line.strip():
+                # each prompt gets its own trace, so history timings are per instruction
+                contextvars.copy_context().run(_handle, line.strip(), spec, not no_cache, mode, tty, yes)
+        except KeyboardInterrupt:
+            if spec is not None:
+                spec.cancel()
+            _write("\n")
+    if spec is not None:
+        spec.cancel()
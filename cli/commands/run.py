@@ -3,33 +3,77 @@ run.py - generate, validate and (optionally) execute the command
 """
 
 from __future__ import annotations
+from typing import Optional
 import typer
-from flyn.core import generator 
+from flyn.core import generator
 from flyn.core import executor
-from flyn.cli.render.blocks import command_block, risk_block, output_block, notes_block
+from flyn.cli.render.blocks import command_block, risk_block, output_block, notes_block, early_risk_block, flags_block, usage_block, preview_block
+from flyn.cli.render.layout import header
+from flyn.cli.render.records import RecordWriter, check_format, current_timings, execution_fields, generation_record
 from flyn.core import safety
 from flyn.config.loader import get_config
 from flyn.core.history import append_entry
+from flyn.cli.commands.show import _read_batch
 
 app = typer.Typer()
 
 @app.command()
-def run(instruction: str, confirm: bool = typer.Option(False, "--confirm", "-y"), no_dry: bool = typer.Option(False, "--no-dry", "--execute")):
+def run(instruction: Optional[str] = typer.Argument(None), confirm: bool = typer.Option(False, "--confirm", "-y"), no_dry: bool = typer.Option(False, "--no-dry", "--execute"), no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the response cache"),
+        stream: Optional[bool] = typer.Option(None, "--stream/--no-stream", help="Show output live (default: executor.stream)"),
+        spill_dir: Optional[str] = typer.Option(None, "--spill-dir", help="Also write full stdout/stderr to files in this directory"),
+        preview: Optional[bool] = typer.Option(None, "--preview/--no-preview", help="On a dry run, show the files the command would change (default: executor.preview). "
+                                                "The command really runs on a snapshot of the workdir: effects outside the "
+                                                "filesystem (kill, curl -X POST, git push) still happen; risky commands need --confirm"),
+        batch: Optional[str] = typer.Option(None, "--batch", help="File with one instruction per line ('-' for stdin)"),
+        workers: Optional[int] = typer.Option(None, "--workers", "-w", help="Commands executed in parallel in batch mode (default: executor.workers)"),
+        concurrency: Optional[int] = typer.Option(None, "--concurrency", "-j", help="Max concurrent generations in batch mode"),
+        fmt: str = typer.Option("text", "--format", help="Output format: text, ndjson or json (output is captured, not streamed)")):
     """
     Generate a command and execute it (subject to safety rules).
     By default this will be a dry-run. Use --confirm and --no-dry to actually run.
     """
     cfg = get_config()
-    res = generator.generate_structured(instruction)
+    check_format(fmt)
+    if batch is not None:
+        out = RecordWriter(fmt) if fmt != "text" else None
+        try:
+            failed = _run_batch(_read_batch(batch), confirm, no_dry, no_cache, workers, concurrency, out)
+        finally:
+            if out is not None:
+                out.close()
+        if failed:
+            raise typer.Exit(code=1)
+        return
+    if instruction is None:
+        typer.secho("Missing instruction (or use --batch FILE).", fg=typer.colors.RED, err=fmt != "text")
+        raise typer.Exit(code=2)
+    if fmt != "text":
+        _run_record(instruction, confirm, no_dry, no_cache, spill_dir, fmt, preview)
+        return
+
+    shown: dict = {}
+
+    def on_command(cmd: str, verdict) -> None:
+        # printed as soon as the command is parsed, before the explanation finishes
+        shown["command"] = cmd
+        typer.echo(command_block(cmd))
+        early = early_risk_block(verdict.risk, verdict.matched_rules)
+        if early:
+            typer.echo(early)
+
+    res = generator.generate_structured(instruction, use_cache=not no_cache, on_command=on_command)
     if not res.get("ok"):
         typer.secho(f"Rejected: {res.get('reason')}", fg=typer.colors.RED)
         typer.echo(res.get("model_raw", ""))
         raise typer.Exit(code=2)
 
     cmd = res["command"]
-    typer.echo(command_block(cmd))
+    if shown.get("command") != cmd:
+        typer.echo(command_block(cmd))
     typer.echo(risk_block(res.get("risk", "low"), res.get("confidence", 0.0)))
     typer.echo(notes_block(res.get("raw", {}).get("explanation", "")))
+    if res.get("flags"):
+        typer.echo(flags_block(res["flags"]))
 
     needs_confirm = bool(res.get("need_confirmation"))
     effective_dry = True if not no_dry else False
@@ -46,6 +90,127 @@ def run(instruction: str, confirm: bool = typer.Option(False, "--confirm", "-y")
         typer.secho("Refusing to run dangerous command without --confirm.", fg=typer.colors.RED)
         raise typer.Exit(code=4)
 
-    result = executor.run_command(cmd, dry_run=effective_dry)
-    typer.echo(output_block(result.get("stdout", ""), result.get("stderr", "")))
+    if stream is None:
+        stream = bool(cfg.get("executor.stream", True))
+    result = executor.run_command(cmd, dry_run=effective_dry, stream=stream, spill_dir=spill_dir, preview=preview,
+                                  confirmed=confirm)
+    if result.get("preview"):
+        typer.echo(preview_block(result["preview"]))
+    elif result.get("streamed"):
+        # output was already shown live; only point at the full copy if it was cut
+        if result.get("truncated") and result.get("spill"):
+            typer.echo(notes_block(f"Full output: {result['spill']['stdout']} / {result['spill']['stderr']}"))
+    else:
+        typer.echo(output_block(result.get("stdout", ""), result.get("stderr", "")))
     append_entry({"instruction": instruction, "command": cmd, "executed": not effective_dry, "result": {"ok": result.get("ok"), "rc": result.get("rc")}})
+
+def _run_record(instruction: str, confirm: bool, no_dry: bool, no_cache: bool, spill_dir: Optional[str], fmt: str,
+                preview: Optional[bool] = None) -> None:
+    """
+    `run` for --format ndjson/json: same checks and exit codes, one record instead of text.
+    """
+    res = generator.generate_structured(instruction, use_cache=not no_cache)
+    record = generation_record(res, instruction)
+    code = 0
+    if not res.get("ok"):
+        record["status"], code = "rejected", 2
+    elif res.get("need_confirmation") and not confirm:
+        record["status"], code = "needs_confirmation", 3
+    elif safety.is_dangerous(res["command"]) and not confirm:
+        record["status"], code = "refused", 4
+    else:
+        # captured (head + tail) rather than echoed, so stdout carries only the record
+        result = executor.run_command(res["command"], dry_run=not no_dry, stream=True, echo=False, spill_dir=spill_dir,
+                                      preview=preview, confirmed=confirm)
+        record.update(execution_fields(result))
+        record["status"] = "executed" if record["executed"] else "dry_run"
+        append_entry({"instruction": instruction, "command": res["command"], "executed": record["executed"],
+                      "result": {"ok": result.get("ok"), "rc": result.get("rc")}})
+    record["timings"] = current_timings()
+    with RecordWriter(fmt, many=False) as out:
+        out.write(record)
+    if code:
+        raise typer.Exit(code=code)
+
+def _run_batch(instructions: list[str], confirm: bool, no_dry: bool, no_cache: bool,
+               workers: Optional[int], concurrency: Optional[int], out: Optional[RecordWriter] = None) -> int:
+    """
+    Generate all commands, then execute the approved ones in parallel under the
+    scheduler's resource limits. Returns the number of rejected or failed entries.
+    With `out`, each instruction produces one record (as soon as its outcome is
+    known) instead of text.
+    """
+    import asyncio
+    from flyn.core.scheduler import Scheduler
+    effective_dry = not no_dry
+
+    failed = 0
+    approved: list[dict] = []
+
+    def emit(res: dict, status: str, result: Optional[dict] = None) -> None:
+        record = generation_record(res)
+        record["index"] = res["index"]
+        record["status"] = status
+        if result is not None:
+            record.update(execution_fields(result))
+            record["timings"] = {"execute": round(result["wall_seconds"] * 1000, 3)}
+        out.write(record)
+
+    async def generate() -> None:
+        # each result is handled as soon as its turn in input order is ready
+        nonlocal failed
+        index = 0
+        async for res in generator.agenerate_ordered(instructions, use_cache=not no_cache, concurrency=concurrency):
+            res["index"], index = index, index + 1
+            if out is None:
+                typer.echo(header(res["instruction"]))
+            if not res.get("ok"):
+                failed += 1
+                if out is None:
+                    typer.secho(f"Rejected: {res.get('reason')}", fg=typer.colors.RED)
+                else:
+                    emit(res, "rejected")
+                continue
+            if out is None:
+                typer.echo(command_block(res["command"]))
+                typer.echo(risk_block(res.get("risk", "low"), res.get("confidence", 0.0)))
+            if (res.get("need_confirmation") or safety.is_dangerous(res["command"])) and not confirm:
+                failed += 1
+                if out is None:
+                    typer.secho("Skipped: requires confirmation (danger/low confidence). Use --confirm to proceed.", fg=typer.colors.YELLOW)
+                else:
+                    emit(res, "needs_confirmation")
+                continue
+            approved.append(res)
+
+    asyncio.run(generate())
+
+    if effective_dry:
+        for res in approved:
+            append_entry({"instruction": res["instruction"], "command": res["command"], "executed": False,
+                          "result": {"ok": True, "rc": None}, "timings": {}})
+            if out is not None:
+                emit(res, "dry_run")
+        if approved and out is None:
+            typer.echo(notes_block(f"Dry run: {len(approved)} command(s) approved. Use --no-dry to execute."))
+        return failed
+
+    scheduler = Scheduler(workers=workers)
+    if out is None:
+        typer.echo(notes_block(f"Executing {len(approved)} command(s), {scheduler.workers} at a time."))
+    for result in scheduler.run(r["command"] for r in approved):
+        res = approved[result["index"]]
+        if out is None:
+            typer.echo(header(f"done: {res['instruction']}"))
+            typer.echo(command_block(result["cmd"]))
+            typer.echo(output_block(result.get("stdout", ""), result.get("stderr", "")))
+            typer.echo(usage_block(result))
+        else:
+            emit(res, "executed", result)
+        if not result.get("ok"):
+            failed += 1
+        # the batch trace spans every command, so only this command's own wall time is stored
+        append_entry({"instruction": res["instruction"], "command": result["cmd"], "executed": True,
+                      "result": {"ok": result.get("ok"), "rc": result.get("rc")},
+                      "timings": {"execute": round(result["wall_seconds"] * 1000, 3)}})
+    return failed
@@ -0,0 +1,21 @@
+"""
+serve.py - run the resident flyn daemon
+"""
+
+from __future__ import annotations
+from typing import Optional
+import typer
+
+app = typer.Typer()
+
+@app.command()
+def serve(socket_path: Optional[str] = typer.Option(None, "--socket", help="Unix socket path (default: $FLYN_SOCKET or $XDG_RUNTIME_DIR/flyn.sock)")):
+    """
+    Keep config, backend and safety rules warm and answer show/run/exp calls over a Unix socket.
+    """
+    from flyn.cli.daemon import serve as run_server
+    try:
+        run_server(socket_path)
+    except RuntimeError as e:
+        typer.secho(str(e), fg=typer.colors.RED)
+        raise typer.Exit(code=1)
@@ -3,24 +3,95 @@ show.py - generate and display the proposed command, risk, and explanation
 """
 
 from __future__ import annotations
+import sys
+from typing import Optional
 import typer
 from flyn.core import generator
-from flyn.cli.render.blocks import command_block, risk_block, notes_block
+from flyn.cli.render.blocks import command_block, risk_block, notes_block, early_risk_block, flags_block
+from flyn.cli.render.layout import header
+from flyn.cli.render.records import RecordWriter, check_format, current_timings, generation_record
 
 app = typer.Typer()
 
 @app.command()
-def show(instruction: str):
+def show(instruction: Optional[str] = typer.Argument(None),
+         no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the response cache"),
+         batch: Optional[str] = typer.Option(None, "--batch", help="File with one instruction per line ('-' for stdin)"),
+         concurrency: Optional[int] = typer.Option(None, "--concurrency", "-j", help="Max concurrent generations in batch mode"),
+         fmt: str = typer.Option("text", "--format", help="Output format: text, ndjson or json")):
     """
     Generate a command from natural language and display parsed result.
     """
-    res = generator.generate_structured(instruction)
+    check_format(fmt)
+    if batch is not None:
+        import asyncio
+        show_batch = _show_batch if fmt == "text" else _show_batch_records
+        failed = asyncio.run(show_batch(_read_batch(batch), no_cache, concurrency, fmt))
+        if failed:
+            raise typer.Exit(code=1)
+        return
+    if instruction is None:
+        typer.secho("Missing instruction (or use --batch FILE).", fg=typer.colors.RED, err=fmt != "text")
+        raise typer.Exit(code=2)
+    if fmt != "text":
+        res = generator.generate_structured(instruction, use_cache=not no_cache)
+        with RecordWriter(fmt, many=False) as out:
+            out.write({**generation_record(res, instruction), "timings": current_timings()})
+        if not res.get("ok"):
+            raise typer.Exit(code=1)
+        return
+
+    shown: dict = {}
+
+    def on_command(cmd: str, verdict) -> None:
+        # printed as soon as the command is parsed, before the explanation finishes
+        shown["command"] = cmd
+        typer.echo(command_block(cmd))
+        early = early_risk_block(verdict.risk, verdict.matched_rules)
+        if early:
+            typer.echo(early)
+
+    res = generator.generate_structured(instruction, use_cache=not no_cache, on_command=on_command)
     if not res.get("ok"):
         typer.secho(f"Generation not accepted: {res.get('reason')}", fg=typer.colors.RED)
         # still show model_raw for debug
         typer.echo(res.get("model_raw", ""))
         raise typer.Exit(code=1)
 
-    typer.echo(command_block(res["command"]))
+    if shown.get("command") != res["command"]:
+        typer.echo(command_block(res["command"]))
     typer.echo(risk_block(res.get("risk", "low"), res.get("confidence", 0.0)))
     typer.echo(notes_block(res.get("raw", {}).get("explanation", "")))
+    if res.get("flags"):
+        typer.echo(flags_block(res["flags"]))
+
+def _read_batch(path: str) -> list[str]:
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    return [l.strip() for l in text.splitlines() if l.strip()]
+
+async def _show_batch_records(instructions: list[str], no_cache: bool, concurrency: Optional[int], fmt: str) -> int:
+    # one record per instruction, written as soon as its turn is ready
+    failed = 0
+    with RecordWriter(fmt) as out:
+        async for res in generator.agenerate_ordered(instructions, use_cache=not no_cache, concurrency=concurrency):
+            failed += not res.get("ok")
+            out.write(generation_record(res))
+    return failed
+
+async def _show_batch(instructions: list[str], no_cache: bool, concurrency: Optional[int], fmt: str = "text") -> int:
+    # results arrive in input order, each printed as soon as its turn is ready
+    failed = 0
+    async for res in generator.agenerate_ordered(instructions, use_cache=not no_cache, concurrency=concurrency):
+        typer.echo(header(res["instruction"]))
+        if not res.get("ok"):
+            failed += 1
+            typer.secho(f"Generation not accepted: {res.get('reason')}", fg=typer.colors.RED)
+            continue
+        typer.echo(command_block(res["command"]))
+        typer.echo(risk_block(res.get("risk", "low"), res.get("confidence", 0.0)))
+        typer.echo(notes_block(res.get("raw", {}).get("explanation", "")))
+    return failed
@@ -0,0 +1,221 @@
+"""
+daemon.py
+Resident flyn server behind `flyn serve`.
+
+Keeps config, the backend client, compiled safety rules and caches warm in one
+process and runs show/run/exp requests from `cli/client.py` over a Unix socket.
+Each request runs the normal Typer command in its own thread, with the config
+seen from the client's cwd and FLYN__ variables; stdout/stderr of that thread
+are relayed to the client as newline-delimited JSON frames:
+
+    {"stream": "out" | "err", "data": "..."}   ...   {"exit": <code>}
+"""
+
+from __future__ import annotations
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import traceback
+from pathlib import Path
+from typing import Optional
+import typer
+from flyn.cli.client import DAEMON_COMMANDS, _command_name, socket_path
+from flyn.config.loader import scoped_config
+
+_local = threading.local()
+
+class _Frames:
+    """
+    Per-request sink: writes framed output to the client connection.
+    """
+
+    def __init__(self, wfile, stream: str, tty: bool, lock: threading.Lock):
+        self._wfile = wfile
+        self._stream = stream
+        self._tty = tty
+        self._lock = lock
+        self.buffer = _BinaryFrames(self)
+        self.closed = False
+
+    def send(self, data: str) -> None:
+        if self.closed:
+            return
+        frame = json.dumps({"stream": self._stream, "data": data}) + "\n"
+        try:
+            with self._lock:
+                self._wfile.write(frame.encode("utf-8"))
+                self._wfile.flush()
+        except OSError:
+            # client went away; let the command finish without output
+            self.closed = True
+
+    def isatty(self) -> bool:
+        return self._tty
+
+class _BinaryFrames:
+    def __init__(self, frames: _Frames):
+        self._frames = frames
+
+    def write(self, data: bytes) -> int:
+        self._frames.send(bytes(data).decode("utf-8", errors="replace"))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+class _ThreadLocalStream:
+    """
+    Stands in for sys.stdout/sys.stderr: request threads write to their client,
+    every other thread to the real stream.
+    """
+
+    encoding = "utf-8"
+    errors = "replace"
+
+    def __init__(self, real, name: str):
+        self._real = real
+        self._name = name
+
+    def _sink(self) -> Optional[_Frames]:
+        return getattr(_local, self._name, None)
+
+    def write(self, data: str) -> int:
+        sink = self._sink()
+        if sink is None:
+            return self._real.write(data)
+        sink.send(data)
+        return len(data)
+
+    def flush(self) -> None:
+        if self._sink() is None:
+            self._real.flush()
+
+    def isatty(self) -> bool:
+        sink = self._sink()
+        return sink.isatty() if sink is not None else self._real.isatty()
+
+    @property
+    def buffer(self):
+        sink = self._sink()
+        return sink.buffer if sink is not None else getattr(self._real, "buffer", None)
+
+    def fileno(self) -> int:
+        if self._sink() is not None:
+            raise OSError("request output is not backed by a file descriptor")
+        return self._real.fileno()
+
+def _peer_uid(conn: socket.socket) -> Optional[int]:
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        uid = _peer_uid(self.connection)
+        if uid is not None and uid != os.getuid():
+            return  # only the owning user may drive the daemon
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+        except ValueError:
+            return
+        argv = request.get("argv") or []
+        if not argv:
+            return  # liveness probe
+        lock = threading.Lock()
+        _local.stdout = _Frames(self.wfile, "out", bool(request.get("tty")), lock)
+        _local.stderr = _Frames(self.wfile, "err", bool(request.get("err_tty")), lock)
+        try:
+            with scoped_config(request.get("cwd"), request.get("env") or {}):
+                code = self.server.dispatch(argv)
+        finally:
+            _local.stdout = _local.stderr = None
+        try:
+            with lock:
+                self.wfile.write((json.dumps({"exit": code}) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except OSError:
+            pass
+
+class FlynServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        self.socket_file = path
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+        self._command = None
+
+    def warm(self) -> None:
+        """
+        Import and build everything a request needs so the first call is fast too.
+        """
+        from flyn.cli.main import app
+        from flyn.core import generator, safety, validator
+        self._command = typer.main.get_command(app)
+        for name in DAEMON_COMMANDS:
+            self._command.get_command(None, name)
+        validator._gen_output_model()
+        safety.analyze("true")
+        generator._choose_backend()
+
+    def dispatch(self, argv: list[str]) -> int:
+        if _command_name(argv) not in DAEMON_COMMANDS:
+            sys.stderr.write(f"flyn daemon: unsupported command {argv[:1]}\n")
+            return 2
+        try:
+            rv = self._command.main(args=list(argv), prog_name="flyn", standalone_mode=False)
+            return rv if isinstance(rv, int) else 0
+        except typer.Exit as e:
+            return e.exit_code
+        except typer.Abort:
+            sys.stderr.write("Aborted!\n")
+            return 1
+        except Exception as e:
+            # click usage errors render themselves like in standalone mode
+            show = getattr(e, "show", None)
+            if callable(show):
+                show()
+                return getattr(e, "exit_code", 2)
+            traceback.print_exc()
+            return 1
+
+def serve(path: Optional[str] = None) -> None:
+    """
+    Bind the socket and serve until interrupted. A stale socket file left by a
+    dead daemon is replaced; a live one is an error.
+    """
+    path = path or socket_path()
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            probe.close()
+            raise RuntimeError(f"a flyn daemon is already listening on {path}")
+        except OSError:
+            os.unlink(path)
+    old_umask = os.umask(0o077)
+    try:
+        server = FlynServer(path)
+    finally:
+        os.umask(old_umask)
+    sys.stdout = _ThreadLocalStream(sys.stdout, "stdout")
+    sys.stderr = _ThreadLocalStream(sys.stderr, "stderr")
+    try:
+        server.warm()
+        sys.stderr.write(f"flyn daemon listening on {path}\n")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
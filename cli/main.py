@@ -1,23 +1,90 @@
 """
 main.py - entrypoint wiring Typer app and subcommands
+
+Subcommand modules are imported only when their command is invoked, so cheap
+commands (`--help`, `config get`) never pay for pydantic, the backends or asyncio.
 """
 
 from __future__ import annotations
+import importlib
+from typing import Optional
 import typer
-from .commands import show as show_cmd
-from .commands import run as run_cmd
-from .commands import exp as exp_cmd
-from .commands import config_cmd as config_cmd_mod
+from typer.core import TyperGroup, TyperCommand
+
+# name -> (module path, short help shown in `flyn --help`)
+_LAZY_COMMANDS: dict[str, tuple[str, str]] = {
+    "show": ("flyn.cli.commands.show", "Generate a command and show it (no execution)."),
+    "run": ("flyn.cli.commands.run", "Generate, validate and execute a command."),
+    "exp": ("flyn.cli.commands.exp", "Explain a shell command."),
+    "config": ("flyn.cli.commands.config_cmd", "Get, set or reset configuration."),
+    "cache": ("flyn.cli.commands.cache_cmd", "Inspect or clear the response cache."),
+    "backend": ("flyn.cli.commands.backend_cmd", "Show per-backend win rates and latency."),
+    "history": ("flyn.cli.commands.history_cmd", "Show recent instructions and commands."),
+    "repl": ("flyn.cli.commands.repl", "Interactive prompt with a warm pipeline."),
+    "serve": ("flyn.cli.commands.serve", "Run the resident daemon for fast show/run/exp."),
+}
+
+_COMPLETION_PARAMS = ("install_completion", "show_completion")
+
+class LazyGroup(TyperGroup):
+    """
+    Typer group that resolves subcommands from `_LAZY_COMMANDS` on first use.
+    Help listings use placeholder commands so no subcommand module is imported.
+    """
+
+    _listing = False
 
-app = typer.Typer(help="flyn — natural language to shell command generator & runner")
+    def list_commands(self, ctx) -> list[str]:
+        return list(_LAZY_COMMANDS)
 
-# mount commands
-app.add_typer(show_cmd.app, name="show")
-app.add_typer(run_cmd.app, name="run")
-app.add_typer(exp_cmd.app, name="exp")
-app.add_typer(config_cmd_mod.app, name="config")
+    def get_command(self, ctx, name: str):
+        if name not in _LAZY_COMMANDS:
+            return None
+        module_path, short_help = _LAZY_COMMANDS[name]
+        if self._listing:
+            return TyperCommand(name, help=short_help)
+        cmd = self.commands.get(name)
+        if cmd is None:
+            module = importlib.import_module(module_path)
+            cmd = typer.main.get_command(module.app)
+            cmd.name = name
+            # completion options belong to the top-level app only
+            cmd.params = [p for p in cmd.params if p.name not in _COMPLETION_PARAMS]
+            self.commands[name] = cmd
+        return cmd
+
+    def format_help(self, ctx, formatter) -> None:
+        self._listing = True
+        try:
+            return super().format_help(ctx, formatter)
+        finally:
+            self._listing = False
+
+# plain click help formatting: rendering help through rich costs more than the rest of startup
+app = typer.Typer(cls=LazyGroup, rich_markup_mode=None, help="flyn — natural language to shell command generator & runner")
 
 @app.callback(invoke_without_command=True)
-def main(ctx: typer.Context):
+def main(ctx: typer.Context,
+         profile: bool = typer.Option(False, "--profile", help="Print a per-stage timing breakdown to stderr"),
+         trace: Optional[str] = typer.Option(None, "--trace", help="Export stage spans (*.json = Chrome trace format, else JSON lines)")):
     if ctx.invoked_subcommand is None:
-        typer.echo(app.help)
+        typer.echo(ctx.get_help())
+        return
+    from flyn.core import tracing
+    active = tracing.start_trace(ctx.invoked_subcommand)
+
+    def finish() -> None:
+        tracing.end_trace(active)
+        if profile:
+            typer.echo(active.report(), err=True)
+        path = trace
+        if path is None:
+            from flyn.config.loader import get_config
+            path = get_config().get("tracing.export_path") or None
+        if path:
+            try:
+                active.export(path)
+            except OSError as e:
+                typer.secho(f"Could not write trace to {path}: {e}", fg=typer.colors.YELLOW, err=True)
+
+    ctx.call_on_close(finish)
@@ -24,3 +24,84 @@ def output_block(stdout: str, stderr: str) -> str:
 
 def notes_block(notes: str) -> str:
     return f"{color_text('Notes:', Colors.BOLD)}\n{notes}\n"
+
+def flags_block(flags: list) -> str:
+    # per-flag notes from the local man page index; empty when nothing is documented
+    if not flags:
+        return ""
+    lines = "\n".join(f"  {flag:<14} {text}" for flag, text in flags)
+    return f"{color_text('Flags:', Colors.BOLD)}\n{lines}\n"
+
+def history_line(entry: dict) -> str:
+    result = entry.get("result") or {}
+    if not entry.get("executed"):
+        status = color_text("dry", Colors.BLUE)
+    elif result.get("ok"):
+        status = color_text(f"rc={result.get('rc')}", Colors.GREEN)
+    else:
+        status = color_text(f"rc={result.get('rc')}", Colors.RED)
+    ts = str(entry.get("ts", ""))[:19].replace("T", " ")
+    return f"{ts}  {status}  {entry.get('instruction', '')}\n    {entry.get('command', '')}"
+
+def early_risk_block(risk: str, rules: list[str] | tuple[str, ...]) -> str:
+    # shown while the explanation is still streaming; confidence is not known yet
+    if risk == "low":
+        return ""
+    color = Colors.YELLOW if risk == "medium" else Colors.RED
+    matched = f" ({', '.join(rules)})" if rules else ""
+    return f"{color_text('Safety check:', color)} {risk.upper()}{matched}\n"
+
+def usage_block(result: dict) -> str:
+    # per-command accounting from the batch scheduler
+    rc = result.get("rc")
+    status = color_text(f"rc={rc}", Colors.GREEN if result.get("ok") else Colors.RED)
+    if result.get("limit"):
+        status += " " + color_text(f"[{result['limit']} limit]", Colors.RED)
+    parts = [status, f"wall {result.get('wall_seconds', 0):.2f}s"]
+    if result.get("cpu_user_seconds") is not None:
+        parts.append(f"cpu {result['cpu_user_seconds'] + result['cpu_system_seconds']:.2f}s")
+    if result.get("max_rss_kb"):
+        bound = "<= " if result.get("max_rss_upper_bound") else ""
+        parts.append(f"max rss {bound}{result['max_rss_kb'] / 1024:.1f} MiB")
+    return "  ".join(parts) + "\n"
+
+def finding_line(path: str, line: int, cmd: str, risk: str, rules: list) -> str:
+    # one `exp --audit` finding, grep-style location first
+    color = Colors.YELLOW if risk == "medium" else Colors.RED
+    matched = f"  ({', '.join(rules)})" if rules else ""
+    return f"{path}:{line}: {color_text(risk.upper(), color)} {cmd}{matched}"
+
+def audit_summary_block(summary: dict, seconds: float) -> str:
+    counts = summary["counts"]
+    rate = summary["lines"] / seconds if seconds > 0 else 0.0
+    lines = [f"{summary['files']} files, {summary['lines']} lines, {summary['commands']} commands "
+             f"in {seconds:.2f}s ({rate:,.0f} lines/s)",
+             f"  {color_text('high', Colors.RED)} {counts['high']}  "
+             f"{color_text('medium', Colors.YELLOW)} {counts['medium']}  low {counts['low']}"]
+    for rule, n in sorted(summary["rules"].items(), key=lambda kv: -kv[1]):
+        lines.append(f"  {n:>6}  {rule}")
+    if summary["errors"]:
+        lines.append(color_text(f"  {summary['errors']} files could not be read", Colors.YELLOW))
+    return f"{color_text('Audit:', Colors.BOLD)}\n" + "\n".join(lines) + "\n"
+
+def preview_block(preview: dict) -> str:
+    # filesystem effects of a dry run, measured on a snapshot of the workdir
+    if preview.get("skipped"):
+        return f"{color_text('Preview:', Colors.BOLD)} skipped, {preview['skipped']}\n"
+    lines = []
+    for path, size in preview["created"]:
+        lines.append(f"  {color_text('+', Colors.GREEN)} {path}  ({size} bytes)")
+    for path, size in preview["deleted"]:
+        lines.append(f"  {color_text('-', Colors.RED)} {path}  ({size} bytes)")
+    for path, old, new in preview["modified"]:
+        lines.append(f"  {color_text('~', Colors.YELLOW)} {path}  ({old} -> {new} bytes)")
+    if preview.get("truncated"):
+        lines.append(f"  ... {preview['changes'] - len(lines)} more")
+    if not lines:
+        lines.append("  no files would change")
+    if not preview.get("ok") and preview.get("stderr"):
+        lines.append(color_text("  " + preview["stderr"].strip().replace("\n", "\n  "), Colors.RED))
+    status = "timed out" if preview.get("timed_out") else f"rc={preview.get('rc')}"
+    head = (f"{color_text('Preview:', Colors.BOLD)} {status}, {preview['files']} entries snapshotted by "
+            f"{preview['method']} in {preview['snapshot_ms']:.1f} ms, ran in {preview['run_ms']:.1f} ms")
+    return head + "\n" + "\n".join(lines) + "\n"
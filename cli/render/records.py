@@ -0,0 +1,97 @@
+"""
+records.py
+Machine-readable output for `--format ndjson|json`.
+
+Records are built from the dicts the pipeline already returns (generate_structured,
+run_command, the scheduler) and written one per instruction, uncolored, as soon as
+each is ready: one JSON object per line for ndjson, or the same objects inside a
+JSON array for json (opened on the first record, closed by `close()`; a single
+instruction prints just the object).
+"""
+
+from __future__ import annotations
+import json
+from typing import Any, Dict, Optional
+import typer
+from flyn.core import tracing
+
+FORMATS = ("text", "ndjson", "json")
+
+def check_format(fmt: str) -> str:
+    if fmt not in FORMATS:
+        typer.secho(f"Unknown format {fmt!r} (choose from {', '.join(FORMATS)}).", fg=typer.colors.RED, err=True)
+        raise typer.Exit(code=2)
+    return fmt
+
+def generation_record(res: Dict[str, Any], instruction: Optional[str] = None) -> Dict[str, Any]:
+    raw = res.get("raw") or {}
+    record = {
+        "instruction": instruction if instruction is not None else res.get("instruction"),
+        "ok": bool(res.get("ok")),
+        "reason": res.get("reason"),
+        "command": res.get("command"),
+        "risk": res.get("risk"),
+        "confidence": res.get("confidence"),
+        "safety_rules": res.get("safety_rules", []),
+        "need_confirmation": bool(res.get("need_confirmation")),
+        "missing_executables": res.get("missing_executables", []),
+        "explanation": raw.get("explanation"),
+        "flags": [{"flag": f, "description": d} for f, d in res.get("flags", [])],
+        "cached": res.get("cached"),
+    }
+    if res.get("backend"):
+        record["backend"] = res["backend"]
+    return record
+
+def execution_fields(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The execution part of a record; stdout/stderr are already bounded to head + tail
+    by the executor and scheduler (see `truncated`).
+    """
+    fields = {
+        "executed": not result.get("dry_run", False),
+        "rc": result.get("rc"),
+        "exec_ok": result.get("ok"),
+        "stdout": result.get("stdout", ""),
+        "stderr": result.get("stderr", ""),
+        "stdout_bytes": result.get("stdout_bytes"),
+        "stderr_bytes": result.get("stderr_bytes"),
+        "truncated": bool(result.get("truncated")),
+    }
+    for key in ("preview", "spill", "limit", "wall_seconds", "cpu_user_seconds", "cpu_system_seconds", "max_rss_kb",
+                "max_rss_upper_bound"):
+        if result.get(key) is not None:
+            fields[key] = result[key]
+    return fields
+
+def current_timings() -> Dict[str, float]:
+    trace = tracing.current()
+    return trace.stage_totals() if trace is not None else {}
+
+class RecordWriter:
+    """
+    many=False (a single instruction): json prints the bare object instead of an array.
+    """
+
+    def __init__(self, fmt: str, many: bool = True):
+        self.fmt = fmt
+        self.many = many
+        self._opened = False
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        if self.fmt == "json" and self.many:
+            typer.echo(("," if self._opened else "[") + "\n" + line, nl=False)
+            self._opened = True
+        else:
+            typer.echo(line)
+
+    def close(self) -> None:
+        if self.fmt == "json" and self.many:
+            typer.echo("\n]" if self._opened else "[]")
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
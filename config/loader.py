@@ -1,38 +1,196 @@
 """
 config/loader.py
-Simple config loader with defaults.toml + user overrides.
+Layered config: defaults.toml < user config < project .flyn.toml < FLYN__SECTION__KEY env vars.
 Provides: get(key), set(key,value), reset(), save()
+
+The parsed layers are compiled into a flat dotted-key map and cached on disk
+(marshal) together with the mtime/size of every source file, so a process
+start only stats the sources and skips TOML parsing when nothing changed.
+Long-running processes (the daemon) re-check the sources at most once per
+`RELOAD_INTERVAL` seconds and reload when one changed. The daemon answers each
+request with the config seen from the client's cwd and FLYN__ variables
+(`scoped_config`).
 """
 
 from __future__ import annotations
-import toml
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
+import hashlib
+import marshal
 import os
 import json
-from typing import Any
+import time
+from typing import Any, Dict, Iterator, Optional
 from copy import deepcopy
 
 DEFAULTS_PATH = Path(__file__).parent / "defaults.toml"
 USER_CONFIG_PATH = Path(os.getenv("XDG_CONFIG_HOME", Path.home() / ".config")) / "flyn" / "config.toml"
+SNAPSHOT_DIR = Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "flyn"
+PROJECT_FILENAME = ".flyn.toml"
+ENV_PREFIX = "FLYN__"  # FLYN__BACKEND__PROVIDER=replay -> backend.provider
+RELOAD_INTERVAL = 1.0
+
+_SNAPSHOT_VERSION = 1
+
+def find_project_config(start: Optional[Path] = None) -> Optional[Path]:
+    """
+    Nearest .flyn.toml in the working directory or one of its parents.
+    """
+    try:
+        cur = Path(start or os.getcwd()).resolve()
+    except OSError:
+        return None
+    for d in (cur, *cur.parents):
+        p = d / PROJECT_FILENAME
+        if p.is_file():
+            return p
+    return None
+
+def env_overrides(environ: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Dotted-key overrides from FLYN__SECTION__KEY variables; values are JSON when they parse.
+    """
+    out: Dict[str, Any] = {}
+    for name, raw in (os.environ if environ is None else environ).items():
+        if not name.startswith(ENV_PREFIX) or len(name) == len(ENV_PREFIX):
+            continue
+        key = ".".join(part.lower() for part in name[len(ENV_PREFIX):].split("__"))
+        try:
+            out[key] = json.loads(raw)
+        except ValueError:
+            out[key] = raw
+    return out
+
+def _stamp(path: Optional[Path]) -> Optional[tuple]:
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (str(path), None, None)
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+def _flatten(tree: dict, prefix: str = "", out: Optional[dict] = None) -> dict:
+    # sections are indexed too, so get("backend") still returns the whole table
+    out = {} if out is None else out
+    for k, v in tree.items():
+        key = f"{prefix}{k}"
+        out[key] = v
+        if isinstance(v, dict):
+            _flatten(v, key + ".", out)
+    return out
+
+def _set_path(tree: dict, dotted_key: str, value: Any) -> None:
+    parts = dotted_key.split(".")
+    cur = tree
+    for p in parts[:-1]:
+        if p not in cur or not isinstance(cur[p], dict):
+            cur[p] = {}
+        cur = cur[p]
+    cur[parts[-1]] = value
 
 class Config:
-    def __init__(self, defaults_path: Path = DEFAULTS_PATH, user_path: Path = USER_CONFIG_PATH):
-        self.defaults_path = defaults_path
+    def __init__(self, defaults_path: Path = DEFAULTS_PATH, user_path: Path = USER_CONFIG_PATH,
+                 project_path: Optional[Path] = None, snapshot_dir: Optional[Path] = SNAPSHOT_DIR,
+                 use_env: bool = True, cwd: Optional[Path] = None, environ: Optional[Dict[str, str]] = None):
+        self.defaults_path = Path(defaults_path)
         self.user_path = Path(user_path)
-        self._defaults = self._load_toml(defaults_path)
-        self._user = self._load_user()
-        self._merged = self._merge(deepcopy(self._defaults), deepcopy(self._user))
+        self.project_path = Path(project_path) if project_path else find_project_config(cwd)
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self.use_env = use_env
+        self.environ = environ  # None: this process's environment
+        self._pending: Dict[str, Any] = {}  # set() calls not yet saved
+        self._cleared = False               # reset() not yet saved
+        self._load()
 
-    def _load_toml(self, path: Path) -> dict:
+    # -- loading ---------------------------------------------------------
+
+    def _sources(self) -> tuple:
+        return (_stamp(self.defaults_path), _stamp(self.user_path), _stamp(self.project_path))
+
+    def _snapshot_path(self) -> Optional[Path]:
+        if self.snapshot_dir is None:
+            return None
+        tag = hashlib.sha1("\0".join(map(str, (self.defaults_path, self.user_path, self.project_path)))
+                           .encode("utf-8")).hexdigest()[:12]
+        return self.snapshot_dir / f"config-{tag}.snapshot"
+
+    def _load(self) -> None:
+        sources = self._sources()
+        layers = self._read_snapshot(sources)
+        if layers is None:
+            layers = {
+                "defaults": self._load_toml(self.defaults_path),
+                "user": self._load_toml(self.user_path),
+                "project": self._load_toml(self.project_path) if self.project_path else {},
+            }
+            merged = self._merge(self._merge(deepcopy(layers["defaults"]), deepcopy(layers["user"])),
+                                 deepcopy(layers["project"]))
+            layers["merged"] = merged
+            layers["flat"] = _flatten(merged)
+            self._write_snapshot(sources, layers)
+        self._sources_seen = sources
+        self._checked = time.monotonic()
+        self._defaults = layers["defaults"]
+        self._user = {} if self._cleared else layers["user"]
+        self._project = layers["project"]
+        self._merged = layers["merged"]
+        self._flat = layers["flat"]
+        overrides = env_overrides(self.environ) if self.use_env else {}
+        if self._cleared or self._pending:
+            self._rebuild(overrides)
+        elif overrides:
+            self._merged = deepcopy(self._merged)
+            for key, value in overrides.items():
+                _set_path(self._merged, key, value)
+            self._flat = _flatten(self._merged)
+
+    def _rebuild(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        for key, value in self._pending.items():
+            _set_path(self._user, key, value)
+        merged = self._merge(self._merge(deepcopy(self._defaults), deepcopy(self._user)), deepcopy(self._project))
+        if overrides is None:
+            overrides = env_overrides(self.environ) if self.use_env else {}
+        for key, value in overrides.items():
+            _set_path(merged, key, value)
+        self._merged = merged
+        self._flat = _flatten(merged)
+
+    def _read_snapshot(self, sources: tuple) -> Optional[dict]:
+        path = self._snapshot_path()
+        if path is None:
+            return None
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                return toml.load(f)
-        except FileNotFoundError:
-            return {}
+            with open(path, "rb") as f:
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != _SNAPSHOT_VERSION or data.get("sources") != sources:
+            return None
+        return data["layers"]
+
+    def _write_snapshot(self, sources: tuple, layers: dict) -> None:
+        path = self._snapshot_path()
+        if path is None:
+            return
+        try:
+            blob = marshal.dumps({"version": _SNAPSHOT_VERSION, "sources": sources, "layers": layers})
+        except ValueError:
+            return  # e.g. TOML datetimes; just parse the files next time
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except OSError:
+            pass
 
-    def _load_user(self) -> dict:
+    def _load_toml(self, path: Path) -> dict:
+        import toml  # only needed when the snapshot is stale
         try:
-            with open(self.user_path, "r", encoding="utf-8") as f:
+            with open(path, "r", encoding="utf-8") as f:
                 return toml.load(f)
         except FileNotFoundError:
             return {}
@@ -46,42 +204,88 @@ class Config:
                 base[k] = v
         return base
 
+    def reload_if_changed(self) -> bool:
+        """
+        Reload when a source file changed since the last load. Returns True if reloaded.
+        """
+        self._checked = time.monotonic()
+        if self._sources() == self._sources_seen:
+            return False
+        self._load()
+        return True
+
+    # -- access ----------------------------------------------------------
+
     def get(self, dotted_key: str, default: Any = None) -> Any:
-        parts = dotted_key.split(".")
-        cur = self._merged
-        for p in parts:
-            if isinstance(cur, dict) and p in cur:
-                cur = cur[p]
-            else:
-                return default
-        return cur
+        if time.monotonic() - self._checked > RELOAD_INTERVAL:
+            self.reload_if_changed()
+        return self._flat.get(dotted_key, default)
 
     def set(self, dotted_key: str, value: Any) -> None:
-        parts = dotted_key.split(".")
-        cur = self._merged
-        for p in parts[:-1]:
-            if p not in cur or not isinstance(cur[p], dict):
-                cur[p] = {}
-            cur = cur[p]
-        cur[parts[-1]] = value
+        """
+        Set a user override (kept in memory until save()).
+        """
+        self._pending[dotted_key] = value
+        self._rebuild()
 
     def reset(self) -> None:
         self._user = {}
-        self._merged = deepcopy(self._defaults)
+        self._pending = {}
+        self._cleared = True
+        self._rebuild()
 
     def save(self) -> None:
-        # ensure directory
+        """
+        Write the user layer only: values set or previously saved, never defaults.
+        """
+        import toml
+        self._rebuild()
         self.user_path.parent.mkdir(parents=True, exist_ok=True)
-        # save only user overrides by computing diff (naive)
-        # Simpler: overwrite whole config with merged (acceptable)
         with open(self.user_path, "w", encoding="utf-8") as f:
-            toml.dump(self._merged, f)
+            toml.dump(self._user, f)
+        self._pending = {}
+        self._cleared = False
+        self._sources_seen = self._sources()
 
 # singleton instance convenience
 _config_singleton: Config | None = None
 
+# per-request configs of the daemon, keyed on (project config, FLYN__ variables)
+_scoped: ContextVar[Optional[Config]] = ContextVar("flyn_config", default=None)
+_scoped_cache: Dict[tuple, Config] = {}
+_SCOPED_CACHE_MAX = 16
+
 def get_config() -> Config:
     global _config_singleton
+    scoped = _scoped.get()
+    if scoped is not None:
+        return scoped
     if _config_singleton is None:
         _config_singleton = Config()
     return _config_singleton
+
+def _config_for(cwd: Optional[str], environ: Dict[str, str]) -> Config:
+    base = get_config()
+    project = find_project_config(Path(cwd)) if cwd else base.project_path
+    env = {k: v for k, v in environ.items() if k.startswith(ENV_PREFIX)}
+    if project == base.project_path and env_overrides(env) == env_overrides(base.environ):
+        return base
+    key = (str(project), tuple(sorted(env.items())))
+    cfg = _scoped_cache.get(key)
+    if cfg is None:
+        if len(_scoped_cache) >= _SCOPED_CACHE_MAX:
+            _scoped_cache.pop(next(iter(_scoped_cache)))
+        cfg = _scoped_cache[key] = Config(project_path=project, cwd=Path(cwd) if cwd else None, environ=env)
+    return cfg
+
+@contextmanager
+def scoped_config(cwd: Optional[str], environ: Dict[str, str]) -> Iterator[Config]:
+    """
+    Within the block (and the current context only), get_config() returns the
+    config as a process started in cwd with environ's FLYN__ variables would see it.
+    """
+    token = _scoped.set(_config_for(cwd, environ))
+    try:
+        yield _scoped.get()
+    finally:
+        _scoped.reset(token)
@@ -0,0 +1,407 @@
+"""
+audit.py
+Bulk risk audit of shell scripts, CI YAML and Dockerfiles (`flyn exp --audit`).
+
+Files are split into logical commands: line continuations are joined, quoted
+strings and $(...) may span lines, && || ; & and newlines separate commands,
+comments are dropped and heredoc bodies are skipped (or split like a script
+when they feed a shell such as `bash <<EOF` or `ssh host <<EOF`). Control
+words (if/then/do/...) are stripped, so `if rm -rf x; then` reports `rm -rf x`.
+For YAML the shell lives in run/script/command values; for Dockerfiles, in
+RUN instructions.
+
+Each command goes through the same compiled safety rules as generated ones.
+Files are spread over a process pool in chunks; small trees are scanned inline.
+"""
+
+from __future__ import annotations
+import bisect
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from flyn.core import safety
+from flyn.core.parser import split_pipeline, stage_command
+
+RISKS = ("low", "medium", "high")
+
+SHELL_SUFFIXES = frozenset((".sh", ".bash", ".zsh", ".ksh", ".dash", ".bats"))
+YAML_SUFFIXES = frozenset((".yml", ".yaml"))
+SKIP_DIRS = frozenset((".git", ".hg", ".svn", "node_modules", ".venv", "venv", "__pycache__", ".tox", ".mypy_cache"))
+
+# heredoc bodies run by these are audited as scripts
+_SHELLS = frozenset(("sh", "bash", "zsh", "ksh", "dash", "ash", "ssh"))
+
+# one regex drives the splitter; order matters (escapes and quotes before separators)
+_TOKENS = re.compile(r"""
+    \\[\s\S]                                   # escaped character (incl. line continuation)
+  | '[^']*'?                                   # single-quoted string
+  | "(?:\\[\s\S]|[^"\\])*"?                    # double-quoted string
+  | `(?:\\[\s\S]|[^`\\])*`?                    # backquoted command substitution
+  | \$\(\(? | \)                               # $( / $(( and closing parens
+  | (?<![^\s;&|(])\#[^\n]*                     # comment (only at the start of a word)
+  | <<-?[ \t]*(?P<q>['"]?)(?P<tag>[A-Za-z_][\w.-]*)(?P=q)   # heredoc
+  | <<< | [<>]&[\d-]? | &>>? | \|&             # here-string, fd redirections, |& (not separators)
+  | &&|\|\||;;|[;&\n]                          # command separators
+""", re.VERBOSE)
+
+_CONTINUATION = re.compile(r"\\\n[ \t]*")
+# control words, subshell/group openers, function headers and case patterns before a command
+_LEADING = re.compile(r"^(?:(?:if|then|else|elif|do|while|until|time|!)\s+|[({]|function\s+[\w-]+(?:\s*\(\))?\s*"
+                      r"|[\w-]+\s*\(\)\s*|\(?[^\s()]+\)(?=\s))\s*")
+# loop and case headers are not commands themselves
+_HEADERS = re.compile(r"^(?:for|case|select)\s")
+_HEREDOC_OP = re.compile(r"<<-?[ \t]*(['\"]?)[A-Za-z_][\w.-]*\1")
+_CLOSERS = frozenset(("fi", "done", "esac", "}", ")", "then", "do", "else", "{", "(", "in"))
+_SHEBANG = re.compile(rb"^#![^\n]*\b(?:ba|z|k|da|a)?sh\b")
+
+# (line, text) of one logical command; lines are 1-based
+Command = Tuple[int, str]
+
+def _clean(cmd: str) -> str:
+    if "\\\n" in cmd:
+        cmd = _CONTINUATION.sub(" ", cmd)
+    cmd = " ".join(cmd.split())
+    m = _LEADING.match(cmd)
+    while m is not None:
+        cmd = cmd[m.end():]
+        m = _LEADING.match(cmd)
+    # the ")" closing a subshell that started in an earlier command
+    while cmd.endswith(")") and cmd.count(")") > cmd.count("("):
+        cmd = cmd[:-1].rstrip()
+    return "" if cmd in _CLOSERS or _HEADERS.match(cmd) else cmd
+
+def _feeds_shell(cmd: str) -> bool:
+    for tokens in split_pipeline(_HEREDOC_OP.sub(" ", cmd)):
+        at = stage_command(tokens)
+        if at is not None and os.path.basename(tokens[at]) in _SHELLS:
+            return True
+    return False
+
+def split_script(text: str, first_line: int = 1) -> List[Command]:
+    """
+    Logical commands of a shell script, with the line each one starts on.
+    """
+    newlines = [m.start() for m in re.finditer("\n", text)]
+    out: List[Command] = []
+
+    def line_of(offset: int) -> int:
+        return first_line + bisect.bisect_left(newlines, offset)
+
+    def emit(parts: List[str], start: int) -> None:
+        cmd = _clean("".join(parts))
+        if cmd:
+            out.append((line_of(start), cmd))
+
+    parts: List[str] = []
+    start = seg = 0
+    depth = 0  # open $( ... ) groups: separators inside belong to the substitution
+    heredocs: List[Tuple[str, bool]] = []
+    pos, n = 0, len(text)
+    while pos < n:
+        m = _TOKENS.search(text, pos)
+        if m is None:
+            break
+        tok = m.group()
+        pos = m.end()
+        if tok.startswith("$("):
+            depth += 1
+        elif tok == ")":
+            depth = max(0, depth - 1)
+        elif tok[0] == "#":
+            parts.append(text[seg:m.start()])
+            seg = pos
+        elif m.group("tag"):
+            heredocs.append((m.group("tag"), tok.startswith("<<-")))
+        elif tok in ("&&", "||", ";;", ";", "&", "\n") and (depth == 0 or tok == "\n" and heredocs):
+            parts.append(text[seg:m.start()])
+            cmd_text = "".join(parts)
+            emit(parts, start)
+            parts = []
+            if tok == "\n" and heredocs:
+                feeds = _feeds_shell(cmd_text)
+                for tag, strip_tabs in heredocs:
+                    body_start = pos
+                    end = _heredoc_end(text, pos, tag, strip_tabs)
+                    if feeds:
+                        out.extend(split_script(text[body_start:end[0]], line_of(body_start)))
+                    pos = end[1]
+                heredocs = []
+            seg = start = pos
+            while start < n and text[start] in " \t":
+                start += 1
+    parts.append(text[seg:])
+    emit(parts, start)
+    return out
+
+def _heredoc_end(text: str, pos: int, tag: str, strip_tabs: bool) -> Tuple[int, int]:
+    """
+    (end of body, offset after the delimiter line) for a heredoc starting at pos.
+    """
+    while pos < len(text):
+        nl = text.find("\n", pos)
+        line_end = len(text) if nl < 0 else nl
+        line = text[pos:line_end]
+        if (line.lstrip("\t") if strip_tabs else line) == tag:
+            return pos, min(len(text), line_end + 1)
+        pos = line_end + 1
+    return len(text), len(text)
+
+# -- YAML (CI definitions) ---------------------------------------------------
+
+_YAML_KEY = re.compile(r"^(?P<indent>[ \t]*)(?:-[ \t]+)?(?P<key>run|script|before_script|after_script|command|commands)"
+                       r"[ \t]*:(?:[ \t]+(?P<value>.*?))?[ \t]*$")
+_YAML_ITEM = re.compile(r"^(?P<indent>[ \t]*)-[ \t]+(?P<value>.*?)[ \t]*$")
+_YAML_COMMENT = re.compile(r"[ \t]+#.*$")
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip(" \t"))
+
+def _unquote(value: str) -> str:
+    value = _YAML_COMMENT.sub("", value) if value[:1] not in "'\"" else value
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value[1:-1]
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    return value
+
+def _block(lines: List[str], i: int, parent: int, folded: bool) -> Tuple[str, int]:
+    """
+    Body of a block scalar whose header is on line i: (text, index after it).
+    """
+    body: List[str] = []
+    j = i + 1
+    while j < len(lines) and (not lines[j].strip() or _indent(lines[j]) > parent):
+        body.append(lines[j])
+        j += 1
+    while body and not body[-1].strip():
+        body.pop()
+        j -= 1
+    cut = min((_indent(l) for l in body if l.strip()), default=0)
+    body = [l[cut:] for l in body]
+    return (" ".join(l.strip() for l in body) if folded else "\n".join(body)), j
+
+def split_yaml(text: str) -> List[Command]:
+    """
+    Logical commands from the shell values of CI YAML (GitHub Actions `run`,
+    GitLab `script`/`before_script`/`after_script`, `command(s)` elsewhere):
+    inline scalars, block scalars and lists of either.
+    """
+    lines = text.splitlines()
+    out: List[Command] = []
+
+    def scalar(value: str, i: int, parent: int) -> int:
+        if value[:1] in "|>":
+            body, j = _block(lines, i, parent, value[0] == ">")
+            out.extend(split_script(body, i + 2))
+            return j
+        if value and value[0] != "[":
+            out.extend(split_script(_unquote(value), i + 1))
+        elif value:
+            # flow sequence: ["a", "b"]
+            try:
+                items = json.loads(value)
+            except ValueError:
+                items = [value.strip("[]")]
+            out.extend(c for item in items if isinstance(item, str) for c in split_script(item, i + 1))
+        return i + 1
+
+    i = 0
+    while i < len(lines):
+        m = _YAML_KEY.match(lines[i])
+        if m is None:
+            i += 1
+            continue
+        key_col = _indent(lines[i])
+        value = m.group("value") or ""
+        if value and not value.startswith("#"):
+            i = scalar(value, i, key_col)
+            continue
+        i += 1
+        while i < len(lines):
+            item = _YAML_ITEM.match(lines[i])
+            if item is None:
+                if lines[i].strip() and not lines[i].lstrip().startswith("#"):
+                    break
+                i += 1
+                continue
+            if _indent(lines[i]) < key_col:
+                break
+            i = scalar(item.group("value"), i, _indent(lines[i]))
+    return out
+
+# -- Dockerfiles -------------------------------------------------------------
+
+_RUN = re.compile(r"^[ \t]*RUN[ \t]+", re.IGNORECASE)
+
+def split_dockerfile(text: str) -> List[Command]:
+    lines = text.split("\n")
+    out: List[Command] = []
+    i = 0
+    while i < len(lines):
+        m = _RUN.match(lines[i])
+        if m is None:
+            i += 1
+            continue
+        first = i
+        body = [lines[i][m.end():]]
+        while body[-1].rstrip().endswith("\\") and i + 1 < len(lines):
+            i += 1
+            body.append(lines[i])
+        script = "\n".join(body)
+        if script.lstrip().startswith("["):
+            # exec form: RUN ["executable", "arg", ...]
+            try:
+                script = " ".join(json.loads(script))
+            except (ValueError, TypeError):
+                pass
+        out.extend(split_script(script, first + 1))
+        i += 1
+    return out
+
+# -- files -------------------------------------------------------------------
+
+def file_kind(path: Path, explicit: bool = False) -> Optional[str]:
+    """
+    "shell", "yaml", "docker" or None (not audited). Files named explicitly on
+    the command line default to shell.
+    """
+    suffix = path.suffix.lower()
+    name = path.name.lower()
+    if suffix in SHELL_SUFFIXES:
+        return "shell"
+    if suffix in YAML_SUFFIXES:
+        return "yaml"
+    if name == "dockerfile" or name.startswith("dockerfile.") or suffix == ".dockerfile" or name == "containerfile":
+        return "docker"
+    if suffix and not explicit:
+        return None
+    try:
+        with open(path, "rb") as f:
+            head = f.read(128)
+    except OSError:
+        return None
+    return "shell" if _SHEBANG.match(head) or explicit else None
+
+def iter_files(paths: Iterable[str]) -> Iterator[Tuple[str, str, int]]:
+    """
+    (path, kind, size) of every auditable file under paths, in sorted walk order.
+    """
+    for raw in paths:
+        root = Path(raw)
+        if root.is_file():
+            kind = file_kind(root, explicit=True)
+            if kind:
+                yield str(root), kind, root.stat().st_size
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+            for name in sorted(filenames):
+                p = Path(dirpath, name)
+                kind = file_kind(p)
+                if kind is None:
+                    continue
+                try:
+                    yield str(p), kind, p.stat().st_size
+                except OSError:
+                    continue
+
+_SPLITTERS: Dict[str, Callable[[str], List[Command]]] = {
+    "shell": split_script,
+    "yaml": split_yaml,
+    "docker": split_dockerfile,
+}
+
+_scan: Optional[Callable[[str], Tuple[str, Tuple[str, ...]]]] = None
+
+def _init_worker(blacklist: Tuple[str, ...]) -> None:
+    global _scan
+    _scan = safety.rule_scanner(blacklist)
+
+def audit_file(path: str, kind: str, max_bytes: int = 0) -> Dict[str, Any]:
+    """
+    {path, kind, lines, commands, counts: {risk: n}, findings: [[line, command, risk, [rules]]], error}.
+    Findings are the commands above low risk.
+    """
+    result: Dict[str, Any] = {"path": path, "kind": kind, "lines": 0, "commands": 0,
+                              "counts": {r: 0 for r in RISKS}, "findings": [], "error": None}
+    try:
+        if max_bytes and os.path.getsize(path) > max_bytes:
+            result["error"] = f"skipped: larger than {max_bytes} bytes"
+            return result
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    except OSError as e:
+        result["error"] = str(e)
+        return result
+    scan = _scan or safety.rule_scanner()
+    result["lines"] = text.count("\n") + (1 if text and not text.endswith("\n") else 0)
+    counts = result["counts"]
+    for line, cmd in _SPLITTERS[kind](text):
+        risk, rules = scan(cmd)
+        counts[risk] += 1
+        if risk != "low":
+            result["findings"].append([line, cmd, risk, list(rules)])
+    result["commands"] = sum(counts.values())
+    return result
+
+def _audit_chunk(chunk: List[Tuple[str, str]], max_bytes: int) -> List[Dict[str, Any]]:
+    return [audit_file(path, kind, max_bytes) for path, kind in chunk]
+
+def _chunks(files: List[Tuple[str, str, int]], target_bytes: int) -> Iterator[List[Tuple[str, str]]]:
+    chunk: List[Tuple[str, str]] = []
+    size = 0
+    for path, kind, nbytes in files:
+        chunk.append((path, kind))
+        size += nbytes
+        if size >= target_bytes or len(chunk) >= 256:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+def audit_paths(paths: Iterable[str], jobs: int = 0, max_file_bytes: int = 0,
+                parallel_min_bytes: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """
+    Audit every file under paths; yields `audit_file` results in walk order.
+    jobs=0 uses every core. Trees smaller than parallel_min_bytes are scanned in
+    this process (starting workers would cost more than it saves).
+    """
+    files = list(iter_files(paths))
+    total = sum(size for _, _, size in files)
+    jobs = jobs or os.cpu_count() or 1
+    blacklist = tuple(safety.get_blacklist())
+    if jobs <= 1 or total < parallel_min_bytes or len(files) < 2:
+        _init_worker(blacklist)
+        for path, kind, _ in files:
+            yield audit_file(path, kind, max_file_bytes)
+        return
+    # a few chunks per worker keeps them busy when file sizes are uneven
+    target = max(64 * 1024, total // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(blacklist,)) as pool:
+        chunks = list(_chunks(files, target))
+        for results in pool.map(_audit_chunk, chunks, [max_file_bytes] * len(chunks)):
+            yield from results
+
+def summarize(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Totals over audit_file results: files, lines, commands, counts per risk and per rule.
+    """
+    summary: Dict[str, Any] = {"files": 0, "errors": 0, "lines": 0, "commands": 0,
+                               "counts": {r: 0 for r in RISKS}, "rules": {}}
+    for res in results:
+        summary["files"] += 1
+        summary["errors"] += res["error"] is not None
+        summary["lines"] += res["lines"]
+        summary["commands"] += res["commands"]
+        for risk, n in res["counts"].items():
+            summary["counts"][risk] += n
+        for _, _, _, rules in res["findings"]:
+            for rule in rules:
+                summary["rules"][rule] = summary["rules"].get(rule, 0) + 1
+    return summary
@@ -0,0 +1,106 @@
+"""
+backend_stats.py
+Per-provider attempt log for hedged generation: latency and outcome of every
+backend call, kept in a small SQLite database so win rates and latency
+percentiles survive across runs.
+
+Outcomes: win (first acceptable result), invalid (answered, rejected by
+validation), error (backend raised), cancelled (lost the race, stopped early).
+"""
+
+from __future__ import annotations
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from flyn.config.loader import get_config
+
+OUTCOMES = ("win", "invalid", "error", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    provider TEXT NOT NULL,
+    ts REAL NOT NULL,
+    latency_ms REAL NOT NULL,
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_provider ON attempts(provider);
+"""
+
+class BackendStats:
+    def __init__(self, path: Path, max_samples: int = 10000):
+        self.path = Path(path)
+        self.max_samples = int(max_samples)
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()  # one connection per process; transactions must not interleave
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def record(self, attempts: list[tuple[str, float, str]]) -> None:
+        """
+        Store (provider, latency_seconds, outcome) rows of one hedged request.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                db.executemany("INSERT INTO attempts(provider, ts, latency_ms, outcome) VALUES (?, ?, ?, ?)",
+                               [(p, now, round(lat * 1000, 2), o) for p, lat, o in attempts])
+                # keep a sliding window of the most recent samples
+                db.execute("DELETE FROM attempts WHERE id <= (SELECT MAX(id) FROM attempts) - ?", (self.max_samples,))
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        {provider: {attempts, win, invalid, error, cancelled, win_rate, p50_ms, p95_ms}}.
+        Percentiles cover calls that returned (win or invalid).
+        """
+        with self._lock:
+            db = self._db()
+            counts = db.execute("SELECT provider, outcome, COUNT(*) FROM attempts GROUP BY provider, outcome").fetchall()
+            latencies = db.execute("SELECT provider, latency_ms FROM attempts WHERE outcome IN ('win', 'invalid') "
+                                   "ORDER BY latency_ms").fetchall()
+        out: Dict[str, dict] = {}
+        for provider, outcome, n in counts:
+            row = out.setdefault(provider, {"attempts": 0, **{o: 0 for o in OUTCOMES}})
+            row[outcome] = n
+            row["attempts"] += n
+        for provider, row in out.items():
+            lat = [ms for p, ms in latencies if p == provider]
+            row["win_rate"] = row["win"] / row["attempts"] if row["attempts"] else 0.0
+            row["p50_ms"] = _pct(lat, 0.5)
+            row["p95_ms"] = _pct(lat, 0.95)
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM attempts")
+
+def _pct(sorted_values: list[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+_stats_singleton: BackendStats | None = None
+
+def get_stats() -> BackendStats:
+    global _stats_singleton
+    if _stats_singleton is None:
+        cfg = get_config()
+        path = Path(cfg.get("backend.stats_path") or "~/.cache/flyn/backend_stats.db").expanduser()
+        _stats_singleton = BackendStats(path, max_samples=int(cfg.get("backend.stats_max_samples", 10000)))
+    return _stats_singleton
@@ -0,0 +1,146 @@
+"""
+cache.py
+Persistent on-disk cache of raw model output, keyed on the normalized
+instruction, backend provider, target shell/OS and a config fingerprint.
+
+Only the raw backend text is stored: cache hits are re-parsed and re-validated
+by the generator so safety policy changes always apply.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import platform
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+from flyn.config.loader import get_config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    raw TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_WS = re.compile(r"\s+")
+
+def normalize_instruction(instruction: str) -> str:
+    # whitespace does not change the meaning of an instruction; case can (file names, `find -name Foo`)
+    return _WS.sub(" ", instruction).strip()
+
+def target_shell() -> str:
+    cfg = get_config()
+    shell = cfg.get("general.shell") or os.getenv("SHELL") or os.getenv("COMSPEC") or ""
+    return Path(shell).name.lower()
+
+def config_fingerprint() -> str:
+    """
+    Hash of the config sections that change what the backend generates.
+    Secrets are left out so rotating an API key does not drop the cache.
+    """
+    cfg = get_config()
+    backend = {k: v for k, v in (cfg.get("backend") or {}).items() if "key" not in k}
+    blob = json.dumps({"backend": backend, "shell": cfg.get("general.shell")}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+def make_key(instruction: str, provider: str) -> str:
+    parts = [normalize_instruction(instruction), provider, target_shell(), platform.system().lower(), config_fingerprint()]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, path: Path, ttl_seconds: float = 86400, max_entries: int = 5000):
+        self.path = Path(path)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _bump(self, name: str) -> None:
+        self._db().execute(
+            "INSERT INTO counters(name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached raw output for key, or None on miss/expiry.
+        """
+        db = self._db()
+        now = time.time()
+        row = db.execute("SELECT raw, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl_seconds > 0 and now - row[1] > self.ttl_seconds):
+            if row is not None:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._bump("misses")
+            return None
+        db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._bump("hits")
+        return row[0]
+
+    def put(self, key: str, raw: str) -> None:
+        db = self._db()
+        now = time.time()
+        db.execute(
+            "INSERT INTO responses(key, raw, created, accessed) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET raw = excluded.raw, created = excluded.created, accessed = excluded.accessed",
+            (key, raw, now, now))
+        self._evict()
+
+    def _evict(self) -> None:
+        # least recently used entries go first once over the size bound
+        db = self._db()
+        if self.ttl_seconds > 0:
+            db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+        count = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,))
+
+    def stats(self) -> dict:
+        db = self._db()
+        counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        entries = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"entries": entries, "hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "path": str(self.path)}
+
+    def clear(self) -> None:
+        db = self._db()
+        db.execute("DELETE FROM responses")
+        db.execute("DELETE FROM counters")
+
+_cache_singleton: ResponseCache | None = None
+
+def get_cache() -> Optional[ResponseCache]:
+    """
+    Return the process-wide cache, or None when disabled in config.
+    """
+    global _cache_singleton
+    cfg = get_config()
+    if not cfg.get("cache.enabled", True):
+        return None
+    if _cache_singleton is None:
+        path = Path(cfg.get("cache.path") or "~/.cache/flyn/responses.db").expanduser()
+        _cache_singleton = ResponseCache(
+            path,
+            ttl_seconds=float(cfg.get("cache.ttl_seconds", 86400)),
+            max_entries=int(cfg.get("cache.max_entries", 5000)))
+    return _cache_singleton
@@ -1,15 +1,23 @@
 """
 executor.py
 Safe command execution: dry-run, timeouts, safe_workdir, capture output.
+Streaming mode forwards output live and keeps only a bounded head + tail.
 """
 
 from __future__ import annotations
 import shlex
 import subprocess
-from typing import Dict, Any
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, BinaryIO, Callable, Optional
 from pathlib import Path
 import os
 from flyn.config.loader import get_config
+from flyn.core import tracing
+
+_READ_CHUNK = 64 * 1024
 
 def _get_safe_workdir() -> Path:
     cfg = get_config()
@@ -17,11 +25,173 @@ def _get_safe_workdir() -> Path:
     p.mkdir(parents=True, exist_ok=True)
     return p
 
-def run_command(cmd: str, timeout: int | None = None, dry_run: bool = True) -> Dict[str, Any]:
+class HeadTailBuffer:
+    """
+    Keeps the first `head_bytes` and the last `tail_bytes` of a stream.
+    Memory stays bounded no matter how much the command prints.
+    """
+
+    def __init__(self, head_bytes: int, tail_bytes: int):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self._head = bytearray()
+        self._tail: deque[bytes] = deque()
+        self._tail_len = 0
+        self.total = 0
+
+    def write(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.head_bytes - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if not data or self.tail_bytes <= 0:
+            return
+        self._tail.append(data)
+        self._tail_len += len(data)
+        while self._tail and self._tail_len - len(self._tail[0]) >= self.tail_bytes:
+            self._tail_len -= len(self._tail.popleft())
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self._head) + min(self._tail_len, self.tail_bytes)
+
+    def text(self) -> str:
+        tail = b"".join(self._tail)[-self.tail_bytes:] if self.tail_bytes > 0 else b""
+        head = self._head.decode("utf-8", errors="replace")
+        if not self.truncated:
+            return head + tail.decode("utf-8", errors="replace")
+        dropped = self.total - len(self._head) - len(tail)
+        return f"{head}\n... [{dropped} bytes truncated] ...\n{tail.decode('utf-8', errors='replace')}"
+
+def _pump(src: BinaryIO, buf: HeadTailBuffer, echo: Optional[Callable[[bytes], None]], spill: Optional[BinaryIO]) -> None:
+    fd = src.fileno()
+    while True:
+        data = os.read(fd, _READ_CHUNK)
+        if not data:
+            break
+        buf.write(data)
+        if spill is not None:
+            spill.write(data)
+        if echo is not None:
+            _forward(echo, data)
+
+def _echo_sink(stream: Any) -> Callable[[bytes], None]:
+    """
+    A writer for stream, resolved in the calling thread. Under the daemon,
+    sys.stdout picks the client per thread, so pump threads must not look it up.
+    """
+    raw = getattr(stream, "buffer", None)
+    if raw is not None:
+        def write(data: bytes) -> None:
+            raw.write(data)
+            raw.flush()
+    else:
+        def write(data: bytes) -> None:
+            stream.write(data.decode("utf-8", errors="replace"))
+            stream.flush()
+    return write
+
+def _forward(sink: Callable[[bytes], None], data: bytes) -> None:
+    try:
+        sink(data)
+    except (OSError, ValueError):
+        # terminal went away; keep capturing
+        pass
+
+def _kill_tree(proc: subprocess.Popen) -> None:
+    if os.name == "posix":
+        import signal
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+            return
+        except OSError:
+            pass
+    proc.kill()
+
+def _spill_paths(spill_dir: Path) -> tuple[Path, Path]:
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"flyn-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    return spill_dir / f"{stem}.stdout", spill_dir / f"{stem}.stderr"
+
+def _run_streaming(args: list[str], cwd: Path, timeout: int, echo: bool, spill_dir: Optional[Path]) -> Dict[str, Any]:
+    cfg = get_config()
+    head = int(cfg.get("executor.capture_head_bytes", 64 * 1024))
+    tail = int(cfg.get("executor.capture_tail_bytes", 64 * 1024))
+    out_buf, err_buf = HeadTailBuffer(head, tail), HeadTailBuffer(head, tail)
+    spills: list[BinaryIO] = []
+    result: Dict[str, Any] = {"streamed": True}
+    if spill_dir is not None:
+        out_path, err_path = _spill_paths(spill_dir)
+        spills = [open(out_path, "wb"), open(err_path, "wb")]
+        result["spill"] = {"stdout": str(out_path), "stderr": str(err_path)}
+
+    # own process group so a timeout also reaps children that hold the pipes open
+    proc = subprocess.Popen(args, cwd=str(cwd), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            start_new_session=os.name == "posix")
+    pumps = [
+        threading.Thread(target=_pump, args=(proc.stdout, out_buf, _echo_sink(sys.stdout) if echo else None, spills[0] if spills else None), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, err_buf, _echo_sink(sys.stderr) if echo else None, spills[1] if spills else None), daemon=True),
+    ]
+    for t in pumps:
+        t.start()
+    timed_out = False
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        _kill_tree(proc)
+        proc.wait()
+    finally:
+        for t in pumps:
+            t.join()
+        proc.stdout.close()
+        proc.stderr.close()
+        for f in spills:
+            f.close()
+
+    stderr = err_buf.text()
+    if timed_out:
+        stderr += f"timeout: command exceeded {timeout} seconds"
+    result.update({
+        "ok": not timed_out and proc.returncode == 0,
+        "rc": None if timed_out else proc.returncode,
+        "stdout": out_buf.text(),
+        "stderr": stderr,
+        "stdout_bytes": out_buf.total,
+        "stderr_bytes": err_buf.total,
+        "truncated": out_buf.truncated or err_buf.truncated,
+    })
+    return result
+
+def run_command(cmd: str, timeout: int | None = None, dry_run: bool = True, stream: bool = False,
+                echo: bool = True, spill_dir: str | Path | None = None, mode: str | None = None,
+                preview: bool | None = None, confirmed: bool = False) -> Dict[str, Any]:
     """
     Execute the command in a restricted working directory.
     Returns dict with keys: ok, rc, stdout, stderr, dry_run, error
+
+    With stream=True output is forwarded to the terminal as it is produced (echo=False
+    to only capture), stdout/stderr hold a bounded head + tail, and the full output is
+    written under spill_dir (default: executor.spill_dir) when one is configured.
+
+    mode (default: executor.mode) is "spawn" for a fresh process per command, or
+    "session" to run it in the persistent shell of core/shell_session.py, where
+    shell syntax works and cwd/env carry over (spill files are not written there).
+
+    A dry run with preview (default: executor.preview) runs the command against a
+    copy-on-write snapshot of the safe workdir and returns what it would change
+    under "preview" (see core/preview.py); the workdir itself is untouched. The
+    command really runs there, so risky commands are previewed only when confirmed.
     """
+    with tracing.span("execute") as sp:
+        result = _run_command(cmd, timeout, dry_run, stream, echo, spill_dir, mode, preview, confirmed)
+        sp.set(dry_run=result["dry_run"], rc=result.get("rc"), session=bool(result.get("session")))
+        return result
+
+def _run_command(cmd: str, timeout: int | None, dry_run: bool, stream: bool, echo: bool,
+                 spill_dir: str | Path | None, mode: str | None, preview: bool | None,
+                 confirmed: bool = False) -> Dict[str, Any]:
     cfg = get_config()
     if timeout is None:
         timeout = int(cfg.get("safety.max_timeout_seconds", 30))
@@ -31,12 +201,30 @@ def run_command(cmd: str, timeout: int | None = None, dry_run: bool = True) -> D
     default_dry = bool(cfg.get("general.dry_run_default", True))
     # If explicitly set dry_run=True → always dry.
     # If explicitly overridden (dry_run=False) → run normally even if default_dry=True.
+    session = (mode or cfg.get("executor.mode") or "spawn") == "session" and os.name == "posix"
     if dry_run and default_dry:
         result.update({"ok": True, "rc": None, "stdout": "", "stderr": ""})
+        if preview if preview is not None else cfg.get("executor.preview", False):
+            from flyn.core.preview import preview as preview_effects
+            # session commands get shell syntax, like they would when run for real
+            result["preview"] = preview_effects(cmd, safe_dir, shell=session, confirmed=confirmed)
+        return result
+
+    if session:
+        from flyn.core.shell_session import get_session, SessionError
+        try:
+            result.update(get_session().run(cmd, timeout=timeout, echo=stream and echo))
+        except SessionError as e:
+            result.update({"ok": False, "rc": None, "stdout": "", "stderr": str(e)})
         return result
 
     args = shlex.split(cmd)
     try:
+        if stream:
+            spill = spill_dir or cfg.get("executor.spill_dir")
+            spill_path = Path(spill).expanduser() if spill else None
+            result.update(_run_streaming(args, safe_dir, timeout, echo, spill_path))
+            return result
         proc = subprocess.run(args, capture_output=True, text=True, cwd=str(safe_dir), timeout=timeout)
         result.update({
             "ok": proc.returncode == 0,
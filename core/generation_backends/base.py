@@ -2,13 +2,54 @@
 Base interface for generation backends.
 All backends must implement `generate(instruction: str) -> str`
 which returns the raw model text output.
+Backends with a native async client should also override `agenerate`, and
+backends that can stream tokens should override `generate_stream`.
 """
 
 from __future__ import annotations
+import os
+import platform
 from abc import ABC, abstractmethod
-from typing import Protocol
+from typing import Iterator, Protocol
+from flyn.config.loader import get_config
+
+PROMPT_TEMPLATE = """You translate natural-language requests into a single shell command.
+Target OS: {os}. Target shell: {shell}.
+Reply with only a JSON object, no prose and no code fences:
+{{"command": "<one-line command>", "explanation": "<one sentence>", "confidence": <0.0-1.0>, "risk_tags": ["<tag>", ...]}}
+Prefer read-only, non-destructive commands when the request is ambiguous.
+{tools}
+Request: {instruction}"""
+
+def build_prompt(instruction: str) -> str:
+    """
+    Provider-neutral prompt asking for the JSON shape the parser/validator expect.
+    """
+    cfg = get_config()
+    shell = cfg.get("general.shell") or os.path.basename(os.getenv("SHELL") or os.getenv("COMSPEC") or "sh")
+    return PROMPT_TEMPLATE.format(os=platform.system() or "unknown", shell=shell, tools=_tools_line(),
+                                  instruction=instruction)
+
+_TOOLS_LINE: tuple | None = None  # (key, line)
+
+def _tools_line() -> str:
+    # rebuilt only when the PATH index or the tool settings change (the daemon outlives both)
+    global _TOOLS_LINE
+    from flyn.core.pathindex import get_path_index, prompt_tools
+    cfg = get_config()
+    enabled = bool(cfg.get("backend.prompt_tools_max", 60))
+    key = (get_path_index().version() if enabled else None, cfg.get("backend.prompt_tools"),
+           cfg.get("backend.prompt_tools_max", 60))
+    if _TOOLS_LINE is None or _TOOLS_LINE[0] != key:
+        tools = prompt_tools() if enabled else []
+        _TOOLS_LINE = (key, (f"Installed tools beyond the POSIX basics: {', '.join(tools)}. "
+                             "Use only these or standard utilities.\n") if tools else "")
+    return _TOOLS_LINE[1]
 
 class GenerationBackend(ABC):
+    # calls a network service; in-process backends set this to False and skip rate limiting
+    remote = True
+
     @abstractmethod
     def generate(self, instruction: str) -> str:
         """
@@ -16,3 +57,18 @@ class GenerationBackend(ABC):
         The generator does not parse or validate the output; that is done by parser/validator.
         """
         raise NotImplementedError
+
+    async def agenerate(self, instruction: str) -> str:
+        """
+        Async variant of `generate`. The default runs the blocking call in a worker
+        thread so sync-only backends still overlap their network round trips.
+        """
+        import asyncio
+        return await asyncio.to_thread(self.generate, instruction)
+
+    def generate_stream(self, instruction: str) -> Iterator[str]:
+        """
+        Yield the raw model text in chunks as it is produced. Concatenated chunks
+        equal what `generate` returns. The default yields the whole text at once.
+        """
+        yield self.generate(instruction)
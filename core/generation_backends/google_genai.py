@@ -1,31 +1,95 @@
 """
 google_genai.py
-Placeholder backend for Google generative API.
-Replace internals with real google-generativeai client calls.
+Backend for the Google Generative Language REST API.
+Requests go through the shared pooled transport (transport.py). Without an API
+key the backend degrades to a deterministic simulated response so the pipeline
+stays usable offline and in tests.
 """
 
 from __future__ import annotations
+import json
 import os
-from typing import Optional
-from .base import GenerationBackend
+from typing import Iterator, Optional
+from urllib.parse import quote
+from .base import GenerationBackend, build_prompt
+from .transport import HTTPTransport, TransportError, get_transport
 from flyn.config.loader import get_config
 
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+# chunk size used to replay the simulated response as a stream
+_SIMULATED_CHUNK = 16
+
 class GoogleGenAIBackend(GenerationBackend):
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, transport: Optional[HTTPTransport] = None):
         cfg = get_config()
         self.api_key = api_key or cfg.get("backend.google_api_key") or os.getenv("GOOGLE_API_KEY")
         # NOTE: do not raise here; allow graceful degradation in tests
+        self.model = cfg.get("backend.google_model") or DEFAULT_MODEL
+        self.base_url = cfg.get("backend.google_base_url") or DEFAULT_BASE_URL
+        self._transport = transport
+
+    @property
+    def remote(self) -> bool:
+        return bool(self.api_key)  # without a key the response is simulated locally
+
+    @property
+    def transport(self) -> HTTPTransport:
+        if self._transport is None:
+            self._transport = get_transport(self.base_url)
+        return self._transport
+
+    def _path(self, method: str) -> str:
+        return f"/v1beta/models/{quote(self.model, safe='')}:{method}"
+
+    def _payload(self, instruction: str) -> dict:
+        return {
+            "contents": [{"role": "user", "parts": [{"text": build_prompt(instruction)}]}],
+            "generationConfig": {"temperature": 0.0, "responseMimeType": "application/json"},
+        }
 
     def generate(self, instruction: str) -> str:
         """
-        Very small placeholder: returns a deterministic JSON-like text.
-        Replace this with real API invocation using google-generativeai SDK.
+        Return the model text for instruction (the simulated response without an API key).
         """
+        if not self.api_key:
+            return self._simulated(instruction)
+        data = self.transport.post_json(self._path("generateContent"), self._payload(instruction),
+                                        headers={"x-goog-api-key": self.api_key})
+        return _candidate_text(data)
+
+    def generate_stream(self, instruction: str) -> Iterator[str]:
+        """
+        Stream model text via streamGenerateContent (server-sent events).
+        """
+        if not self.api_key:
+            text = self._simulated(instruction)
+            for i in range(0, len(text), _SIMULATED_CHUNK):
+                yield text[i:i + _SIMULATED_CHUNK]
+            return
+        body = json.dumps(self._payload(instruction)).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream", "x-goog-api-key": self.api_key}
+        for line in self.transport.stream_lines("POST", self._path("streamGenerateContent") + "?alt=sse", body, headers):
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            try:
+                text = _candidate_text(json.loads(line[5:]))
+            except (TransportError, ValueError):
+                continue  # e.g. a final chunk carrying only finishReason/usage, or a non-JSON event
+            if text:
+                yield text
+
+    def _simulated(self, instruction: str) -> str:
         # Minimal deterministic output mimicking structured response
-        # In practice, call the model and return model.text or similar.
-        # Keep the output simple: a short explanation + the command
-        safe_instruction = instruction.replace('"', '\\"')
-        cmd = f"echo \"Simulated command for: {safe_instruction}\""
-        explanation = f"Simulated: run echo for instruction"
-        simulated = f'{{"command": "{cmd}", "explanation": "{explanation}", "confidence": 0.9, "risk_tags": []}}'
-        return simulated
+        cmd = f"echo {json.dumps('Simulated command for: ' + instruction)}"
+        return json.dumps({"command": cmd, "explanation": "Simulated: run echo for instruction",
+                           "confidence": 0.9, "risk_tags": []})
+
+def _candidate_text(data: dict) -> str:
+    try:
+        parts = data["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError, TypeError):
+        raise TransportError(f"unexpected response shape: {str(data)[:200]}")
+    return "".join(p.get("text", "") for p in parts)
@@ -0,0 +1,193 @@
+"""
+replay.py
+Record/replay backend for offline load testing (provider name "replay").
+
+record mode wraps a real provider (replay.record_provider) and appends every
+instruction -> raw output pair, with its latency, to a JSONL transcript.
+replay mode answers from that transcript without any network: lookups go
+through an index of byte offsets (kept next to the transcript as `<path>.idx`
+and rebuilt when the transcript changes), and latency and errors can be
+injected to exercise flyn's own concurrency and failure handling.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import mmap
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+from .base import GenerationBackend
+from .transport import TransportError
+from flyn.config.loader import get_config
+from flyn.core.cache import normalize_instruction
+
+def transcript_key(instruction: str) -> str:
+    return hashlib.sha1(normalize_instruction(instruction).encode("utf-8")).hexdigest()
+
+class TranscriptIndex:
+    """
+    Read-only view of a transcript: key -> (offset, length) of its latest line.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._mm: Optional[mmap.mmap] = None
+        self.load()
+
+    def load(self) -> None:
+        st = self.path.stat()
+        stamp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("stamp") == stamp:
+                self._offsets = {k: tuple(v) for k, v in cached["offsets"].items()}
+        except (OSError, ValueError, KeyError):
+            pass
+        if not self._offsets:
+            self._offsets = self._scan()
+            tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"stamp": stamp, "offsets": self._offsets}, f)
+                os.replace(tmp, self.index_path)
+            except OSError:
+                pass  # read-only location; the in-memory index still works
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else None
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        offsets: Dict[str, Tuple[int, int]] = {}
+        with open(self.path, "rb") as f:
+            pos = 0
+            for line in f:
+                try:
+                    offsets[json.loads(line)["key"]] = (pos, len(line))
+                except (ValueError, KeyError, TypeError):
+                    pass
+                pos += len(line)
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get(self, instruction: str) -> Optional[dict]:
+        loc = self._offsets.get(transcript_key(instruction))
+        if loc is None or self._mm is None:
+            return None
+        off, n = loc
+        return json.loads(self._mm[off:off + n])
+
+    def instructions(self) -> Iterator[str]:
+        for off, n in self._offsets.values():
+            yield json.loads(self._mm[off:off + n])["instruction"]
+
+class ReplayBackend(GenerationBackend):
+    def __init__(self, mode: Optional[str] = None, path: Optional[str] = None, inner: Optional[GenerationBackend] = None):
+        cfg = get_config()
+        self.mode = (mode or cfg.get("replay.mode") or "replay").lower()
+        if self.mode not in ("record", "replay"):
+            raise ValueError(f"replay.mode must be 'record' or 'replay', not {self.mode!r}")
+        self.path = Path(path or cfg.get("replay.path") or "~/.local/share/flyn/transcripts.jsonl").expanduser()
+        self.latency_ms = float(cfg.get("replay.latency_ms", 0))
+        self.latency_jitter_ms = float(cfg.get("replay.latency_jitter_ms", 0))
+        self.latency_scale = float(cfg.get("replay.latency_scale", 0.0))
+        self.error_rate = float(cfg.get("replay.error_rate", 0.0))
+        self.error_status = int(cfg.get("replay.error_status", 503))
+        self.stream_chunk = max(1, int(cfg.get("replay.stream_chunk", 16)))
+        self._inner = inner
+        self._lock = threading.Lock()
+        self._index: Optional[TranscriptIndex] = None
+
+    # -- record ----------------------------------------------------------
+
+    @property
+    def inner(self) -> GenerationBackend:
+        if self._inner is None:
+            from flyn.core.generator import _choose_backend
+            provider = get_config().get("replay.record_provider") or "google"
+            if provider == "replay":
+                raise ValueError("replay.record_provider cannot be 'replay'")
+            self._inner = _choose_backend(provider)
+        return self._inner
+
+    def _record(self, instruction: str, raw: str, latency: float) -> None:
+        line = json.dumps({"key": transcript_key(instruction), "instruction": instruction, "raw": raw,
+                           "latency_ms": round(latency * 1000, 1), "ts": datetime.utcnow().isoformat() + "Z"},
+                          ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    # -- replay ----------------------------------------------------------
+
+    @property
+    def index(self) -> TranscriptIndex:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    if not self.path.exists():
+                        raise TransportError(f"no transcript at {self.path}; record one with replay.mode = \"record\"")
+                    self._index = TranscriptIndex(self.path)
+        return self._index
+
+    def _lookup(self, instruction: str) -> Tuple[str, float]:
+        """
+        Return (raw, delay_seconds) for instruction, or raise an (injected) TransportError.
+        """
+        if self.error_rate and random.random() < self.error_rate:
+            raise TransportError(f"injected HTTP {self.error_status}", self.error_status)
+        entry = self.index.get(instruction)
+        if entry is None:
+            raise TransportError(f"no recorded response for {instruction!r}", 404)
+        delay = self.latency_ms + self.latency_scale * float(entry.get("latency_ms") or 0)
+        if self.latency_jitter_ms:
+            delay += random.uniform(0, self.latency_jitter_ms)
+        return entry["raw"], delay / 1000.0
+
+    def generate(self, instruction: str) -> str:
+        if self.mode == "record":
+            t0 = time.monotonic()
+            raw = self.inner.generate(instruction)
+            self._record(instruction, raw, time.monotonic() - t0)
+            return raw
+        raw, delay = self._lookup(instruction)
+        if delay > 0:
+            time.sleep(delay)
+        return raw
+
+    async def agenerate(self, instruction: str) -> str:
+        if self.mode == "record":
+            t0 = time.monotonic()
+            raw = await self.inner.agenerate(instruction)
+            self._record(instruction, raw, time.monotonic() - t0)
+            return raw
+        # no worker thread in replay: thousands of requests can be in flight at once
+        import asyncio
+        raw, delay = self._lookup(instruction)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return raw
+
+    def generate_stream(self, instruction: str) -> Iterator[str]:
+        if self.mode == "record":
+            t0 = time.monotonic()
+            chunks = []
+            for chunk in self.inner.generate_stream(instruction):
+                chunks.append(chunk)
+                yield chunk
+            self._record(instruction, "".join(chunks), time.monotonic() - t0)
+            return
+        raw, delay = self._lookup(instruction)
+        if delay > 0:
+            time.sleep(delay)
+        for i in range(0, len(raw), self.stream_chunk):
+            yield raw[i:i + self.stream_chunk]
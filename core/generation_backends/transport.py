@@ -0,0 +1,254 @@
+"""
+transport.py
+Shared HTTP transport for generation backends.
+
+One keep-alive connection pool per base URL and process (so a daemon reuses
+TLS sessions across requests), retries with jittered exponential backoff on
+429/5xx and dropped connections, a per-request deadline and a response size cap.
+Only the standard library is used; plain http:// base URLs work, which makes it
+easy to point a backend at a local stub server.
+"""
+
+from __future__ import annotations
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlsplit
+from flyn.config.loader import get_config
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_READ_CHUNK = 64 * 1024
+
+class TransportError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, body: bytes = b""):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+class DeadlineExceeded(TransportError):
+    pass
+
+class ResponseTooLarge(TransportError):
+    pass
+
+@dataclass
+class Response:
+    status: int
+    headers: Dict[str, str]
+    body: bytes = field(repr=False)
+
+    def json(self) -> Any:
+        try:
+            return json.loads(self.body.decode("utf-8"))
+        except ValueError as e:  # includes UnicodeDecodeError
+            raise TransportError(f"response is not JSON: {e}", self.status, self.body) from e
+
+class HTTPTransport:
+    def __init__(self, base_url: str, timeout: float = 30.0, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, max_response_bytes: int = 1024 * 1024, pool_size: int = 8):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"unsupported base URL: {base_url!r}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = float(timeout)
+        self.max_retries = int(max_retries)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.max_response_bytes = int(max_response_bytes)
+        self._pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=pool_size)
+
+    # -- connection pool -------------------------------------------------
+
+    def _new_conn(self, timeout: float) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def _acquire(self, timeout: float) -> http.client.HTTPConnection:
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            return self._new_conn(timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    # -- requests --------------------------------------------------------
+
+    def _backoff(self, attempt: int, retry_after: Optional[str], remaining: float) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return min(delay, max(0.0, remaining))
+
+    def _read_body(self, resp: http.client.HTTPResponse, conn: http.client.HTTPConnection) -> bytes:
+        chunks = []
+        size = 0
+        while True:
+            chunk = resp.read(_READ_CHUNK)
+            if not chunk:
+                return b"".join(chunks)
+            size += len(chunk)
+            if size > self.max_response_bytes:
+                conn.close()
+                raise ResponseTooLarge(f"response exceeded {self.max_response_bytes} bytes", resp.status)
+            chunks.append(chunk)
+
+    def _send(self, method: str, path: str, body: Optional[bytes], headers: Dict[str, str],
+              deadline: float) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Send one request, retrying per policy. Returns the connection and a response
+        whose status is final (success or non-retryable); the body is still unread.
+        """
+        url = self.base_path + path
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"deadline exceeded for {method} {path}")
+            conn = self._acquire(min(self.timeout, remaining))
+            reused = conn.sock is not None
+            try:
+                conn.request(method, url, body=body, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                if reused:
+                    continue  # stale keep-alive connection; retry at once on a fresh one
+                if attempt >= self.max_retries:
+                    raise TransportError(f"connection failed: {e}") from e
+                time.sleep(self._backoff(attempt, None, deadline - time.monotonic()))
+                attempt += 1
+                continue
+            except TimeoutError as e:
+                conn.close()
+                raise DeadlineExceeded(f"timed out waiting for {method} {path}") from e
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if attempt >= self.max_retries:
+                    raise TransportError(f"connection failed: {e}") from e
+                time.sleep(self._backoff(attempt, None, deadline - time.monotonic()))
+                attempt += 1
+                continue
+
+            if resp.status in RETRY_STATUSES and attempt < self.max_retries:
+                retry_after = resp.getheader("Retry-After")
+                self._read_body(resp, conn)  # drain so the connection can be reused
+                self._release(conn)
+                delay = self._backoff(attempt, retry_after, deadline - time.monotonic())
+                if resp.status == 429:
+                    # let the host-wide limiter pause other callers of this provider too
+                    from flyn.core.ratelimit import note_throttled
+                    note_throttled(delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            return conn, resp
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> Response:
+        """
+        Perform a request with retries. `timeout` is the overall deadline across
+        all attempts (default: the transport timeout). Raises TransportError for
+        non-2xx final responses.
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        conn, resp = self._send(method, path, body, headers or {}, deadline)
+        data = self._read_body(resp, conn)
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        if not 200 <= resp.status < 300:
+            raise TransportError(f"HTTP {resp.status} for {method} {path}", resp.status, data)
+        return Response(resp.status, {k.lower(): v for k, v in resp.getheaders()}, data)
+
+    def stream_lines(self, method: str, path: str, body: Optional[bytes] = None,
+                     headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> Iterator[bytes]:
+        """
+        Like `request`, but yield the response body line by line as it arrives
+        (e.g. server-sent events). Retries only happen before the first byte; the
+        deadline and size cap apply to the whole stream.
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        conn, resp = self._send(method, path, body, headers or {}, deadline)
+        if not 200 <= resp.status < 300:
+            data = self._read_body(resp, conn)
+            self._release(conn)
+            raise TransportError(f"HTTP {resp.status} for {method} {path}", resp.status, data)
+        size = 0
+        finished = False
+        try:
+            while True:
+                if time.monotonic() > deadline:
+                    raise DeadlineExceeded(f"deadline exceeded while streaming {method} {path}")
+                line = resp.readline(_READ_CHUNK)
+                if not line:
+                    finished = True
+                    return
+                size += len(line)
+                if size > self.max_response_bytes:
+                    raise ResponseTooLarge(f"response exceeded {self.max_response_bytes} bytes", resp.status)
+                yield line
+        finally:
+            # a stream abandoned midway leaves unread bytes; do not reuse that connection
+            if finished and not resp.will_close:
+                # readline() does not mark a Content-Length body as done; until the
+                # response is closed the connection refuses the next request
+                resp.close()
+                self._release(conn)
+            else:
+                conn.close()
+
+    def post_json(self, path: str, payload: Any, headers: Optional[Dict[str, str]] = None,
+                  timeout: Optional[float] = None) -> Any:
+        hdrs = {"Content-Type": "application/json", "Accept": "application/json", **(headers or {})}
+        return self.request("POST", path, json.dumps(payload).encode("utf-8"), hdrs, timeout).json()
+
+# one transport per base URL and process; backends share it
+_transports: Dict[str, HTTPTransport] = {}
+_transports_lock = threading.Lock()
+
+def get_transport(base_url: str) -> HTTPTransport:
+    """
+    Return the process-wide transport for base_url, configured from [backend].
+    """
+    with _transports_lock:
+        t = _transports.get(base_url)
+        if t is None:
+            cfg = get_config()
+            t = HTTPTransport(
+                base_url,
+                timeout=float(cfg.get("backend.timeout_seconds", 30)),
+                max_retries=int(cfg.get("backend.max_retries", 3)),
+                backoff_base=float(cfg.get("backend.backoff_base_seconds", 0.5)),
+                backoff_max=float(cfg.get("backend.backoff_max_seconds", 8)),
+                max_response_bytes=int(cfg.get("backend.max_response_bytes", 1024 * 1024)),
+                pool_size=int(cfg.get("backend.max_concurrency", 8)))
+            _transports[base_url] = t
+        return t
@@ -4,42 +4,447 @@ High-level pipeline: select backend -> generate -> parse -> validate -> return s
 """
 
 from __future__ import annotations
-from typing import Dict, Any, Optional
+import contextvars
+import importlib
+import sqlite3
+import queue
+import threading
+import time
+from typing import Dict, Any, Optional, AsyncIterator, Callable, Iterable, List, Tuple
 from flyn.config.loader import get_config
-from flyn.core.parser import parse_command_from_model, extract_json_like
+from flyn.core import safety
+from flyn.core.safety import SafetyAnalysis
+from flyn.core.parser import parse_command_from_model, extract_json_like, IncrementalCommandParser
 from flyn.core.validator import validate_generated
-from flyn.core.generation_backends.google_genai import GoogleGenAIBackend
 from flyn.core.generation_backends.base import GenerationBackend
+from flyn.core.generation_backends.transport import TransportError
+from flyn.core import cache as response_cache
+from flyn.core import backend_stats
+from flyn.core import ratelimit
+from flyn.core import tracing
 
-# Map provider names to backend classes (add more providers here)
-_BACKEND_REGISTRY: dict[str, type[GenerationBackend]] = {
-    "google": GoogleGenAIBackend,
+# Map provider names to backend classes or lazy "module:Class" paths (add more providers here).
+# Third-party backends can register under the "flyn.backends" entry point group.
+_BACKEND_REGISTRY: dict[str, str | type[GenerationBackend]] = {
+    "google": "flyn.core.generation_backends.google_genai:GoogleGenAIBackend",
+    "replay": "flyn.core.generation_backends.replay:ReplayBackend",
 }
+_DEFAULT_PROVIDER = "google"
+_ENTRY_POINT_GROUP = "flyn.backends"
+
+def _load_backend_class(provider: str) -> type[GenerationBackend] | None:
+    target = _BACKEND_REGISTRY.get(provider)
+    if target is None:
+        target = _entry_point_backend(provider)
+        if target is None:
+            return None
+    if isinstance(target, str):
+        module_path, _, attr = target.partition(":")
+        target = getattr(importlib.import_module(module_path), attr)
+        _BACKEND_REGISTRY[provider] = target
+    return target
+
+def _entry_point_backend(provider: str):
+    # entry point metadata is only scanned for providers not registered in-tree
+    from importlib.metadata import entry_points
+    for ep in entry_points(group=_ENTRY_POINT_GROUP):
+        if ep.name == provider:
+            return ep.value
+    return None
+
+# one instance per provider and process so clients keep their connections warm
+_BACKEND_INSTANCES: dict[str, GenerationBackend] = {}
 
 def _choose_backend(name: str | None = None) -> GenerationBackend:
     cfg = get_config()
-    provider = name or cfg.get("backend.provider", "google")
-    cls = _BACKEND_REGISTRY.get(provider)
+    provider = name or cfg.get("backend.provider", _DEFAULT_PROVIDER)
+    backend = _BACKEND_INSTANCES.get(provider)
+    if backend is not None:
+        return backend
+    cls = _load_backend_class(provider)
     if cls is None:
         # fallback to google placeholder
-        cls = GoogleGenAIBackend
-    return cls()
-
-def generate_structured(instruction: str, backend_name: Optional[str] = None) -> Dict[str, Any]:
-    backend = _choose_backend(backend_name)
-    raw = backend.generate(instruction)
-    # parse out JSON if possible
-    parsed_json = extract_json_like(raw)
-    if parsed_json is None:
-        # try to extract a heuristic command and wrap into minimal JSON
-        cmd = parse_command_from_model(raw)
-        parsed_json = {
-            "command": cmd or "",
-            "explanation": "Parsed heuristically from model output",
-            "confidence": 0.0,
-            "risk_tags": []
-        }
+        cls = _load_backend_class(_DEFAULT_PROVIDER)
+    backend = _BACKEND_INSTANCES[provider] = cls()
+    return backend
+
+def _provider_name(name: str | None = None) -> str:
+    return name or get_config().get("backend.provider", _DEFAULT_PROVIDER)
+
+def _provider_chain(name: str | None = None) -> List[str]:
+    """
+    Providers to try, in order: backend.providers when configured (and no explicit
+    name was given), else the single provider.
+    """
+    if name:
+        return [name]
+    providers = [p for p in (get_config().get("backend.providers") or []) if p]
+    return list(dict.fromkeys(providers)) or [_provider_name()]
+
+def _chain_name(providers: List[str]) -> str:
+    # cache namespace; a hedged answer may come from any provider in the chain
+    return providers[0] if len(providers) == 1 else "hedge:" + ",".join(providers)
+
+def _cache_lookup(instruction: str, provider: str) -> tuple[Optional[str], Optional[str]]:
+    """
+    Return (cache_key, cached_raw). Cache errors never block generation.
+    """
+    store = response_cache.get_cache()
+    if store is None:
+        return None, None
+    key = response_cache.make_key(instruction, provider)
+    with tracing.span("cache.lookup") as sp:
+        try:
+            raw = store.get(key)
+        except (sqlite3.Error, OSError):
+            raw = None
+        sp.set(hit=raw is not None)
+    return key, raw
+
+def _cache_store(key: Optional[str], raw: str, validated: Dict[str, Any]) -> None:
+    store = response_cache.get_cache()
+    # only remember outputs that actually parsed into a command
+    if store is None or key is None or not validated.get("command"):
+        return
+    with tracing.span("cache.store"):
+        try:
+            store.put(key, raw)
+        except (sqlite3.Error, OSError):
+            pass
+
+def generate_structured(instruction: str, backend_name: Optional[str] = None, use_cache: bool = True,
+                        on_command: Optional[Callable[[str, SafetyAnalysis], None]] = None) -> Dict[str, Any]:
+    """
+    Generate, parse and validate a command for instruction.
+
+    With `on_command`, the backend is streamed and the callback receives the command
+    and its safety analysis as soon as the "command" field is complete, while the
+    explanation is still being generated. It is called at most once.
+
+    With several providers in backend.providers the request is hedged (see
+    `_generate_hedged`); `on_command` then fires once the winning result is known.
+    """
+    with tracing.span("generate"):
+        return _generate_structured(instruction, backend_name, use_cache, on_command)
+
+def _generate_structured(instruction: str, backend_name: Optional[str], use_cache: bool,
+                         on_command: Optional[Callable[[str, SafetyAnalysis], None]]) -> Dict[str, Any]:
+    providers = _provider_chain(backend_name)
+    key, raw = _cache_lookup(instruction, _chain_name(providers)) if use_cache else (None, None)
+    if raw is not None:
+        # cached raw output is re-validated so current safety policy applies
+        validated = _structure(raw)
+        validated["cached"] = True
+        if on_command is not None and validated.get("command"):
+            on_command(validated["command"], safety.analyze(validated["command"]))
+        return validated
+    if len(providers) > 1:
+        with tracing.span("backend.hedge", providers=providers):
+            raw, validated = _generate_hedged(instruction, providers)
+        if on_command is not None and validated.get("command"):
+            on_command(validated["command"], safety.analyze(validated["command"]))
+    else:
+        backend = _choose_backend(providers[0])
+        try:
+            with ratelimit.limit(providers[0], backend), \
+                    tracing.span("backend", provider=providers[0], stream=on_command is not None):
+                raw = backend.generate(instruction) if on_command is None else _stream_raw(backend, instruction, on_command)
+        except TransportError as e:
+            return {"ok": False, "reason": f"backend error: {e}", "cached": False}
+        validated = _structure(raw)
+    validated["cached"] = False
+    if use_cache and raw is not None:
+        _cache_store(key, raw, validated)
+    return validated
+
+def generate_speculative(instruction: str, cancel: threading.Event, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    `generate_structured` for work that may be thrown away (the REPL generates while
+    the user is still typing). Returns None once cancel is set. A single provider is
+    streamed and abandoned mid-response; a hedged chain can only be discarded.
+    Completed results are cached like any other.
+    """
+    providers = _provider_chain()
+    key, raw = _cache_lookup(instruction, _chain_name(providers)) if use_cache else (None, None)
+    if raw is not None:
+        validated = _structure(raw)
+        validated["cached"] = True
+        return validated
+    if len(providers) > 1:
+        raw, validated = _generate_hedged(instruction, providers)
+    else:
+        chunks = []
+        try:
+            backend = _choose_backend(providers[0])
+            with ratelimit.limit(providers[0], backend):
+                stream = backend.generate_stream(instruction)
+                try:
+                    for chunk in stream:
+                        if cancel.is_set():
+                            return None
+                        chunks.append(chunk)
+                finally:
+                    stream.close()
+        except TransportError as e:
+            return None if cancel.is_set() else {"ok": False, "reason": f"backend error: {e}", "cached": False}
+        raw = "".join(chunks)
+        validated = _structure(raw)
+    validated["cached"] = False
+    if use_cache and raw is not None:
+        # a finished answer is worth keeping even if nobody waits for it any more
+        _cache_store(key, raw, validated)
+    return None if cancel.is_set() else validated
+
+def _acceptable(validated: Dict[str, Any]) -> bool:
+    """
+    A result good enough to stop hedging: it passed validation, or it is a confident
+    command that policy flags as dangerous (another backend would not change that).
+    """
+    if validated.get("ok"):
+        return True
+    cmd = validated.get("command")
+    min_conf = float(get_config().get("safety.min_confidence_to_auto_run", 0.9))
+    return bool(cmd) and float(validated.get("confidence") or 0.0) >= min_conf and safety.analyze(cmd).dangerous
+
+def _hedge_after() -> float:
+    return max(0.0, float(get_config().get("backend.hedge_after_ms", 1500)) / 1000.0)
+
+def _hedge_worker(provider: str, instruction: str, cancel: threading.Event, out: "queue.Queue") -> None:
+    # streams so a cancelled attempt stops reading (and drops its connection) early
+    t0 = time.monotonic()
+    try:
+        chunks = []
+        backend = _choose_backend(provider)
+        with ratelimit.limit(provider, backend):
+            t0 = time.monotonic()  # backend latency only, not time spent waiting for the limiter
+            stream = backend.generate_stream(instruction)
+            try:
+                for chunk in stream:
+                    if cancel.is_set():
+                        return
+                    chunks.append(chunk)
+            finally:
+                stream.close()
+        out.put((provider, "".join(chunks), None, time.monotonic() - t0))
+    except Exception as e:
+        out.put((provider, None, e, time.monotonic() - t0))
+
+def _settle(provider: str, raw: Optional[str], err: Optional[BaseException]) -> Tuple[Dict[str, Any], str]:
+    if err is not None:
+        return {"ok": False, "reason": f"backend error: {err}", "backend": provider}, "error"
+    validated = _structure(raw)
+    validated["backend"] = provider
+    return validated, ("win" if _acceptable(validated) else "invalid")
+
+def _record_attempts(attempts: List[Tuple[str, float, str]]) -> None:
+    try:
+        backend_stats.get_stats().record(attempts)
+    except sqlite3.Error:
+        pass
+
+def _generate_hedged(instruction: str, providers: List[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Start providers[0]; start the next provider when the running ones have been
+    quiet for backend.hedge_after_ms, or at once when one fails or is rejected by
+    validation. The first acceptable result wins and the other attempts are
+    cancelled. Returns (raw, validated); without a winner, the first provider's
+    result. Every attempt's latency and outcome goes to backend_stats.
+    """
+    hedge_after = _hedge_after()
+    out: "queue.Queue" = queue.Queue()
+    cancel = threading.Event()
+    started: Dict[str, float] = {}
+    attempts: List[Tuple[str, float, str]] = []
+    results: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = {}
+
+    def launch() -> None:
+        provider = providers[len(started)]
+        started[provider] = time.monotonic()
+        # copy the context: the request's config (daemon) and rate-limit lane
+        threading.Thread(target=contextvars.copy_context().run, args=(_hedge_worker, provider, instruction, cancel, out),
+                         name=f"flyn-hedge-{provider}", daemon=True).start()
+
+    launch()
+    winner: Optional[str] = None
+    while len(results) < len(started):
+        more = len(started) < len(providers)
+        try:
+            provider, raw, err, elapsed = out.get(timeout=hedge_after if more else None)
+        except queue.Empty:
+            launch()
+            continue
+        validated, outcome = _settle(provider, raw, err)
+        results[provider] = (raw, validated)
+        attempts.append((provider, elapsed, outcome))
+        if outcome == "win":
+            winner = provider
+            break
+        if more:
+            launch()
+    cancel.set()
+    now = time.monotonic()
+    attempts.extend((p, now - t0, "cancelled") for p, t0 in started.items() if p not in results)
+    _record_attempts(attempts)
+    if winner is not None:
+        return results[winner]
+    first = next(p for p in providers if p in results)
+    return results[first]
+
+def _stream_raw(backend: GenerationBackend, instruction: str,
+                on_command: Callable[[str, SafetyAnalysis], None]) -> str:
+    parser = IncrementalCommandParser()
+    for chunk in backend.generate_stream(instruction):
+        cmd = parser.feed(chunk)
+        if cmd is not None:
+            on_command(cmd, safety.analyze(cmd))
+    return parser.text
+
+async def generate_structured_async(instruction: str, backend_name: Optional[str] = None, use_cache: bool = True,
+                                    backend: Optional[GenerationBackend] = None) -> Dict[str, Any]:
+    """
+    Async twin of `generate_structured`. Pass `backend` to share one client across calls
+    (this skips hedging).
+    """
+    with tracing.span("generate"):
+        return await _agenerate_structured(instruction, backend_name, use_cache, backend)
+
+async def _agenerate_structured(instruction: str, backend_name: Optional[str], use_cache: bool,
+                                backend: Optional[GenerationBackend]) -> Dict[str, Any]:
+    providers = _provider_chain(backend_name)
+    key, raw = _cache_lookup(instruction, _chain_name(providers)) if use_cache else (None, None)
+    if raw is not None:
+        validated = _structure(raw)
+        validated["cached"] = True
+        return validated
+    if backend is None and len(providers) > 1:
+        with tracing.span("backend.hedge", providers=providers):
+            raw, validated = await _agenerate_hedged(instruction, providers)
+    else:
+        backend = backend or _choose_backend(providers[0])
+        try:
+            async with ratelimit.alimit(providers[0], backend):
+                with tracing.span("backend", provider=providers[0]):
+                    raw = await backend.agenerate(instruction)
+        except TransportError as e:
+            return {"ok": False, "reason": f"backend error: {e}", "cached": False}
+        validated = _structure(raw)
+    validated["cached"] = False
+    if use_cache and raw is not None:
+        _cache_store(key, raw, validated)
+    return validated
+
+async def _agenerate_hedged(instruction: str, providers: List[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Async `_generate_hedged`: same policy, but losing attempts are cancelled as tasks.
+    """
+    import asyncio
+    hedge_after = _hedge_after()
+    tasks: Dict[Any, Tuple[str, float]] = {}
+    attempts: List[Tuple[str, float, str]] = []
+    results: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = {}
+    leased: Dict[str, float] = {}  # when each attempt got past the limiter; latency is measured from there
+
+    async def attempt(provider: str) -> str:
+        backend = _choose_backend(provider)
+        async with ratelimit.alimit(provider, backend):
+            leased[provider] = time.monotonic()
+            return await backend.agenerate(instruction)
+
+    def launch() -> None:
+        provider = providers[len(tasks) + len(results)]
+        task = asyncio.ensure_future(attempt(provider))
+        tasks[task] = (provider, time.monotonic())
+
+    launch()
+    winner: Optional[str] = None
+    try:
+        while tasks and winner is None:
+            more = len(tasks) + len(results) < len(providers)
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after if more else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for task in done:
+                provider, t0 = tasks.pop(task)
+                err = task.exception()
+                validated, outcome = _settle(provider, None if err else task.result(), err)
+                results[provider] = (None if err else task.result(), validated)
+                attempts.append((provider, time.monotonic() - leased.get(provider, t0), outcome))
+                if outcome == "win" and winner is None:
+                    winner = provider
+                elif len(tasks) + len(results) < len(providers):
+                    launch()
+    finally:
+        now = time.monotonic()
+        for task, (provider, t0) in tasks.items():
+            task.cancel()
+            attempts.append((provider, now - leased.get(provider, t0), "cancelled"))
+        _record_attempts(attempts)
+    if winner is not None:
+        return results[winner]
+    first = next(p for p in providers if p in results)
+    return results[first]
+
+async def agenerate_ordered(instructions: Iterable[str], backend_name: Optional[str] = None, use_cache: bool = True,
+                            concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run instructions concurrently (at most `concurrency` in flight) and yield
+    results in input order as soon as each prefix of the batch is done.
+    A failing instruction yields an ok=False result instead of aborting the batch.
+    """
+    cfg = get_config()
+    limit = max(1, int(concurrency or cfg.get("backend.max_concurrency", 8)))
+    providers = _provider_chain(backend_name)
+    # a single provider shares one client; a hedged chain picks backends per request
+    backend = _choose_backend(providers[0]) if len(providers) == 1 else None
+    import asyncio
+    sem = asyncio.Semaphore(limit)
+
+    async def one(instruction: str) -> Dict[str, Any]:
+        # batch calls yield to interactive ones under the host-wide rate limit
+        async with sem:
+            try:
+                with ratelimit.use_lane("batch"):
+                    res = await generate_structured_async(instruction, backend_name, use_cache, backend=backend)
+            except Exception as e:
+                res = {"ok": False, "reason": f"backend error: {e}"}
+        res["instruction"] = instruction
+        return res
+
+    tasks = [asyncio.ensure_future(one(i)) for i in instructions]
+    try:
+        for t in tasks:
+            yield await t
+    finally:
+        for t in tasks:
+            t.cancel()
+
+async def generate_structured_many(instructions: Iterable[str], backend_name: Optional[str] = None, use_cache: bool = True,
+                                   concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Generate many instructions concurrently; results are returned in input order.
+    """
+    return [r async for r in agenerate_ordered(instructions, backend_name, use_cache, concurrency)]
+
+def _structure(raw: str) -> Dict[str, Any]:
+    with tracing.span("parse"):
+        # parse out JSON if possible
+        parsed_json = extract_json_like(raw)
+        if parsed_json is None:
+            # try to extract a heuristic command and wrap into minimal JSON
+            cmd = parse_command_from_model(raw)
+            parsed_json = {
+                "command": cmd or "",
+                "explanation": "Parsed heuristically from model output",
+                "confidence": 0.0,
+                "risk_tags": []
+            }
     validated = validate_generated(parsed_json)
     # include raw model output for debugging
     validated["model_raw"] = raw
+    if validated.get("command") and get_config().get("explain.annotate", True):
+        from flyn.core import manindex
+        with tracing.span("annotate"):
+            validated["flags"] = manindex.annotate(validated["command"])
     return validated
@@ -1,36 +1,247 @@
 """
 history.py
-Append and read simple history file entries.
+Segmented append-only history store.
+
+The active segment is the configured history file; once it grows past
+`history.segment_bytes` it is gzip-compressed into `<name>.<seq>.gz` and a new
+active segment starts. Each append is also added to the full-text index
+(core/history_index.py). Appends take an exclusive file lock so concurrent flyn
+processes never interleave or lose lines. Tail reads seek backwards from the
+end of the active segment, so their cost depends on `limit`, not on file size.
 """
 
 from __future__ import annotations
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from typing import Iterator, Optional
 from flyn.config.loader import get_config
+from flyn.core.history_index import get_index
+from flyn.core import tracing
+import gzip
 import json
+import os
+import re
+import sqlite3
 
-def _history_path() -> Path:
-    cfg = get_config()
-    p = Path(cfg.get("general.history_file") or "~/.local/share/flyn/history.log").expanduser()
-    p.parent.mkdir(parents=True, exist_ok=True)
-    return p
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
-def append_entry(entry: dict) -> None:
-    p = _history_path()
-    data = {"ts": datetime.utcnow().isoformat() + "Z", **entry}
-    with open(p, "a", encoding="utf-8") as f:
-        f.write(json.dumps(data, ensure_ascii=False) + "\n")
-
-def read_entries(limit: int = 100) -> list[dict]:
-    p = _history_path()
-    if not p.exists():
-        return []
-    lines = p.read_text(encoding="utf-8").strip().splitlines()
-    lines = lines[-limit:]
-    out = []
-    for l in lines:
+_BLOCK = 64 * 1024
+_SEGMENT_RE = re.compile(r"\.(\d+)\.gz$")
+
+class HistoryStore:
+    def __init__(self, path: Path, segment_bytes: int = 8 * 1024 * 1024, max_segments: int = 50):
+        self.path = Path(path)
+        self.segment_bytes = int(segment_bytes)
+        self.max_segments = int(max_segments)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.path.with_name(self.path.name + ".lock")
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            yield
+        finally:
+            os.close(fd)  # closing the descriptor releases the lock
+
+    def segments(self) -> list[Path]:
+        """
+        Rotated segments, oldest first.
+        """
+        found = []
+        for p in self.path.parent.glob(self.path.name + ".*.gz"):
+            m = _SEGMENT_RE.search(p.name)
+            if m:
+                found.append((int(m.group(1)), p))
+        return [p for _, p in sorted(found)]
+
+    def append(self, entry: dict) -> dict:
+        data = {"ts": datetime.utcnow().isoformat() + "Z", **entry}
+        line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._locked():
+            try:
+                size = self.path.stat().st_size
+            except FileNotFoundError:
+                size = 0
+            if size and size + len(line) > self.segment_bytes:
+                self._rotate()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        return data
+
+    def _rotate(self) -> None:
+        # caller holds the lock
+        segs = self.segments()
+        seq = int(_SEGMENT_RE.search(segs[-1].name).group(1)) + 1 if segs else 1
+        target = self.path.with_name(f"{self.path.name}.{seq}.gz")
+        tmp = target.with_name(target.name + ".tmp")
+        with open(self.path, "rb") as src, gzip.open(tmp, "wb") as dst:
+            while True:
+                chunk = src.read(_BLOCK)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        os.replace(tmp, target)
+        os.truncate(self.path, 0)
+        for old in (segs + [target])[:-self.max_segments] if self.max_segments > 0 else []:
+            old.unlink(missing_ok=True)
+
+    def _reverse_lines_active(self) -> Iterator[bytes]:
+        # read fixed-size blocks from the end; only the blocks we need are touched
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            pos = f.seek(0, os.SEEK_END)
+            rest = b""
+            while pos > 0:
+                step = min(_BLOCK, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + rest
+                lines = buf.split(b"\n")
+                rest = lines[0]
+                for l in reversed(lines[1:]):
+                    if l:
+                        yield l
+            if rest:
+                yield rest
+
+    def _reverse_lines_segment(self, seg: Path) -> Iterator[bytes]:
+        with gzip.open(seg, "rb") as f:
+            lines = f.read().split(b"\n")
+        for l in reversed(lines):
+            if l:
+                yield l
+
+    def iter_reverse(self) -> Iterator[dict]:
+        """
+        Yield entries newest first, crossing into rotated segments as needed.
+        """
+        sources = [self._reverse_lines_active()] + [self._reverse_lines_segment(s) for s in reversed(self.segments())]
+        for src in sources:
+            for raw in src:
+                try:
+                    yield json.loads(raw)
+                except Exception:
+                    continue
+
+    def iter_forward(self) -> Iterator[dict]:
+        """
+        Yield every entry oldest first (rotated segments, then the active file).
+        """
+        for seg in self.segments():
+            with gzip.open(seg, "rb") as f:
+                yield from _decode_lines(f)
         try:
-            out.append(json.loads(l))
+            with open(self.path, "rb") as f:
+                yield from _decode_lines(f)
+        except FileNotFoundError:
+            return
+
+    def oldest_ts(self) -> Optional[str]:
+        """
+        Timestamp of the oldest entry still kept, or None when the log is empty.
+        """
+        for entry in self.iter_forward():
+            return str(entry.get("ts", "")) or None
+        return None
+
+    def tail(self, limit: int = 100, since: Optional[str] = None) -> list[dict]:
+        """
+        Return up to `limit` most recent entries (oldest first), optionally only
+        those with ts >= since (ISO-8601, same format as entry timestamps).
+        """
+        out: list[dict] = []
+        if limit <= 0:
+            return out
+        for entry in self.iter_reverse():
+            if since is not None and str(entry.get("ts", "")) < since:
+                break
+            out.append(entry)
+            if len(out) >= limit:
+                break
+        out.reverse()
+        return out
+
+def _decode_lines(f) -> Iterator[dict]:
+    for raw in f:
+        try:
+            yield json.loads(raw)
         except Exception:
             continue
-    return out
+
+_store_singleton: HistoryStore | None = None
+
+def get_store() -> HistoryStore:
+    global _store_singleton
+    if _store_singleton is None:
+        cfg = get_config()
+        p = Path(cfg.get("general.history_file") or "~/.local/share/flyn/history.log").expanduser()
+        _store_singleton = HistoryStore(
+            p,
+            segment_bytes=int(cfg.get("history.segment_bytes", 8 * 1024 * 1024)),
+            max_segments=int(cfg.get("history.max_segments", 50)))
+    return _store_singleton
+
+def parse_since(value: str) -> str:
+    """
+    Turn '90m', '12h', '7d' or an ISO date/datetime into an entry-comparable timestamp.
+    """
+    m = re.fullmatch(r"\s*(\d+)\s*([smhdw])\s*", value)
+    if m:
+        unit = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}[m.group(2)]
+        dt = datetime.utcnow() - timedelta(**{unit: int(m.group(1))})
+    else:
+        dt = datetime.fromisoformat(value.strip().rstrip("Z"))
+    return dt.isoformat() + "Z"
+
+def append_entry(entry: dict) -> None:
+    """
+    Append entry to the log and the index. Unless the entry brings its own
+    "timings", the stage timings of the active trace are stored with it.
+    """
+    if "timings" not in entry:
+        trace = tracing.current()
+        if trace is not None and trace.spans:
+            entry = {**entry, "timings": trace.stage_totals()}
+    data = get_store().append(entry)
+    index = get_index()
+    if index is not None:
+        try:
+            index.add(data)
+        except sqlite3.Error:
+            # the log is the source of truth; `flyn history reindex` repairs the index
+            pass
+
+def read_entries(limit: int = 100, since: Optional[str] = None) -> list[dict]:
+    return get_store().tail(limit, since)
+
+def search_entries(query: str, limit: int = 20, executed: Optional[bool] = None,
+                   ok: Optional[bool] = None, rc: Optional[int] = None) -> Optional[list[dict]]:
+    """
+    Full-text search over the entries the log still holds, best match first; None
+    when the index is disabled. Entries of rotated-away or deleted segments are
+    dropped from the index first.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    try:
+        index.retain_since(get_store().oldest_ts())
+    except sqlite3.Error:
+        pass
+    return index.search(query, limit=limit, executed=executed, ok=ok, rc=rc)
@@ -0,0 +1,190 @@
+"""
+history_index.py
+Incremental full-text index over history entries (SQLite FTS5).
+
+Every appended entry is indexed right away. A query ranks all matching entries
+in SQL by BM25 times a recency boost, and can filter on executed / ok / rc.
+Entries whose history segment was rotated away are dropped (`retain_since`).
+"""
+
+from __future__ import annotations
+import json
+import math
+import re
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional
+from flyn.config.loader import get_config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    ts_epoch REAL NOT NULL,
+    instruction TEXT NOT NULL,
+    command TEXT NOT NULL,
+    executed INTEGER,
+    ok INTEGER,
+    rc INTEGER,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_ts ON entries(ts_epoch);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    instruction, command,
+    content='entries', content_rowid='id',
+    tokenize="unicode61 tokenchars '-_./'",
+    prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts(rowid, instruction, command) VALUES (new.id, new.instruction, new.command);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, instruction, command) VALUES ('delete', old.id, old.instruction, old.command);
+END;
+"""
+
+_QUERY_TOKEN = re.compile(r"[\w\-./]+", re.UNICODE)
+
+def _epoch(ts: str) -> float:
+    try:
+        return datetime.fromisoformat(ts.rstrip("Z")).timestamp()
+    except ValueError:
+        return 0.0
+
+def _fts_query(text: str, prefix: bool = False) -> str:
+    # every word must match; quoting keeps FTS syntax out of user input
+    terms = [t.replace('"', '') for t in _QUERY_TOKEN.findall(text.lower())]
+    star = "*" if prefix else ""
+    return " AND ".join(f'"{t}"{star}' for t in terms if t)
+
+class HistoryIndex:
+    def __init__(self, path: Path, recency_weight: float = 0.5, recency_halflife_days: float = 30.0):
+        self.path = Path(path)
+        self.recency_weight = float(recency_weight)
+        self.recency_halflife = float(recency_halflife_days) * 86400
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            conn.create_function("flyn_boost", 2, self._boost)
+            self._conn = conn
+        return self._conn
+
+    def _boost(self, ts_epoch: float, now: float) -> float:
+        # 1 + weight for an entry made now, halving towards 1 every half-life
+        age = max(0.0, now - ts_epoch)
+        return 1.0 + self.recency_weight * math.exp(-age * math.log(2) / self.recency_halflife)
+
+    @staticmethod
+    def _row(entry: dict) -> tuple:
+        result = entry.get("result") or {}
+        ts = str(entry.get("ts", ""))
+        flag = lambda v: None if v is None else int(bool(v))
+        return (ts, _epoch(ts), str(entry.get("instruction") or ""), str(entry.get("command") or ""),
+                flag(entry.get("executed")), flag(result.get("ok")), result.get("rc"),
+                json.dumps(entry, ensure_ascii=False))
+
+    def add(self, entry: dict) -> None:
+        self._db().execute(
+            "INSERT INTO entries(ts, ts_epoch, instruction, command, executed, ok, rc, doc) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self._row(entry))
+
+    def rebuild(self, entries: Iterable[dict]) -> int:
+        """
+        Drop the index and re-add entries, oldest first. Returns the count indexed.
+        """
+        db = self._db()
+        db.execute("BEGIN")
+        try:
+            db.execute("DELETE FROM entries")
+            db.execute("INSERT INTO entries_fts(entries_fts) VALUES ('delete-all')")
+            n = 0
+            for e in entries:
+                db.execute(
+                    "INSERT INTO entries(ts, ts_epoch, instruction, command, executed, ok, rc, doc) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._row(e))
+                n += 1
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("INSERT INTO entries_fts(entries_fts) VALUES ('optimize')")
+        return n
+
+    def search(self, query: str, limit: int = 20, executed: Optional[bool] = None,
+               ok: Optional[bool] = None, rc: Optional[int] = None) -> list[dict]:
+        """
+        Best matches first. Each result is the stored entry plus a "score" key.
+        """
+        where = []
+        params: list = []
+        for col, val in (("executed", executed), ("ok", ok)):
+            if val is not None:
+                where.append(f"e.{col} = ?")
+                params.append(int(val))
+        if rc is not None:
+            where.append("e.rc = ?")
+            params.append(rc)
+        limit = max(1, limit)
+        # whole-word match is cheap; fall back to prefix matching for partial words
+        rows = self._ranked(_fts_query(query), where, params, limit)
+        if len(rows) < limit:
+            rows = self._ranked(_fts_query(query, prefix=True), where, params, limit)
+        out = []
+        for score, doc in rows:
+            entry = json.loads(doc)
+            entry["score"] = round(-score, 4)
+            out.append(entry)
+        return out
+
+    def _ranked(self, match: str, where: list[str], params: list, limit: int) -> list[tuple]:
+        if not match:
+            return []
+        # bm25() is lower-is-better (negative); scaling by the boost keeps that order
+        clauses = " AND ".join(["entries_fts MATCH ?"] + where)
+        return self._db().execute(
+            "SELECT bm25(entries_fts, 2.0, 1.0) * flyn_boost(e.ts_epoch, ?) AS score, e.doc FROM entries_fts "
+            "JOIN entries e ON e.id = entries_fts.rowid "
+            f"WHERE {clauses} ORDER BY score LIMIT ?", [time.time(), match, *params, limit]).fetchall()
+
+    def retain_since(self, ts: Optional[str]) -> int:
+        """
+        Drop entries older than ts, the oldest entry still in the history log
+        (None: the log is empty). Returns how many were dropped.
+        """
+        if ts is None:
+            cur = self._db().execute("DELETE FROM entries")
+        else:
+            cur = self._db().execute("DELETE FROM entries WHERE ts_epoch < ?", (_epoch(ts),))
+        return cur.rowcount
+
+    def count(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+_index_singleton: HistoryIndex | None = None
+
+def get_index() -> Optional[HistoryIndex]:
+    """
+    Return the process-wide history index, or None when disabled in config.
+    """
+    global _index_singleton
+    cfg = get_config()
+    if not cfg.get("history.index", True):
+        return None
+    if _index_singleton is None:
+        path = cfg.get("history.index_path")
+        if not path:
+            hist = Path(cfg.get("general.history_file") or "~/.local/share/flyn/history.log").expanduser()
+            path = hist.with_name(hist.name + ".idx.db")
+        _index_singleton = HistoryIndex(
+            Path(path).expanduser(),
+            recency_weight=float(cfg.get("history.recency_weight", 0.5)),
+            recency_halflife_days=float(cfg.get("history.recency_halflife_days", 30)))
+    return _index_singleton
@@ -0,0 +1,617 @@
+"""
+manindex.py
+Offline explanation index: command -> summary + flags -> descriptions, built from
+installed man pages (roff is parsed directly; no man/groff needed) and, on
+demand, from `<command> --help` output.
+
+The index is one binary file, memory-mapped and searched with a binary search
+over a sorted name table, so a lookup costs one mmap and a few comparisons:
+
+    header   b"FLYNMAN1", count (u32), reserved (u32)
+    table    count x (name offset u32, name length u32, record offset u32, record length u32)
+    names    utf-8 command names, sorted
+    records  one compact JSON object per command: {"s": summary, "f": [[[flags...], text], ...]}
+
+A JSON manifest next to it records the mtime of every man section directory
+and the mtime/size of every page. When packages add or remove pages the
+directory mtimes change, and a rebuild re-parses only pages that are new or
+changed; the rest are copied from the previous index.
+"""
+
+from __future__ import annotations
+import bz2
+import gzip
+import json
+import lzma
+import mmap
+import os
+import re
+import struct
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from flyn.config.loader import get_config
+from flyn.core.parser import split_pipeline, stage_command
+
+MAGIC = b"FLYNMAN1"
+_HEADER = struct.Struct("<8sII")
+_ENTRY = struct.Struct("<IIII")
+_MANIFEST_VERSION = 1
+
+DEFAULT_MAN_ROOTS = ("/usr/share/man", "/usr/local/share/man", "/usr/local/man", "/opt/homebrew/share/man")
+_MAX_DESC = 240
+_MAX_FLAGS = 400
+
+# -- roff -------------------------------------------------------------------
+
+_ESCAPES = [
+    (re.compile(r'\\".*$'), ""),                                 # comment
+    (re.compile(r"\\f(?:\(..|\[[^\]]*\]|.)"), ""),               # font changes
+    (re.compile(r"\\s[+-]?\d+"), ""),                            # size changes
+    (re.compile(r"\\\((?:aq|cq)"), "'"),
+    (re.compile(r"\\\((?:dq|lq|rq)"), '"'),
+    (re.compile(r"\\\((?:em|en|mi|hy)"), "-"),
+    (re.compile(r"\\\(bu"), "*"),
+    (re.compile(r"\\\(..|\\\[[^\]]*\]|\\\*(?:\(..|\[[^\]]*\]|.)"), ""),
+    (re.compile(r"\\[-]"), "-"),
+    (re.compile(r"\\[ ~0]"), " "),
+    (re.compile(r"\\[&/,|^:%]"), ""),
+    (re.compile(r"\\e"), "\\\\"),
+    (re.compile(r"\\(.)"), r"\1"),
+]
+_FLAG = re.compile(r"(?:^|(?<=[\s,\[|{(]))([-+]{1,2}[A-Za-z0-9?#@][\w\-.+#]*)")
+_WS = re.compile(r"\s+")
+_HELP_GAP = re.compile(r"\s{2,}|\t")
+_FONT_MACROS = frozenset(("B", "I", "SM", "SB"))
+_ALT_MACROS = frozenset(("BR", "RB", "BI", "IB", "IR", "RI"))
+_BREAK_MACROS = frozenset(("TP", "IP", "PP", "P", "LP", "SH", "SS", "HP", "TQ", "It", "El", "Sh", "Ss", "Pp", "RE"))
+# mdoc macros whose name is dropped while their arguments are kept as text
+_MDOC_INLINE = frozenset(("Ar", "Pa", "Cm", "Li", "Em", "Sy", "Dq", "Qq", "Sq", "Ql", "Va", "Ev", "Xr", "Nm", "Op",
+                          "Oo", "Oc", "Ic", "Dv", "Er", "Fn", "Ns", "No", "Pq", "Aq", "Brq", "Bq", "Tn", "Xo", "Xc"))
+
+def _unescape(text: str) -> str:
+    for pattern, repl in _ESCAPES:
+        text = pattern.sub(repl, text)
+    return text
+
+def _macro_args(rest: str) -> List[str]:
+    args, cur, quoted = [], "", False
+    for ch in rest:
+        if ch == '"':
+            quoted = not quoted
+        elif ch in " \t" and not quoted:
+            if cur:
+                args.append(cur)
+            cur = ""
+        else:
+            cur += ch
+    if cur:
+        args.append(cur)
+    return args
+
+def _mdoc_text(args: List[str]) -> str:
+    out = []
+    flag_next = False
+    args = list(args)
+    while args:
+        a = args.pop(0)
+        if a == "Xr" and len(args) >= 2:
+            out.append(f"{args.pop(0)}({args.pop(0)})")
+            continue
+        if a == "Fl":
+            flag_next = True
+            continue
+        if a in _MDOC_INLINE:
+            continue
+        out.append(("-" + a) if flag_next else a)
+        flag_next = False
+    if flag_next:
+        out.append("-")
+    return " ".join(out)
+
+def _line_text(line: str) -> Optional[str]:
+    """
+    Text carried by one roff line (font macros and mdoc inline macros resolved),
+    or None for a structural request.
+    """
+    if not line.startswith((".", "'")):
+        return _unescape(line)
+    name, _, rest = line[1:].strip().partition(" ")
+    if name in _FONT_MACROS:
+        return _unescape(" ".join(_macro_args(rest)))
+    if name in _ALT_MACROS:
+        return _unescape("".join(_macro_args(rest)))
+    if name == "Fl" or name in _MDOC_INLINE:
+        return _unescape(_mdoc_text([name] + _macro_args(rest)))
+    return None
+
+def _clean(text: str) -> str:
+    return _WS.sub(" ", text).strip()
+
+def _first_sentence(text: str) -> str:
+    text = _clean(text)
+    m = re.search(r"(?<=[a-z)\]])\.\s", text)
+    if m and m.start() < _MAX_DESC:
+        text = text[:m.start() + 1]
+    return text if len(text) <= _MAX_DESC else text[:_MAX_DESC - 3].rstrip() + "..."
+
+def parse_roff(source: str) -> Dict[str, Any]:
+    """
+    Extract {"s": summary, "f": [[[flag aliases], description], ...]} from man(7) or mdoc(7) source.
+    """
+    summary = ""
+    flags: List[List[Any]] = []
+    seen: set = set()
+    section = ""
+    name_text: List[str] = []
+    item: Optional[List[str]] = None     # aliases of the open item
+    desc: List[str] = []
+    nm = ""                              # mdoc: a bare .Nm stands for the page's name
+    expect_header = False                # .TP: the next text line is the item header
+    pending_para = False                 # .PP: a "-x" line followed by .RS is a header
+
+    def close_item() -> None:
+        nonlocal item, desc
+        if item and len(flags) < _MAX_FLAGS:
+            text = _first_sentence(" ".join(desc))
+            fresh = [f for f in item if f not in seen]
+            if fresh and text:
+                seen.update(fresh)
+                flags.append([fresh, text])
+        item, desc = None, []
+
+    def open_item(header: str) -> bool:
+        nonlocal item
+        header = _clean(header)
+        if not header.startswith(("-", "+")):
+            return False
+        aliases = list(dict.fromkeys(_FLAG.findall(header)))
+        if not aliases:
+            return False
+        close_item()
+        item = aliases
+        return True
+
+    lines = source.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if line.startswith((".", "'")):
+            name, _, rest = line[1:].strip().partition(" ")
+            if name in ("SH", "Sh"):
+                close_item()
+                section = _clean(_unescape(rest.strip('"'))).upper()
+                expect_header = pending_para = False
+                continue
+            if section == "NAME" and name == "Nd":
+                summary = _clean(_unescape(rest))
+                continue
+            if name in ("TP", "TQ"):
+                close_item()
+                expect_header = True
+                continue
+            if name == "IP":
+                args = _macro_args(rest)
+                close_item()
+                if args:
+                    open_item(_unescape(args[0]))
+                continue
+            if name == "It":
+                close_item()
+                open_item(_unescape(_mdoc_text(_macro_args(rest))))
+                continue
+            if name in ("PP", "P", "LP", "Pp", "sp"):
+                if name != "sp":
+                    close_item()
+                pending_para = True
+                continue
+            if name == "RS":
+                continue
+            if name in _BREAK_MACROS:
+                close_item()
+                expect_header = pending_para = False
+                continue
+            if name == "Nm":
+                if section == "NAME" and rest.strip() and not nm:
+                    nm = _clean(_unescape(rest)).split(" ")[0]
+                elif not rest.strip():
+                    line = nm
+        text = _line_text(line)
+        if text is None:
+            continue
+        if section == "NAME":
+            name_text.append(text)
+            continue
+        if expect_header:
+            expect_header = False
+            if not open_item(text):
+                desc = [text]
+            continue
+        if pending_para:
+            pending_para = False
+            nxt = lines[i].strip() if i < len(lines) else ""
+            if nxt.startswith(".RS") and open_item(text):
+                continue
+        if item is not None:
+            desc.append(text)
+    close_item()
+    if not summary and name_text:
+        joined = _clean(" ".join(name_text))
+        summary = re.split(r"\s+-+\s+", joined, maxsplit=1)[-1]
+    return {"s": _first_sentence(summary), "f": flags}
+
+def parse_help(text: str) -> Dict[str, Any]:
+    """
+    Same record shape from `--help` output: "  -a, --all   description" lines.
+    """
+    summary = ""
+    flags: List[List[Any]] = []
+    seen: set = set()
+    item: Optional[Tuple[List[str], List[str], int]] = None
+
+    def close() -> None:
+        if item and item[1]:
+            fresh = [f for f in item[0] if f not in seen]
+            if fresh:
+                seen.update(fresh)
+                flags.append([fresh, _first_sentence(" ".join(item[1]))])
+
+    for raw in text.splitlines():
+        stripped = raw.strip()
+        if not stripped:
+            continue
+        indent = len(raw) - len(raw.lstrip())
+        if stripped.startswith("-"):
+            close()
+            gap = _HELP_GAP.search(stripped)
+            head, rest = (stripped[:gap.start()], stripped[gap.end():]) if gap else (stripped, "")
+            aliases = list(dict.fromkeys(_FLAG.findall(head)))
+            item = (aliases, [rest.strip()] if rest.strip() else [], indent) if aliases else None
+        elif item is not None and indent > item[2]:
+            item[1].append(stripped)
+        else:
+            close()
+            item = None
+            if not summary and not stripped.lower().startswith(("usage", "or:")):
+                summary = stripped
+    close()
+    return {"s": _first_sentence(summary), "f": flags[:_MAX_FLAGS]}
+
+# -- man pages on disk --------------------------------------------------------
+
+def man_roots() -> List[Path]:
+    cfg = get_config()
+    spec = cfg.get("explain.man_path") or os.getenv("MANPATH") or ""
+    roots = [p for p in spec.split(":") if p] or list(DEFAULT_MAN_ROOTS)
+    return [Path(p).expanduser() for p in dict.fromkeys(roots) if Path(p).expanduser().is_dir()]
+
+def _page_name(filename: str) -> str:
+    base = filename
+    for ext in (".gz", ".bz2", ".xz", ".lzma", ".z", ".Z"):
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+            break
+    stem, dot, sect = base.rpartition(".")
+    return stem if dot and sect[:1].isdigit() else base
+
+def _read_page(path: Path, depth: int = 0) -> str:
+    name = path.name
+    opener = gzip.open if name.endswith((".gz", ".z", ".Z")) else bz2.open if name.endswith(".bz2") \
+        else lzma.open if name.endswith((".xz", ".lzma")) else open
+    with opener(path, "rb") as f:
+        data = f.read().decode("utf-8", errors="replace")
+    head = data.lstrip()[:200]
+    if head.startswith(".so ") and depth < 2:
+        # alias page: ".so man1/other.1"
+        target = head[4:].splitlines()[0].strip()
+        base = path.parent.parent / target
+        for cand in (base, *(base.with_name(base.name + ext) for ext in (".gz", ".bz2", ".xz"))):
+            if cand.exists():
+                return _read_page(cand, depth + 1)
+    return data
+
+def _sections() -> List[str]:
+    return [str(s) for s in (get_config().get("explain.sections") or ["1", "8"])]
+
+def _section_dirs() -> List[Path]:
+    return [root / f"man{s}" for root in man_roots() for s in _sections() if (root / f"man{s}").is_dir()]
+
+# -- binary index -------------------------------------------------------------
+
+class ManIndex:
+    """
+    Read-only view of an index file (memory-mapped).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError("index too small")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError("not a flyn man index")
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int]:
+        return _ENTRY.unpack_from(self._mm, _HEADER.size + i * _ENTRY.size)
+
+    def _name(self, i: int) -> bytes:
+        off, length, _, _ = self._entry(i)
+        return self._mm[off:off + length]
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        key = name.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._name(lo) == key:
+            _, _, off, length = self._entry(lo)
+            return json.loads(self._mm[off:off + length])
+        return None
+
+    def names(self) -> Iterator[str]:
+        for i in range(self.count):
+            yield self._name(i).decode("utf-8")
+
+    def close(self) -> None:
+        self._mm.close()
+
+def write_index(path: Path, records: Dict[str, Dict[str, Any]]) -> None:
+    names = sorted(records, key=lambda n: n.encode("utf-8"))
+    name_blobs = [n.encode("utf-8") for n in names]
+    rec_blobs = [json.dumps(records[n], ensure_ascii=False, separators=(",", ":")).encode("utf-8") for n in names]
+    base = _HEADER.size + _ENTRY.size * len(names)
+    table, off = [], base
+    name_offs = []
+    for b in name_blobs:
+        name_offs.append(off)
+        off += len(b)
+    for name_off, nb, rb in zip(name_offs, name_blobs, rec_blobs):
+        table.append(_ENTRY.pack(name_off, len(nb), off, len(rb)))
+        off += len(rb)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(names), 0))
+        f.write(b"".join(table))
+        f.write(b"".join(name_blobs))
+        f.write(b"".join(rec_blobs))
+    os.replace(tmp, path)
+
+def _manifest_path(path: Path) -> Path:
+    return path.with_name(path.name + ".json")
+
+def _load_manifest(path: Path) -> Dict[str, Any]:
+    try:
+        with open(_manifest_path(path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if data.get("version") == _MANIFEST_VERSION else {}
+
+def _dir_stamps() -> Dict[str, int]:
+    return {str(d): d.stat().st_mtime_ns for d in _section_dirs()}
+
+def is_stale(path: Path) -> bool:
+    if not path.exists():
+        return True
+    return _load_manifest(path).get("dirs") != _dir_stamps()
+
+def build_index(path: Path, force: bool = False) -> Dict[str, int]:
+    """
+    (Re)build the index at path. Unless force, pages whose mtime and size are
+    unchanged since the last build keep their previous record. Returns counts.
+    """
+    path = Path(path)
+    manifest = {} if force else _load_manifest(path)
+    old_pages: Dict[str, list] = manifest.get("pages", {})
+    old: Optional[ManIndex] = None
+    if old_pages:
+        try:
+            old = ManIndex(path)
+        except (OSError, ValueError):
+            old_pages = {}
+    records: Dict[str, Dict[str, Any]] = {}
+    pages: Dict[str, list] = {}
+    stats = {"pages": 0, "parsed": 0, "reused": 0, "failed": 0}
+    try:
+        # earlier roots and sections win for duplicate names
+        for d in _section_dirs():
+            try:
+                entries = sorted(os.scandir(d), key=lambda e: e.name)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                name = _page_name(entry.name)
+                if name in records or not entry.is_file():
+                    continue
+                stats["pages"] += 1
+                stamp = [st.st_mtime_ns, st.st_size, name]
+                prev = old_pages.get(entry.path)
+                record = old.get(name) if old is not None and prev == stamp else None
+                if record is not None:
+                    stats["reused"] += 1
+                else:
+                    try:
+                        record = parse_roff(_read_page(Path(entry.path)))
+                    except (OSError, EOFError, ValueError, lzma.LZMAError):
+                        stats["failed"] += 1
+                        continue
+                    stats["parsed"] += 1
+                records[name] = record
+                pages[entry.path] = stamp
+    finally:
+        if old is not None:
+            old.close()
+    write_index(path, records)
+    with open(_manifest_path(path), "w", encoding="utf-8") as f:
+        json.dump({"version": _MANIFEST_VERSION, "dirs": _dir_stamps(), "pages": pages}, f)
+    return stats
+
+# -- --help fallback ----------------------------------------------------------
+
+def _help_cache_path(path: Path) -> Path:
+    return path.with_name(path.name + ".help.json")
+
+def help_record(name: str, index_path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Record parsed from `<name> --help`, cached per binary path and mtime. Only
+    binaries found through the PATH index are probed, never ones the safety rules
+    flag as dangerous. The run has a short timeout, no stdin and the safe workdir
+    as cwd, but it is not isolated: the binary can do anything the user can.
+    """
+    from flyn.core import safety
+    from flyn.core.executor import _get_safe_workdir
+    from flyn.core.pathindex import get_path_index
+    if "/" in name or safety.is_dangerous(name):
+        return None
+    exe = get_path_index().which(name)
+    if exe is None:
+        return None
+    st = os.stat(exe)
+    cache_path = _help_cache_path(index_path)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    hit = cache.get(name)
+    if hit and hit.get("path") == exe and hit.get("mtime") == st.st_mtime_ns:
+        return hit.get("record")
+    timeout = float(get_config().get("explain.help_timeout_seconds", 2))
+    try:
+        proc = subprocess.run([exe, "--help"], stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                              errors="replace", timeout=timeout, cwd=str(_get_safe_workdir()),
+                              env={**os.environ, "LC_ALL": "C", "PAGER": "cat", "MANPAGER": "cat"})
+        record = parse_help(proc.stdout or proc.stderr)
+    except (OSError, subprocess.SubprocessError):
+        record = None
+    if record is not None and not record["f"] and not record["s"]:
+        record = None
+    cache[name] = {"path": exe, "mtime": st.st_mtime_ns, "record": record}
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+    return record
+
+# -- lookup -------------------------------------------------------------------
+
+def index_path() -> Path:
+    return Path(get_config().get("explain.index_path") or "~/.cache/flyn/manindex.bin").expanduser()
+
+_index: Optional[ManIndex] = None
+_checked = 0.0
+_CHECK_INTERVAL = 60.0  # long-running processes (daemon, repl) re-check for new pages this often
+
+def get_index(build: bool = True) -> Optional[ManIndex]:
+    """
+    The process-wide index, rebuilt first when man pages changed. With
+    build=False a missing or stale index is used as is (or None), never rebuilt.
+    """
+    global _index, _checked
+    now = time.monotonic()
+    if _index is not None and (not build or now - _checked < _CHECK_INTERVAL):
+        return _index
+    path = index_path()
+    _checked = now
+    if build and is_stale(path):
+        build_index(path)
+    elif _index is not None:
+        return _index
+    if _index is not None:
+        _index.close()
+        _index = None
+    try:
+        _index = ManIndex(path)
+    except (OSError, ValueError):
+        return None
+    return _index
+
+def lookup(name: str, index: Optional[ManIndex] = None, help_fallback: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+    index = index if index is not None else get_index()
+    record = index.get(name) if index is not None else None
+    if record is None:
+        if help_fallback is None:
+            help_fallback = bool(get_config().get("explain.help_fallback", False))
+        if help_fallback:
+            record = help_record(name, index_path())
+    return record
+
+def _flag_map(record: Dict[str, Any]) -> Dict[str, str]:
+    return {alias: text for aliases, text in record.get("f", []) for alias in aliases}
+
+def _explain_flag(token: str, flags: Dict[str, str]) -> List[Tuple[str, Optional[str]]]:
+    flag = token.split("=", 1)[0]
+    if flag in flags:
+        return [(flag, flags[flag])]
+    if flag.startswith("-") and not flag.startswith("--") and len(flag) > 2:
+        # bundled short options: -la -> -l -a
+        if f"-{flag[1]}" in flags:
+            return [(f"-{c}", flags.get(f"-{c}")) for c in flag[1:]]
+    return [(flag, None)]
+
+def explain_command(cmd: str, help_fallback: Optional[bool] = None, build: bool = True) -> List[Dict[str, Any]]:
+    """
+    Per pipeline stage: {"command", "summary", "known", "flags": [(flag, description or None)]}.
+    "git commit -a" is looked up as git-commit when that page exists.
+    """
+    index = get_index(build)
+    out = []
+    for tokens in split_pipeline(cmd):
+        at = stage_command(tokens)
+        if at is None:
+            continue
+        name = os.path.basename(tokens[at])
+        args = tokens[at + 1:]
+        record = None
+        if args and not args[0].startswith("-"):
+            record = index.get(f"{name}-{args[0]}") if index is not None else None
+            if record is not None:
+                name, args = f"{name}-{args[0]}", args[1:]
+        if record is None:
+            record = lookup(name, index, help_fallback)
+        flags = _flag_map(record) if record else {}
+        described = []
+        for tok in args:
+            if tok.startswith("-") and tok not in ("-", "--"):
+                described.extend(_explain_flag(tok, flags))
+        out.append({"command": name, "summary": (record or {}).get("s", ""), "known": record is not None,
+                    "flags": described})
+    return out
+
+def annotate(cmd: str) -> List[List[str]]:
+    """
+    [flag, description] for each documented flag in cmd. Cheap enough for the
+    generation path: uses the index only if it already exists, never runs --help.
+    """
+    if get_index(build=False) is None:
+        return []
+    return [[flag, text] for stage in explain_command(cmd, help_fallback=False, build=False)
+            for flag, text in stage["flags"] if text]
+
+def describe(cmd: str, help_fallback: Optional[bool] = None) -> str:
+    """
+    Human-readable explanation lines for cmd ("" when nothing is known).
+    """
+    lines = []
+    for stage in explain_command(cmd, help_fallback):
+        lines.append(f"{stage['command']}: {stage['summary'] or 'no local documentation'}")
+        for flag, text in stage["flags"]:
+            lines.append(f"  {flag:<14} {text or '(not documented)'}")
+    return "\n".join(lines)
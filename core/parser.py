@@ -7,54 +7,292 @@ This is intentionally defensive.
 from __future__ import annotations
 import json
 import re
-from typing import Optional, Dict, Any
+import shlex
+from typing import Optional, Dict, Any, List, Tuple
+
+# one regex drives the scanner: braces, quotes, escapes, newlines and fence lines
+_SCAN = re.compile(r'[{}"\\\n]|^[ \t]*```[^\n]*', re.MULTILINE)
+_WS = re.compile(r"\s+")
+_CMDISH = re.compile(r"[a-zA-Z0-9\-\_/\.]+\s")
+_BACKTICKS = re.compile(r"^`+|`+$")
+_PROMPT = re.compile(r"^(?:\$|#|>)\s+")
+
+_SHELL_FENCES = ("", "sh", "bash", "zsh", "shell", "console", "powershell", "ps1", "pwsh", "cmd", "bat")
+
+# bound on json.loads attempts per text, so nested/adversarial input stays linear
+_MAX_PARSE_ATTEMPTS = 64
+
+def scan_candidates(text: str) -> Tuple[List[Tuple[int, int, list]], List[Tuple[str, str]]]:
+    """
+    Single pass over text. Returns (objects, fences):
+    objects - outermost balanced {...} spans as (start, end, children), in order;
+              children are the nested spans, used when the outer span is not JSON.
+              Spans inside a brace that never closes are promoted to the top level.
+    fences  - (language, body) for every ``` fenced block, in order.
+    Quote/escape state is only tracked inside braces, so apostrophes in prose are harmless.
+    """
+    objects: List[Tuple[int, int, list]] = []
+    fences: List[Tuple[str, str]] = []
+    # open braces: start offsets, plus each one's closed children (allocated lazily)
+    stack: List[int] = []
+    kids: List[Optional[list]] = []
+    in_string = False
+    skip_to = -1
+    fence: Optional[Tuple[str, int]] = None
+    for m in _SCAN.finditer(text):
+        pos = m.start()
+        if pos < skip_to:
+            continue
+        tok = m.group()
+        c = tok[0]
+        if in_string:
+            if c == "\\":
+                skip_to = pos + 2  # the escaped character is never structural
+            elif c == '"':
+                in_string = False
+            elif c == "\n":
+                in_string = False  # raw newline: not a JSON string after all
+            elif len(tok) > 1:
+                in_string = False
+                stack.clear()  # a fence line inside a "string": give up on those braces
+                kids.clear()
+            continue
+        if c == "{":
+            stack.append(pos)
+            kids.append(None)
+        elif c == "}":
+            if stack:
+                span = (stack.pop(), pos + 1, kids.pop() or [])
+                if not stack:
+                    objects.append(span)
+                elif kids[-1] is None:
+                    kids[-1] = [span]
+                else:
+                    kids[-1].append(span)
+        elif c == '"':
+            if stack:
+                in_string = True
+        elif c == "\n" or c == "\\":
+            continue
+        else:
+            # fence line (JSON strings cannot span lines, so this is never inside one)
+            if fence is None:
+                fence = (tok.strip()[3:].strip().lower(), m.end() + 1)
+            else:
+                fences.append((fence[0], text[fence[1]:pos]))
+                fence = None
+    # braces that never closed: their closed children are still candidates
+    if stack:
+        for children in kids:
+            if children:
+                objects.extend(children)
+        objects.sort(key=lambda o: o[0])
+    return objects, fences
+
+def _best_object(text: str, objects: List[Tuple[int, int, list]]) -> Optional[Dict[str, Any]]:
+    # first dict with a usable "command" wins, else the first dict
+    first_dict: Optional[Dict[str, Any]] = None
+    budget = _MAX_PARSE_ATTEMPTS
+    pending = list(reversed(objects))
+    while pending and budget > 0:
+        start, end, children = pending.pop()
+        budget -= 1
+        try:
+            obj = json.loads(text[start:end])
+        except ValueError:
+            # outer span is not JSON; its nested objects may be
+            pending.extend(reversed(children))
+            continue
+        if not isinstance(obj, dict):
+            continue
+        cmd = obj.get("command")
+        if isinstance(cmd, str) and cmd.strip():
+            return obj
+        if first_dict is None:
+            first_dict = obj
+    return first_dict
 
 def extract_json_like(text: str) -> Optional[Dict[str, Any]]:
     """
     Try to find a JSON object in text. Return parsed dict or None.
+    Every candidate object (bare or inside ``` fences) is found in one linear
+    pass; the first one carrying a "command" string is preferred.
     """
     text = text.strip()
-    # Attempt direct JSON parse
-    try:
-        return json.loads(text)
-    except Exception:
-        pass
-    # Attempt to locate first {...} block
-    m = re.search(r"\{.*\}", text, flags=re.DOTALL)
-    if m:
-        candidate = m.group(0)
+    # fast path: the whole reply is the object
+    if text.startswith("{") and text.endswith("}"):
         try:
-            return json.loads(candidate)
-        except Exception:
+            obj = json.loads(text)
+            if isinstance(obj, dict):
+                return obj
+        except ValueError:
             pass
-    return None
+    objects, _ = scan_candidates(text)
+    return _best_object(text, objects)
 
 def parse_command_from_model(text: str) -> Optional[str]:
     """
     Parse the 'command' field from model text.
-    If no JSON found, try to heuristically extract last code-ish line.
+    If no JSON found, use the last shell code fence, then the last code-ish line.
     """
+    text = text.strip()
     obj = extract_json_like(text)
-    if obj and "command" in obj and isinstance(obj["command"], str):
-        cmd = obj["command"].strip()
-        return _normalize_whitespace(cmd)
-    # Fallback: heuristics - look for lines with backticks or starting with common commands
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
-    # prefer last line that looks like a shell command
+    if obj and isinstance(obj.get("command"), str) and obj["command"].strip():
+        return _normalize_whitespace(obj["command"])
+    _, fences = scan_candidates(text)
+    for lang, body in reversed(fences):
+        if lang in _SHELL_FENCES:
+            cmd = _last_command_line(body.splitlines())
+            if cmd:
+                return cmd
+    # Fallback: heuristics - last line that looks like a shell command
+    return _last_command_line(l for l in text.splitlines() if not l.lstrip().startswith("```"))
+
+def _last_command_line(lines) -> Optional[str]:
     candidate = None
-    for line in reversed(lines):
-        if line.startswith("```") or line.startswith("```sh"):
-            # skip fences
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
             continue
-        if re.search(r"[a-zA-Z0-9\-\_/\.]+\s", line) or line.startswith("echo") or line.startswith("ls"):
+        if _CMDISH.search(line) or line.startswith("echo") or line.startswith("ls"):
             candidate = line
-            break
     if candidate:
-        # strip fences and code markers
-        candidate = re.sub(r"^`+|`+$", "", candidate).strip()
-        return _normalize_whitespace(candidate)
+        # strip inline code markers and shell prompts
+        candidate = _PROMPT.sub("", _BACKTICKS.sub("", candidate).strip())
+        return _normalize_whitespace(candidate) or None
     return None
 
 def _normalize_whitespace(cmd: str) -> str:
     # remove leading/trailing spaces and collapse multiple spaces
-    return re.sub(r"\s+", " ", cmd).strip()
+    return _WS.sub(" ", cmd).strip()
+
+_STAGE_SEPARATORS = frozenset(("|", "||", "&&", ";", "&", "|&", ";;"))
+# prefixes that run a later word as the command -> their options that take a separate value
+_WRAPPERS: Dict[str, frozenset] = {
+    "sudo": frozenset(("-u", "-g", "-C", "-D", "-h", "-p", "-r", "-t", "-U")),
+    "env": frozenset(("-u", "-C", "-S")),
+    "nice": frozenset(("-n",)),
+    "timeout": frozenset(("-s", "-k")),
+    "xargs": frozenset(("-I", "-n", "-P", "-d", "-E", "-L", "-s", "-a")),
+    "stdbuf": frozenset(("-i", "-o", "-e")),
+    "nohup": frozenset(), "time": frozenset(), "exec": frozenset(), "command": frozenset(), "builtin": frozenset(),
+}
+_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+def split_pipeline(cmd: str) -> List[List[str]]:
+    """
+    Split a command line into stages at |, &&, ||, ; and & (shell quoting respected).
+    Redirections such as 2>&1 stay attached to their stage.
+    """
+    lex = shlex.shlex(cmd, posix=True, punctuation_chars=";&|")
+    lex.whitespace_split = True
+    try:
+        tokens = list(lex)
+    except ValueError:  # unbalanced quotes
+        tokens = cmd.split()
+    stages: List[List[str]] = [[]]
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok == "&" and stages[-1] and stages[-1][-1].endswith((">", "<")):
+            # 2>&1, >&2: glue the fd back onto the redirection
+            stages[-1][-1] += "&" + (tokens[i + 1] if i + 1 < len(tokens) else "")
+            i += 2
+            continue
+        if tok in _STAGE_SEPARATORS:
+            stages.append([])
+        else:
+            stages[-1].append(tok)
+        i += 1
+    return [s for s in stages if s]
+
+def stage_command(tokens: List[str]) -> Optional[int]:
+    """
+    Index of the word a stage actually runs, skipping VAR=value assignments and
+    wrappers like sudo/env/nice (with their options). None if there is none.
+    """
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if _ASSIGNMENT.match(tok):
+            i += 1
+        elif tok in _WRAPPERS:
+            takes_value = _WRAPPERS[tok]
+            i += 1
+            while i < len(tokens) and (tokens[i].startswith("-") or _ASSIGNMENT.match(tokens[i])):
+                i += 2 if tokens[i] in takes_value else 1
+            if tok == "timeout" and i < len(tokens):
+                i += 1  # the duration
+        else:
+            return i
+    return None
+
+_COMMAND_KEY = re.compile(r'"command"\s*:\s*"')
+
+class IncrementalCommandParser:
+    """
+    Watches streamed model output and reports the "command" value as soon as its
+    JSON string is closed, before the rest of the object has arrived.
+    Each chunk is scanned once; total work is linear in the output size.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._key_scan = 0          # where to resume looking for the key
+        self._key_floor = 0         # keys before this offset were already rejected
+        self._value_start: int | None = None
+        self._value_scan = 0        # where to resume looking for the closing quote
+        self._escaped = False
+        self.command: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return self._buf
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        Add a chunk. Returns the command the first time it becomes complete, else None.
+        """
+        self._buf += chunk
+        buf = self._buf
+        while self.command is None:
+            if self._value_start is None:
+                # the key may straddle chunks, so back up by its maximum length (never
+                # before a value already rejected)
+                m = _COMMAND_KEY.search(buf, max(self._key_floor, self._key_scan - 16))
+                if m is None:
+                    self._key_scan = len(buf)
+                    return None
+                self._value_start = self._value_scan = m.end()
+                self._escaped = False
+            end = self._closing_quote(buf)
+            if end is None:
+                return None
+            try:
+                value = json.loads(buf[self._value_start - 1:end + 1])
+            except ValueError:
+                value = None
+            if isinstance(value, str) and value.strip():
+                self.command = _normalize_whitespace(value)
+                return self.command
+            # not a usable command string; keep watching for another key
+            self._value_start = None
+            self._key_floor = self._key_scan = end + 1
+        return None
+
+    def _closing_quote(self, buf: str) -> Optional[int]:
+        i = self._value_scan
+        escaped = self._escaped
+        n = len(buf)
+        while i < n:
+            c = buf[i]
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                return i
+            i += 1
+        self._value_scan = i
+        self._escaped = escaped
+        return None
@@ -0,0 +1,209 @@
+"""
+pathindex.py
+Index of the executables reachable through $PATH.
+
+Every PATH directory is listed once and the result is cached on disk
+(marshal) with the directory's mtime. Installing or removing a program
+changes its directory's mtime, so on load only directories whose mtime moved
+are listed again. Used by the validator (commands that cannot run on this
+host) and by the prompt builder (which tools the model may rely on).
+"""
+
+from __future__ import annotations
+import marshal
+import os
+import stat
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from flyn.config.loader import get_config
+from flyn.core.parser import split_pipeline, stage_command
+
+_VERSION = 1
+_CHECK_INTERVAL = 5.0  # long-running processes re-stat PATH at most this often
+
+# always available: shell builtins and keywords
+SHELL_BUILTINS = frozenset((
+    ":", ".", "[", "[[", "{", "}", "!", "alias", "bg", "bind", "break", "builtin", "cd", "command", "continue",
+    "declare", "dirs", "disown", "echo", "enable", "eval", "exec", "exit", "export", "false", "fc", "fg",
+    "getopts", "hash", "help", "history", "jobs", "kill", "let", "local", "logout", "popd", "printf", "pushd",
+    "pwd", "read", "readonly", "return", "set", "shift", "shopt", "source", "suspend", "test", "times", "trap",
+    "true", "type", "typeset", "ulimit", "umask", "unalias", "unset", "wait", "if", "then", "else", "elif", "fi",
+    "for", "while", "until", "do", "done", "case", "esac", "function", "select", "time", "in",
+))
+
+# candidates for the prompt's tool list: listed only when installed
+PROMPT_TOOLS = (
+    "rg", "fd", "fdfind", "jq", "yq", "fzf", "bat", "eza", "exa", "tree", "gawk", "sd", "ag", "ack",
+    "git", "gh", "docker", "podman", "kubectl", "helm", "terraform", "aws", "gcloud", "az",
+    "curl", "wget", "httpie", "http", "rsync", "scp", "ssh", "nc", "ss", "netstat", "dig", "nslookup", "ip",
+    "python3", "python", "node", "npm", "pnpm", "yarn", "deno", "go", "cargo", "ruby", "perl", "java",
+    "make", "cmake", "gcc", "clang", "ffmpeg", "convert", "magick", "pandoc", "sqlite3", "psql", "mysql",
+    "redis-cli", "zip", "unzip", "7z", "zstd", "xz", "pigz", "parallel", "entr", "watch", "htop", "lsof",
+    "strace", "systemctl", "journalctl", "brew", "apt", "dnf", "pacman",
+)
+
+def _is_executable(entry: os.DirEntry) -> bool:
+    try:
+        st = entry.stat()
+    except OSError:
+        return False
+    return stat.S_ISREG(st.st_mode) and bool(st.st_mode & 0o111)
+
+def _scan(directory: str) -> List[str]:
+    names = []
+    pathext = [e.lower() for e in os.getenv("PATHEXT", ".EXE;.BAT;.CMD").split(";") if e] if os.name == "nt" else []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if pathext:
+                    stem, ext = os.path.splitext(entry.name)
+                    if ext.lower() in pathext and entry.is_file():
+                        names.append(stem.lower())
+                elif _is_executable(entry):
+                    names.append(entry.name)
+    except OSError:
+        pass
+    return names
+
+def path_dirs(path: Optional[str] = None) -> List[str]:
+    raw = os.environ.get("PATH", "") if path is None else path
+    return list(dict.fromkeys(d for d in raw.split(os.pathsep) if d))
+
+class PathIndex:
+    def __init__(self, cache_path: Optional[Path] = None, path: Optional[str] = None):
+        self.cache_path = cache_path
+        self.path = path
+        self._where: Dict[str, str] = {}
+        self._dirs: Dict[str, list] = {}
+        self._checked = 0.0
+        self._version = 0  # bumped whenever the name -> directory map is rebuilt
+        self.refresh()
+
+    def refresh(self) -> int:
+        """
+        Re-list PATH directories whose mtime changed. Returns how many were listed.
+        """
+        self._checked = time.monotonic()
+        cached = self._dirs or self._read_cache()
+        dirs: Dict[str, list] = {}
+        listed = 0
+        for d in path_dirs(self.path):
+            try:
+                mtime = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+            prev = cached.get(d)
+            if prev is not None and prev[0] == mtime:
+                dirs[d] = prev
+            else:
+                dirs[d] = [mtime, _scan(d)]
+                listed += 1
+        changed = listed or set(dirs) != set(cached)
+        self._dirs = dirs
+        if changed or not self._where:
+            where: Dict[str, str] = {}
+            for d, (_, names) in dirs.items():
+                for name in names:
+                    where.setdefault(name, d)  # first PATH entry wins, like the shell
+            self._where = where
+            self._version += 1
+        if changed:
+            self._write_cache()
+        return listed
+
+    def _read_cache(self) -> Dict[str, list]:
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path, "rb") as f:
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != _VERSION:
+            return {}
+        return data.get("dirs", {})
+
+    def _write_cache(self) -> None:
+        if self.cache_path is None:
+            return
+        tmp = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                marshal.dump({"version": _VERSION, "dirs": self._dirs}, f)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass
+
+    def _maybe_refresh(self) -> None:
+        if time.monotonic() - self._checked > _CHECK_INTERVAL:
+            self.refresh()
+
+    def version(self) -> int:
+        """
+        Changes whenever the set of indexed executables may have changed.
+        """
+        self._maybe_refresh()
+        return self._version
+
+    def which(self, name: str) -> Optional[str]:
+        self._maybe_refresh()
+        d = self._where.get(name.lower() if os.name == "nt" else name)
+        return os.path.join(d, name) if d else None
+
+    def has(self, name: str) -> bool:
+        return name in SHELL_BUILTINS or self.which(name) is not None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def available(self, candidates) -> List[str]:
+        return [c for c in candidates if self.which(c) is not None]
+
+def _word_available(index: PathIndex, word: str, cwd: Optional[Path]) -> bool:
+    word = word.strip("(){}")
+    if not word or any(c in word for c in "$`*?"):
+        return True  # expansions: cannot tell before the shell runs
+    if "/" in word:
+        path = Path(word).expanduser()
+        if not path.is_absolute():
+            if cwd is None:
+                return True  # relative to wherever it ends up running
+            path = cwd / path
+        return os.access(path, os.X_OK) and path.is_file()
+    return index.has(word)
+
+def missing_commands(cmd: str, index: Optional["PathIndex"] = None, cwd: Optional[Path] = None) -> List[str]:
+    """
+    Command words of cmd's pipeline stages that are neither builtins nor
+    installed (in order, without duplicates).
+    """
+    index = index or get_path_index()
+    missing: List[str] = []
+    for tokens in split_pipeline(cmd):
+        at = stage_command(tokens)
+        if at is None:
+            continue
+        word = tokens[at]
+        if word not in missing and not _word_available(index, word, cwd):
+            missing.append(word)
+    return missing
+
+def prompt_tools() -> List[str]:
+    """
+    Installed tools worth telling the model about (backend.prompt_tools, else PROMPT_TOOLS).
+    """
+    cfg = get_config()
+    candidates = cfg.get("backend.prompt_tools") or PROMPT_TOOLS
+    limit = int(cfg.get("backend.prompt_tools_max", 60))
+    return get_path_index().available(candidates)[:limit]
+
+_index: Optional[PathIndex] = None
+
+def get_path_index() -> PathIndex:
+    global _index
+    if _index is None:
+        path = get_config().get("executor.path_index") or "~/.cache/flyn/path_index.marshal"
+        _index = PathIndex(Path(path).expanduser())
+    return _index
@@ -0,0 +1,296 @@
+"""
+preview.py
+Filesystem-effect preview for dry runs.
+
+The safe workdir is snapshotted next to itself as a tree of reflinks
+(copy-on-write clones: metadata only, no file data is copied, and the
+original files never change). The command runs inside the snapshot under a
+short timeout, the tree is diffed (created, deleted and modified paths with
+their sizes) and the snapshot is removed.
+
+Reflinks need a filesystem that supports them (btrfs, XFS, bcachefs, ZFS 2.2+).
+Elsewhere the snapshot can be made of hardlinks, but only when
+executor.preview_hardlinks is set: a hardlink shares its inode with the
+original, so a command that writes a file in place (`>>`, `truncate`,
+`dd conv=notrunc`) changes the original as well. Commands that name paths outside
+the workdir (absolute paths, `..`, `~`, expansions) are not previewed, and
+neither are workdirs holding symlinks that lead out of it, since their effects
+would not be inside the snapshot.
+
+Only the filesystem is contained: the command really runs, so anything else
+it does (signals, network requests, `git push`) happens. Commands that need
+confirmation are previewed only once confirmed.
+"""
+
+from __future__ import annotations
+import errno
+import os
+import re
+import shlex
+import shutil
+import stat
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from flyn.config.loader import get_config
+from flyn.core import tracing
+from flyn.core.parser import split_pipeline, stage_command
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int), linux/fs.h
+
+# errors meaning "this filesystem cannot do that", as opposed to a problem with one file
+_UNSUPPORTED = frozenset((errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS))
+
+# harmless absolute paths a command may name
+_DEVICES = re.compile(r"/dev/(?:null|stdout|stderr|zero|u?random)\b")
+# an absolute path, a parent reference, a home directory or an expansion anywhere in a word
+_OUTSIDE = re.compile(r"(?<![\w.])/|(?<![\w.])\.\.(?:/|$)|(?<![\w.])~|[$`]")
+
+# stat summary per relative path: (kind, size, mtime_ns); kind is "f", "d" or "l"
+Manifest = Dict[str, Tuple[str, int, int]]
+
+class Unsupported(OSError):
+    pass
+
+class Escapes(OSError):
+    # a symlink in the workdir leads outside it; the snapshot would share its target
+    pass
+
+def escaping_path(cmd: str) -> Optional[str]:
+    """
+    The first word of cmd that may refer to something outside the working
+    directory, or None. Command words themselves may be absolute (/usr/bin/env).
+    """
+    for tokens in split_pipeline(cmd):
+        at = stage_command(tokens)
+        for i, tok in enumerate(tokens):
+            if i == at and not any(c in tok for c in "$`"):
+                continue
+            if _OUTSIDE.search(_DEVICES.sub("", tok)):
+                return tok
+    return None
+
+def _reflink(src: str, dst: str, st: os.stat_result) -> Tuple[int, int]:
+    fd_in = os.open(src, os.O_RDONLY)
+    try:
+        fd_out = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, st.st_mode & 0o7777)
+        try:
+            fcntl.ioctl(fd_out, FICLONE, fd_in)
+        except OSError as e:
+            os.close(fd_out)
+            os.unlink(dst)
+            if e.errno in _UNSUPPORTED:
+                raise Unsupported(e.errno, f"reflinks not supported: {e.strerror}") from e
+            raise
+        clone = os.fstat(fd_out)
+        os.close(fd_out)
+    finally:
+        os.close(fd_in)
+    return clone.st_size, clone.st_mtime_ns
+
+def _hardlink(src: str, dst: str, st: os.stat_result) -> Tuple[int, int]:
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno in _UNSUPPORTED:
+            raise Unsupported(e.errno, f"hardlinks not supported: {e.strerror}") from e
+        raise
+    return st.st_size, st.st_mtime_ns  # same inode
+
+def _inside(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+def _clone_tree(src: str, dst: str, link, manifest: Manifest, rel: str = "", root: Optional[str] = None) -> int:
+    """
+    Mirror src into dst (already created) with link(src, dst, stat) -> (size, mtime_ns)
+    per regular file; fill manifest with the snapshot's own stats. Returns the number of files skipped
+    because they could not be read. Raises Escapes for a symlink that is absolute or
+    resolves outside src: in the snapshot it would still reach the real target.
+    """
+    root = os.path.realpath(src) if root is None else root
+    skipped = 0
+    with os.scandir(src) as it:
+        entries = list(it)
+    for entry in entries:
+        path = f"{rel}/{entry.name}" if rel else entry.name
+        target = os.path.join(dst, entry.name)
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            skipped += 1
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            os.mkdir(target, st.st_mode & 0o7777 | 0o700)
+            skipped += _clone_tree(entry.path, target, link, manifest, path, root)
+            manifest[path] = ("d", 0, 0)
+        elif stat.S_ISLNK(st.st_mode):
+            dest = os.readlink(entry.path)
+            if os.path.isabs(dest) or not _inside(os.path.realpath(entry.path), root):
+                raise Escapes(errno.EXDEV, f"symlink {path} -> {dest} leads outside the working directory")
+            os.symlink(dest, target)
+            manifest[path] = ("l", 0, 0)
+        elif stat.S_ISREG(st.st_mode):
+            try:
+                size, mtime = link(entry.path, target, st)
+            except Unsupported:
+                raise
+            except OSError:
+                skipped += 1
+                continue
+            manifest[path] = ("f", size, mtime)
+        # sockets, fifos and devices are left out
+    return skipped
+
+def scan_tree(root: str, rel: str = "", manifest: Optional[Manifest] = None) -> Manifest:
+    manifest = {} if manifest is None else manifest
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return manifest
+    for entry in entries:
+        path = f"{rel}/{entry.name}" if rel else entry.name
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            manifest[path] = ("d", 0, 0)
+            scan_tree(entry.path, path, manifest)
+        elif stat.S_ISLNK(st.st_mode):
+            manifest[path] = ("l", 0, 0)
+        else:
+            manifest[path] = ("f", st.st_size, st.st_mtime_ns)
+    return manifest
+
+def diff_manifests(before: Manifest, after: Manifest) -> Dict[str, list]:
+    """
+    {created: [[path, size]], deleted: [[path, size]], modified: [[path, old_size, new_size]]},
+    sorted by path. A path whose type changed counts as deleted and created.
+    """
+    created, deleted, modified = [], [], []
+    for path, (kind, size, mtime) in after.items():
+        old = before.get(path)
+        if old is None or old[0] != kind:
+            created.append([path + ("/" if kind == "d" else ""), size])
+        elif kind == "f" and (old[1] != size or old[2] != mtime):
+            modified.append([path, old[1], size])
+    for path, (kind, size, _) in before.items():
+        new = after.get(path)
+        if new is None or new[0] != kind:
+            deleted.append([path + ("/" if kind == "d" else ""), size])
+    return {"created": sorted(created), "deleted": sorted(deleted), "modified": sorted(modified)}
+
+def _methods() -> List[Tuple[str, Any]]:
+    methods: List[Tuple[str, Any]] = []
+    if fcntl is not None:
+        methods.append(("reflink", _reflink))
+    if get_config().get("executor.preview_hardlinks", False):
+        methods.append(("hardlink", _hardlink))
+    return methods
+
+def snapshot(src: Path) -> Tuple[Path, str, Manifest, int]:
+    """
+    Clone src next to itself. Returns (snapshot dir, method, manifest, files skipped).
+    Raises Unsupported when no allowed method works on this filesystem.
+    """
+    reasons = []
+    for method, link in _methods():
+        dst = src.parent / f".{src.name}.preview-{os.getpid()}-{time.monotonic_ns()}"
+        os.mkdir(dst, 0o700)
+        manifest: Manifest = {}
+        try:
+            skipped = _clone_tree(str(src), str(dst), link, manifest)
+            return dst, method, manifest, skipped
+        except Unsupported as e:
+            reasons.append(str(e.strerror))
+        except BaseException:
+            shutil.rmtree(dst, ignore_errors=True)
+            raise
+        shutil.rmtree(dst, ignore_errors=True)
+    if not get_config().get("executor.preview_hardlinks", False):
+        reasons.append("hardlink snapshots are off (executor.preview_hardlinks)")
+    raise Unsupported(errno.EOPNOTSUPP, "; ".join(reasons) or "no snapshot method available")
+
+def _cap(items: list, limit: int) -> list:
+    return items if len(items) <= limit else items[:limit]
+
+def preview(cmd: str, workdir: Path, shell: bool = False, timeout: Optional[float] = None,
+            confirmed: bool = False) -> Dict[str, Any]:
+    """
+    Run cmd against a snapshot of workdir and report what it changed:
+    {method, files, created, deleted, modified, changes, truncated, rc, ok, stdout, stderr,
+    timed_out, snapshot_ms, run_ms}, or {skipped: reason} when no preview was possible.
+    shell=True runs cmd with `sh -c` (session mode semantics), else as an argv.
+    The command really runs, so one that needs confirmation requires confirmed=True.
+    """
+    from flyn.core import safety
+    cfg = get_config()
+    verdict = safety.analyze(cmd)
+    if (verdict.dangerous or verdict.needs_confirmation) and not confirmed:
+        return {"skipped": "the preview runs the command, which needs confirmation (--confirm)"}
+    if shell:
+        args = [cfg.get("executor.session_shell") or "/bin/sh", "-c", cmd]
+    else:
+        try:
+            args = shlex.split(cmd)
+        except ValueError as e:  # e.g. an unbalanced quote
+            return {"skipped": f"preview unavailable: cannot split the command ({e})"}
+    escaping = escaping_path(cmd)
+    if escaping is not None:
+        return {"skipped": f"command refers to paths outside the working directory ({escaping})"}
+    timeout = float(cfg.get("executor.preview_timeout_seconds", 5) if timeout is None else timeout)
+    limit = int(cfg.get("executor.preview_max_entries", 200))
+    head = int(cfg.get("executor.capture_head_bytes", 64 * 1024))
+    with tracing.span("preview.snapshot") as sp:
+        t0 = time.perf_counter()
+        try:
+            snap, method, before, skipped = snapshot(workdir)
+        except Unsupported as e:
+            return {"skipped": f"no copy-on-write snapshot: {e.strerror}"}
+        except Escapes as e:
+            return {"skipped": e.strerror}
+        except OSError as e:
+            return {"skipped": f"snapshot failed: {e}"}
+        snapshot_ms = (time.perf_counter() - t0) * 1000
+        sp.set(method=method, files=len(before))
+    try:
+        t1 = time.perf_counter()
+        with tracing.span("preview.run"):
+            try:
+                proc = subprocess.run(args, cwd=str(snap), stdin=subprocess.DEVNULL, capture_output=True,
+                                      text=True, errors="replace", timeout=timeout)
+                rc, out, err, timed_out = proc.returncode, proc.stdout, proc.stderr, False
+            except subprocess.TimeoutExpired as e:
+                rc, timed_out = None, True
+                out = e.stdout.decode("utf-8", "replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+                err = f"timeout: preview stopped after {timeout:g} seconds"
+            except OSError as e:
+                rc, out, err, timed_out = None, "", f"could not start: {e}", False
+        run_ms = (time.perf_counter() - t1) * 1000
+        with tracing.span("preview.diff"):
+            changes = diff_manifests(before, scan_tree(str(snap)))
+    finally:
+        shutil.rmtree(snap, ignore_errors=True)
+    total = sum(len(v) for v in changes.values())
+    return {
+        "method": method,
+        "files": len(before),
+        "unreadable": skipped,
+        **{k: _cap(v, limit) for k, v in changes.items()},
+        "changes": total,
+        "truncated": total > sum(min(len(v), limit) for v in changes.values()),
+        "rc": rc,
+        "ok": rc == 0,
+        "timed_out": timed_out,
+        "stdout": out[:head],
+        "stderr": err[:head],
+        "snapshot_ms": round(snapshot_ms, 2),
+        "run_ms": round(run_ms, 2),
+    }
@@ -0,0 +1,396 @@
+"""
+ratelimit.py
+Host-wide rate limiting for backend calls.
+
+Every flyn process on the host (shells, cron jobs, CI shards, the daemon)
+shares one SQLite file holding, per provider, a token bucket
+(requests_per_minute, burst) and the leases of calls in flight
+(max_concurrent). A call takes a token and a lease before it goes out and
+returns the lease when it is done; a crashed process's leases expire after
+ratelimit.lease_seconds.
+
+Calls run in one of two lanes. Batch calls (`run --batch`, `show --batch`)
+hold back while an interactive call is waiting and never take the last
+ratelimit.interactive_reserve slots. A 429 seen by the transport empties the
+bucket and pauses the provider for every process until its Retry-After has
+passed, instead of each process retrying on its own.
+
+Limits are opt-in: only providers with a [ratelimit.providers.<name>] table
+are limited, and backends that answer in-process (`remote = False`, e.g. the
+keyless simulated Google backend) never are.
+"""
+
+from __future__ import annotations
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from flyn.config.loader import get_config
+from flyn.core import tracing
+from flyn.core.generation_backends.transport import TransportError
+
+LANES = ("interactive", "batch")
+
+_POLL = 0.05      # re-check interval while waiting for a free slot
+_MAX_SLEEP = 1.0  # never sleep longer than this between checks
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    provider TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY,
+    provider TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    lane TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS waiters (
+    id INTEGER PRIMARY KEY,
+    provider TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    lane TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leases_provider ON leases(provider);
+CREATE INDEX IF NOT EXISTS waiters_provider ON waiters(provider, lane);
+"""
+
+_lane: ContextVar[str] = ContextVar("flyn_ratelimit_lane", default="interactive")
+# (limiter, provider) of the lease held by the current call, for 429 feedback
+_held: ContextVar[Optional[tuple]] = ContextVar("flyn_ratelimit_held", default=None)
+
+class RateLimited(TransportError):
+    def __init__(self, message: str):
+        super().__init__(message, status=429)
+
+def limits_for(provider: str) -> Optional[Dict[str, float]]:
+    """
+    {rate (tokens per second), burst, concurrent, reserve} for provider:
+    [ratelimit.providers.<provider>] over the [ratelimit] defaults. None when the
+    provider has no such table or is unlimited (no rate and no concurrency cap).
+    """
+    cfg = get_config()
+    if not isinstance(cfg.get(f"ratelimit.providers.{provider}"), dict):
+        return None
+
+    def opt(key: str, default: float) -> float:
+        value = cfg.get(f"ratelimit.providers.{provider}.{key}")
+        return float(cfg.get(f"ratelimit.{key}", default) if value is None else value)
+
+    rpm = opt("requests_per_minute", 0)
+    concurrent = int(opt("max_concurrent", 0))
+    if rpm <= 0 and concurrent <= 0:
+        return None
+    return {
+        "rate": rpm / 60.0 if rpm > 0 else 0.0,
+        "burst": max(1.0, opt("burst", 1)),
+        "concurrent": max(0, concurrent),
+        "reserve": max(0, int(opt("interactive_reserve", 0))),
+    }
+
+def _alive(pid: int) -> bool:
+    if os.name != "posix":
+        return True  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+class RateLimiter:
+    def __init__(self, path: Path, lease_seconds: float = 120.0, max_wait_seconds: float = 60.0):
+        self.path = Path(path)
+        self.lease_seconds = float(lease_seconds)
+        self.max_wait_seconds = float(max_wait_seconds)
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()  # one connection per process; transactions must not interleave
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(db, *args)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def _try(self, provider: str, lim: Dict[str, float], lane: str,
+             waiter: Optional[int]) -> Tuple[Optional[int], float, Optional[int]]:
+        """
+        One attempt: take a token and a lease if the provider allows it. Returns
+        (lease, 0, None) on success, else (None, seconds to wait, waiter row).
+        """
+        return self._transaction(self._try_locked, provider, lim, lane, waiter)
+
+    def _try_locked(self, db: sqlite3.Connection, provider: str, lim: Dict[str, float], lane: str,
+                    waiter: Optional[int]) -> Tuple[Optional[int], float, Optional[int]]:
+        now = time.time()
+        db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+        db.execute("DELETE FROM waiters WHERE expires < ?", (now,))
+        row = db.execute("SELECT tokens, updated, blocked_until FROM buckets WHERE provider = ?", (provider,)).fetchone()
+        tokens, updated, blocked = row if row is not None else (lim["burst"], now, 0.0)
+        if lim["rate"]:
+            tokens = min(lim["burst"], tokens + max(0.0, now - updated) * lim["rate"])
+        wait = self._wait_needed(db, provider, lim, lane, waiter, tokens, blocked, now)
+        lease = None
+        if wait <= 0:
+            if lim["rate"]:
+                tokens -= 1
+            lease = db.execute("INSERT INTO leases(provider, pid, lane, expires) VALUES (?, ?, ?, ?)",
+                               (provider, os.getpid(), lane, now + self.lease_seconds)).lastrowid
+            if waiter is not None:
+                db.execute("DELETE FROM waiters WHERE id = ?", (waiter,))
+                waiter = None
+        elif waiter is None:
+            waiter = db.execute("INSERT INTO waiters(provider, pid, lane, expires) VALUES (?, ?, ?, ?)",
+                                (provider, os.getpid(), lane, now + wait + _MAX_SLEEP)).lastrowid
+        else:
+            db.execute("UPDATE waiters SET expires = ? WHERE id = ?", (now + wait + _MAX_SLEEP, waiter))
+        db.execute("INSERT OR REPLACE INTO buckets(provider, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)",
+                   (provider, tokens, now, blocked))
+        return lease, wait, waiter
+
+    def _wait_needed(self, db: sqlite3.Connection, provider: str, lim: Dict[str, float], lane: str,
+                     waiter: Optional[int], tokens: float, blocked: float, now: float) -> float:
+        if blocked > now:
+            return blocked - now
+        if lane != "interactive" and db.execute(
+                "SELECT 1 FROM waiters WHERE provider = ? AND lane = 'interactive' LIMIT 1", (provider,)).fetchone():
+            return _POLL
+        if lim["concurrent"]:
+            cap = lim["concurrent"] - (lim["reserve"] if lane != "interactive" else 0)
+            if self._in_flight(db, provider) >= max(1, cap) and self._prune_dead(db, provider) >= max(1, cap):
+                return _POLL
+        if lim["rate"] and tokens < 1:
+            return (1 - tokens) / lim["rate"]
+        return 0.0
+
+    def _in_flight(self, db: sqlite3.Connection, provider: str) -> int:
+        return db.execute("SELECT COUNT(*) FROM leases WHERE provider = ?", (provider,)).fetchone()[0]
+
+    def _prune_dead(self, db: sqlite3.Connection, provider: str) -> int:
+        # only consulted when the cap is reached: free slots of processes that died mid-call
+        rows = db.execute("SELECT id, pid FROM leases WHERE provider = ?", (provider,)).fetchall()
+        dead = [(i,) for i, pid in rows if not _alive(pid)]
+        if dead:
+            db.executemany("DELETE FROM leases WHERE id = ?", dead)
+        return len(rows) - len(dead)
+
+    def _deadline_error(self, provider: str) -> RateLimited:
+        return RateLimited(f"rate limited: no {provider} slot within {self.max_wait_seconds:g}s")
+
+    def _drop_waiter(self, waiter: Optional[int]) -> None:
+        if waiter is not None:
+            try:
+                with self._lock:
+                    self._db().execute("DELETE FROM waiters WHERE id = ?", (waiter,))
+            except (sqlite3.Error, OSError):
+                pass
+
+    def acquire(self, provider: str, lim: Dict[str, float], lane: str = "interactive") -> int:
+        """
+        Block until provider has a token and a free slot for lane; return the lease.
+        Raises RateLimited after ratelimit.max_wait_seconds.
+        """
+        deadline = time.monotonic() + self.max_wait_seconds
+        waiter = None
+        try:
+            while True:
+                lease, wait, waiter = self._try(provider, lim, lane, waiter)
+                if lease is not None:
+                    return lease
+                if time.monotonic() + min(wait, _MAX_SLEEP) > deadline:
+                    raise self._deadline_error(provider)
+                time.sleep(min(wait, _MAX_SLEEP) + random.uniform(0, _POLL / 2))
+        finally:
+            if waiter is not None:
+                self._drop_waiter(waiter)
+
+    async def aacquire(self, provider: str, lim: Dict[str, float], lane: str = "interactive") -> int:
+        """
+        Async `acquire`; the SQLite work runs in a worker thread so a busy database
+        never stalls the event loop.
+        """
+        import asyncio
+        deadline = time.monotonic() + self.max_wait_seconds
+        waiter = None
+        try:
+            while True:
+                lease, wait, waiter = await asyncio.to_thread(self._try, provider, lim, lane, waiter)
+                if lease is not None:
+                    return lease
+                if time.monotonic() + min(wait, _MAX_SLEEP) > deadline:
+                    raise self._deadline_error(provider)
+                await asyncio.sleep(min(wait, _MAX_SLEEP) + random.uniform(0, _POLL / 2))
+        finally:
+            if waiter is not None:
+                self._drop_waiter(waiter)
+
+    def release(self, lease: int) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM leases WHERE id = ?", (lease,))
+
+    def penalize(self, provider: str, seconds: float) -> None:
+        """
+        The provider answered 429: empty its bucket and pause it for seconds, for
+        every process sharing this database.
+        """
+        now = time.time()
+        with self._lock:
+            self._db().execute("UPDATE buckets SET tokens = MIN(tokens, 0), updated = ?, "
+                               "blocked_until = MAX(blocked_until, ?) WHERE provider = ?",
+                               (now, now + max(0.0, seconds), provider))
+
+    def status(self) -> Dict[str, dict]:
+        """
+        {provider: {tokens, blocked_seconds, in_flight: {lane: n}, waiting: {lane: n}}}.
+        Tokens are as last written (the bucket refills lazily on the next call).
+        """
+        now = time.time()
+        db = self._db()
+        out: Dict[str, dict] = {}
+
+        def entry(provider: str) -> dict:
+            return out.setdefault(provider, {"tokens": None, "blocked_seconds": 0.0,
+                                             "in_flight": {l: 0 for l in LANES}, "waiting": {l: 0 for l in LANES}})
+
+        with self._lock:
+            for provider, tokens, blocked in db.execute("SELECT provider, tokens, blocked_until FROM buckets"):
+                row = entry(provider)
+                row["tokens"] = round(tokens, 2)
+                row["blocked_seconds"] = round(max(0.0, blocked - now), 2)
+            for table, field in (("leases", "in_flight"), ("waiters", "waiting")):
+                for provider, lane, n in db.execute(
+                        f"SELECT provider, lane, COUNT(*) FROM {table} WHERE expires >= ? GROUP BY provider, lane", (now,)):
+                    entry(provider)[field][lane] = n
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            for table in ("buckets", "leases", "waiters"):
+                db.execute(f"DELETE FROM {table}")
+
+_limiter: RateLimiter | None = None
+
+def get_limiter() -> Optional[RateLimiter]:
+    """
+    Return the process-wide limiter, or None when disabled in config.
+    """
+    global _limiter
+    cfg = get_config()
+    if not cfg.get("ratelimit.enabled", True):
+        return None
+    if _limiter is None:
+        path = Path(cfg.get("ratelimit.path") or "~/.cache/flyn/ratelimit.db").expanduser()
+        _limiter = RateLimiter(path, lease_seconds=float(cfg.get("ratelimit.lease_seconds", 120)),
+                               max_wait_seconds=float(cfg.get("ratelimit.max_wait_seconds", 60)))
+    return _limiter
+
+def _setup(provider: str, backend: Any = None) -> Tuple[Optional[RateLimiter], Optional[Dict[str, float]]]:
+    if backend is not None and not getattr(backend, "remote", True):
+        return None, None
+    lim = limits_for(provider)
+    return (get_limiter(), lim) if lim is not None else (None, None)
+
+@contextmanager
+def use_lane(lane: str):
+    """
+    Run the calls made in this block in lane ("interactive" or "batch").
+    """
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+@contextmanager
+def limit(provider: str, backend: Any = None):
+    """
+    Hold a rate limit lease on provider for the duration of the block (one backend
+    call, including a streamed response). Nothing is held for an in-process
+    backend. A broken limiter database never blocks generation.
+    """
+    limiter, lim = _setup(provider, backend)
+    lease = None
+    if limiter is not None:
+        with tracing.span("ratelimit", provider=provider, lane=_lane.get()) as sp:
+            t0 = time.monotonic()
+            try:
+                lease = limiter.acquire(provider, lim, _lane.get())
+            except (sqlite3.Error, OSError):
+                lease = None
+            sp.set(waited_ms=round((time.monotonic() - t0) * 1000, 2))
+    token = _held.set((limiter, provider) if lease is not None else None)
+    try:
+        yield
+    finally:
+        _held.reset(token)
+        if lease is not None:
+            _release(limiter, lease)
+
+@asynccontextmanager
+async def alimit(provider: str, backend: Any = None):
+    """
+    Async `limit`.
+    """
+    limiter, lim = _setup(provider, backend)
+    lease = None
+    if limiter is not None:
+        with tracing.span("ratelimit", provider=provider, lane=_lane.get()) as sp:
+            t0 = time.monotonic()
+            try:
+                lease = await limiter.aacquire(provider, lim, _lane.get())
+            except (sqlite3.Error, OSError):
+                lease = None
+            sp.set(waited_ms=round((time.monotonic() - t0) * 1000, 2))
+    token = _held.set((limiter, provider) if lease is not None else None)
+    try:
+        yield
+    finally:
+        _held.reset(token)
+        if lease is not None:
+            _release(limiter, lease)
+
+def _release(limiter: RateLimiter, lease: int) -> None:
+    try:
+        limiter.release(lease)
+    except (sqlite3.Error, OSError):
+        pass  # the lease expires on its own
+
+def note_throttled(seconds: float) -> None:
+    """
+    Called by the transport when the provider answers 429 inside a limited call.
+    """
+    held = _held.get()
+    if held is None:
+        return
+    limiter, provider = held
+    try:
+        limiter.penalize(provider, seconds)
+    except (sqlite3.Error, OSError):
+        pass
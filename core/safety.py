@@ -1,15 +1,41 @@
 """
 safety.py
 Basic detection for dangerous commands and risk scoring.
+
+The blacklist and built-in patterns are compiled once into a single
+alternation regex, so a clean command is cleared in one pass. Alternation
+matches do not overlap ("sudo rm -rf" is one match), so once something matched
+every rule is tested on its own from that position to report all that apply.
+The resulting `SafetyAnalysis` is memoized in a bounded LRU.
 """
 
 from __future__ import annotations
 import re
-from typing import List
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
 from flyn.config.loader import get_config
+from flyn.core import tracing
 
 DEFAULT_BLACKLIST = ["rm -rf", "rm -r", "rm", "dd", "mkfs", ">:","chmod 777", "chown 0:0", "sudo rm"]
 
+# (rule name, regex, risk) for checks that are not plain blacklist tokens
+_BUILTIN_RULES: Tuple[Tuple[str, str, str], ...] = (
+    ("raw-device", r"/dev/sd|/dev/nvme|mkfs\.", "high"),
+    ("network-fetch", r"curl\s+http|wget\s+http|scp\s+", "medium"),
+)
+
+_RISK_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+_ANALYSIS_CACHE_SIZE = 4096
+
+@dataclass(frozen=True)
+class SafetyAnalysis:
+    risk: str
+    matched_rules: Tuple[str, ...]
+    dangerous: bool
+    needs_confirmation: bool
+
 def get_blacklist() -> List[str]:
     cfg = get_config()
     bl = cfg.get("safety.blacklist")
@@ -17,27 +43,78 @@ def get_blacklist() -> List[str]:
         return bl
     return DEFAULT_BLACKLIST
 
+def _token_pattern(token: str) -> str:
+    # whole-word match so "rm" does not fire on "format" and "dd" not on "add"
+    words = [re.escape(w) for w in token.lower().split()]
+    body = r"\s+".join(words)
+    if re.match(r"\w", token):
+        body = r"(?<![\w.-])" + body
+    if re.search(r"\w$", token):
+        body = body + r"(?![\w-])"
+    return body
+
+class _CompiledRules:
+    def __init__(self, blacklist: Tuple[str, ...]):
+        rules = [(f"blacklist:{t}", _token_pattern(t), "high") for t in blacklist if t.strip()]
+        # longer tokens first so "rm -rf" wins over "rm" at the same position
+        rules.sort(key=lambda r: len(r[0]), reverse=True)
+        rules.extend(_BUILTIN_RULES)
+        self.rules = rules
+        self.patterns = [re.compile(pat) for _, pat, _ in rules]
+        self.regex = re.compile("|".join(f"(?:{pat})" for _, pat, _ in rules))
+
+    def scan(self, cmd: str) -> Tuple[str, Tuple[str, ...]]:
+        low = cmd.lower()
+        first = self.regex.search(low)
+        if first is None:
+            return "low", ()
+        # no rule can match before the leftmost match of the alternation
+        hits = []
+        for (name, _, rule_risk), pattern in zip(self.rules, self.patterns):
+            m = pattern.search(low, first.start())
+            if m is not None:
+                hits.append((m.start(), name, rule_risk))
+        hits.sort(key=lambda h: h[0])
+        risk = max((h[2] for h in hits), key=_RISK_ORDER.__getitem__)
+        return risk, tuple(name for _, name, _ in hits)
+
+@lru_cache(maxsize=8)
+def _compiled(blacklist: Tuple[str, ...]) -> _CompiledRules:
+    return _CompiledRules(blacklist)
+
+@lru_cache(maxsize=_ANALYSIS_CACHE_SIZE)
+def _analyze(cmd: str, blacklist: Tuple[str, ...], confirm_on_danger: bool) -> SafetyAnalysis:
+    risk, matched = _compiled(blacklist).scan(cmd)
+    dangerous = risk == "high"
+    return SafetyAnalysis(
+        risk=risk,
+        matched_rules=matched,
+        dangerous=dangerous,
+        needs_confirmation=confirm_on_danger and dangerous,
+    )
+
+def analyze(cmd: str) -> SafetyAnalysis:
+    """
+    Single-pass safety verdict for cmd. Results are memoized per rule set,
+    so changing the blacklist in config is picked up on the next call.
+    """
+    cfg = get_config()
+    with tracing.span("safety"):
+        return _analyze(cmd, tuple(get_blacklist()), bool(cfg.get("general.confirm_on_danger", True)))
+
+def rule_scanner(blacklist: Optional[Tuple[str, ...]] = None) -> Callable[[str], Tuple[str, Tuple[str, ...]]]:
+    """
+    The bare scan behind `analyze`, cmd -> (risk, matched rules), without tracing
+    or memoization; for bulk work such as script audits.
+    """
+    return _compiled(tuple(get_blacklist()) if blacklist is None else blacklist).scan
+
 def is_dangerous(cmd: str) -> bool:
-    cmd_low = cmd.lower()
-    for token in get_blacklist():
-        if token.lower() in cmd_low:
-            return True
-    # pattern: redirect to device or raw disk
-    if re.search(r"/dev/sd|/dev/nvme|mkfs\.", cmd_low):
-        return True
-    return False
+    return analyze(cmd).dangerous
 
 def risk_level(cmd: str) -> str:
-    if is_dangerous(cmd):
-        return "high"
-    # network ops
-    if re.search(r"curl\s+http|wget\s+http|scp\s+", cmd):
-        return "medium"
-    return "low"
+    return analyze(cmd).risk
 
 def requires_confirmation(cmd: str) -> bool:
-    cfg = get_config()
-    if cfg.get("general.confirm_on_danger", True) and is_dangerous(cmd):
-        return True
     # also require if risk is high or confidence threshold not met is handled elsewhere
-    return False
+    return analyze(cmd).needs_confirmation
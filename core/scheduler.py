@@ -0,0 +1,319 @@
+"""
+scheduler.py
+Run many validated commands concurrently under per-child resource limits.
+
+A single thread drives everything: children are started up to `workers` at a
+time, their pipes are multiplexed with `selectors`, and exits are reaped with
+`os.wait4`, which also yields each child's CPU time and peak RSS. Results are
+yielded in completion order. Each child gets rlimits (CPU seconds, address
+space, open files, file size); output on the pipes is capped by the scheduler
+itself, which kills the child's process group when the cap is exceeded.
+
+On Linux the rlimits are set with prlimit(2) right after the spawn, so the
+first instant of a command runs unlimited. preexec_fn is not safe in a process
+with threads (the daemon), so elsewhere limits are set between fork and exec
+only while the process is single-threaded, and not at all otherwise. On
+platforms without `resource`/`wait4`, commands run through
+`executor.run_command` in a thread pool, without limits or accounting.
+
+A child's peak RSS also counts the memory it shared with flyn before exec
+(vfork/fork), so a small command reports flyn's own RSS (tens of MiB, more in
+the daemon). Results whose peak does not exceed flyn's own are marked
+`max_rss_upper_bound`: the command used at most that much.
+"""
+
+from __future__ import annotations
+import contextvars
+import os
+import selectors
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from flyn.config.loader import get_config
+from flyn.core.executor import HeadTailBuffer, _get_safe_workdir, _kill_tree
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_READ_CHUNK = 64 * 1024
+_POLL_SECONDS = 0.05
+
+@dataclass(frozen=True)
+class Limits:
+    cpu_seconds: int = 0          # 0 = unlimited
+    address_space_bytes: int = 0
+    open_files: int = 0
+    output_bytes: int = 0         # stdout + stderr per command; also RLIMIT_FSIZE
+
+    @classmethod
+    def from_config(cls) -> "Limits":
+        cfg = get_config()
+        return cls(
+            cpu_seconds=int(cfg.get("executor.rlimit_cpu_seconds", 0)),
+            address_space_bytes=int(cfg.get("executor.rlimit_address_space_mb", 0)) * 1024 * 1024,
+            open_files=int(cfg.get("executor.rlimit_open_files", 0)),
+            output_bytes=int(cfg.get("executor.rlimit_output_bytes", 0)))
+
+    def _pairs(self) -> List[Tuple[int, Tuple[int, int]]]:
+        pairs: List[Tuple[int, Tuple[int, int]]] = []
+        if resource is not None:
+            if self.cpu_seconds > 0:
+                # soft limit sends SIGXCPU, the hard limit one second later SIGKILL
+                pairs.append((resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 1)))
+            if self.address_space_bytes > 0 and hasattr(resource, "RLIMIT_AS"):
+                pairs.append((resource.RLIMIT_AS, (self.address_space_bytes, self.address_space_bytes)))
+            if self.open_files > 0:
+                pairs.append((resource.RLIMIT_NOFILE, (self.open_files, self.open_files)))
+            if self.output_bytes > 0:
+                pairs.append((resource.RLIMIT_FSIZE, (self.output_bytes, self.output_bytes)))
+        return pairs
+
+    def apply_to(self, pid: int) -> None:
+        """
+        Set the limits on a running child (prlimit, Linux only).
+        """
+        for which, (soft, hard) in self._pairs():
+            try:
+                _, cur_hard = resource.prlimit(pid, which)
+                if cur_hard != resource.RLIM_INFINITY:
+                    # an unprivileged process cannot raise a hard limit
+                    soft, hard = min(soft, cur_hard), min(hard, cur_hard)
+                resource.prlimit(pid, which, (soft, hard))
+            except OSError:
+                pass  # already exited
+
+    def preexec(self) -> Optional[Callable[[], None]]:
+        """
+        Function applying the limits in the child, or None when nothing is limited.
+        Only safe to use while the calling process has a single thread.
+        """
+        pairs = self._pairs()
+        if not pairs:
+            return None
+
+        def apply() -> None:
+            for which, (soft, hard) in pairs:
+                cur_soft, cur_hard = resource.getrlimit(which)
+                if cur_hard != resource.RLIM_INFINITY:
+                    # an unprivileged process cannot raise its hard limit
+                    soft, hard = min(soft, cur_hard), min(hard, cur_hard)
+                resource.setrlimit(which, (soft, hard))
+        return apply
+
+class _Job:
+    __slots__ = ("index", "cmd", "proc", "started", "deadline", "out", "err", "open_pipes", "status", "rusage",
+                 "killed_for")
+
+    def __init__(self, index: int, cmd: str, proc: subprocess.Popen, timeout: float, head: int, tail: int):
+        self.index = index
+        self.cmd = cmd
+        self.proc = proc
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.out = HeadTailBuffer(head, tail)
+        self.err = HeadTailBuffer(head, tail)
+        self.open_pipes = 2
+        self.status: Optional[int] = None
+        self.rusage = None
+        self.killed_for: Optional[str] = None
+
+    def kill(self, reason: str) -> None:
+        if self.killed_for is None:
+            self.killed_for = reason
+            _kill_tree(self.proc)
+
+def _rss_kb(rusage) -> int:
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    return int(rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss)
+
+class Scheduler:
+    def __init__(self, workers: Optional[int] = None, limits: Optional[Limits] = None, timeout: Optional[float] = None,
+                 cwd: Optional[Path] = None):
+        cfg = get_config()
+        self.workers = max(1, int(workers or cfg.get("executor.workers", 4)))
+        self.limits = limits or Limits.from_config()
+        self.timeout = float(timeout or cfg.get("safety.max_timeout_seconds", 30))
+        self.cwd = Path(cwd) if cwd else _get_safe_workdir()
+        self.head = int(cfg.get("executor.capture_head_bytes", 64 * 1024))
+        self.tail = int(cfg.get("executor.capture_tail_bytes", 64 * 1024))
+
+    def run(self, commands: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        Execute commands, at most `workers` at a time; yield each result dict as it finishes.
+        Results carry `index` (position in `commands`) so callers can restore input order.
+        """
+        if resource is None or not hasattr(os, "wait4"):
+            yield from self._run_pooled(list(commands))
+            return
+        pending = list(enumerate(commands))
+        pending.reverse()
+        running: Dict[int, _Job] = {}
+        sel = selectors.DefaultSelector()
+        preexec, post_spawn = None, None
+        if hasattr(resource, "prlimit"):
+            post_spawn = self.limits.apply_to
+        elif threading.active_count() == 1:
+            preexec = self.limits.preexec()
+        try:
+            while pending or running:
+                while pending and len(running) < self.workers:
+                    index, cmd = pending.pop()
+                    job = self._start(index, cmd, preexec, post_spawn, sel)
+                    if isinstance(job, dict):
+                        yield job
+                    else:
+                        running[job.proc.pid] = job
+                if not running:
+                    continue
+                self._pump(sel, running)
+                now = time.monotonic()
+                for job in list(running.values()):
+                    if job.status is None:
+                        self._reap(job)
+                    if job.status is None and now > job.deadline:
+                        job.kill("timeout")
+                    elif job.status is not None and job.open_pipes and now > job.deadline:
+                        # exited, but a background child still holds the pipes
+                        job.kill("timeout")
+                        self._close_pipes(job, sel)
+                    if job.status is not None and not job.open_pipes:
+                        del running[job.proc.pid]
+                        yield self._result(job)
+        finally:
+            for job in running.values():
+                job.kill("cancelled")
+                if job.status is None:
+                    os.waitpid(job.proc.pid, 0)
+                    job.proc.returncode = -signal.SIGKILL
+                self._close_pipes(job, sel)
+            sel.close()
+
+    def _start(self, index: int, cmd: str, preexec, post_spawn, sel: selectors.BaseSelector):
+        try:
+            proc = subprocess.Popen(shlex.split(cmd), cwd=str(self.cwd), stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    start_new_session=True, preexec_fn=preexec)
+        except (OSError, ValueError) as e:
+            reason = f"executable not found: {e}" if isinstance(e, FileNotFoundError) else str(e)
+            return {"index": index, "cmd": cmd, "ok": False, "rc": None, "stdout": "", "stderr": reason,
+                    "wall_seconds": 0.0, "cpu_user_seconds": 0.0, "cpu_system_seconds": 0.0, "max_rss_kb": 0,
+                    "max_rss_upper_bound": None, "limit": None}
+        if post_spawn is not None:
+            post_spawn(proc.pid)
+        job = _Job(index, cmd, proc, self.timeout, self.head, self.tail)
+        for pipe, buf in ((proc.stdout, job.out), (proc.stderr, job.err)):
+            os.set_blocking(pipe.fileno(), False)
+            sel.register(pipe, selectors.EVENT_READ, (job, buf))
+        return job
+
+    def _pump(self, sel: selectors.BaseSelector, running: Dict[int, _Job]) -> None:
+        next_deadline = min(j.deadline for j in running.values())
+        wait = max(0.0, min(_POLL_SECONDS, next_deadline - time.monotonic()))
+        if not sel.get_map():
+            time.sleep(wait)
+            return
+        for key, _ in sel.select(wait):
+            job, buf = key.data
+            try:
+                data = os.read(key.fd, _READ_CHUNK)
+            except BlockingIOError:
+                continue
+            if not data:
+                sel.unregister(key.fileobj)
+                key.fileobj.close()
+                job.open_pipes -= 1
+                continue
+            buf.write(data)
+            cap = self.limits.output_bytes
+            if cap > 0 and job.out.total + job.err.total > cap:
+                job.kill("output")
+
+    def _reap(self, job: _Job) -> None:
+        pid, status, rusage = os.wait4(job.proc.pid, os.WNOHANG)
+        if pid == 0:
+            return
+        job.status = status
+        job.rusage = rusage
+        # keep Popen consistent so it does not try to reap the pid again
+        job.proc.returncode = os.waitstatus_to_exitcode(status)
+
+    def _close_pipes(self, job: _Job, sel: selectors.BaseSelector) -> None:
+        for pipe in (job.proc.stdout, job.proc.stderr):
+            if pipe is not None and not pipe.closed:
+                try:
+                    sel.unregister(pipe)
+                except (KeyError, ValueError):
+                    pass
+                pipe.close()
+        job.open_pipes = 0
+
+    def _result(self, job: _Job) -> Dict[str, Any]:
+        rc = job.proc.returncode
+        limit = job.killed_for
+        if limit is None and rc is not None and rc < 0:
+            sig = -rc
+            if sig == getattr(signal, "SIGXCPU", None) or (sig == signal.SIGKILL and self.limits.cpu_seconds and
+                                                            job.rusage.ru_utime + job.rusage.ru_stime >= self.limits.cpu_seconds):
+                limit = "cpu"
+            elif sig == getattr(signal, "SIGXFSZ", None):
+                limit = "output"
+        stderr = job.err.text()
+        if limit == "timeout":
+            stderr += f"timeout: command exceeded {self.timeout:g} seconds"
+        elif limit == "output":
+            stderr += f"killed: output exceeded {self.limits.output_bytes} bytes"
+        elif limit == "cpu":
+            stderr += f"killed: CPU time exceeded {self.limits.cpu_seconds} seconds"
+        ru = job.rusage
+        rss = _rss_kb(ru) if ru else None
+        return {
+            "index": job.index,
+            "cmd": job.cmd,
+            "ok": limit is None and rc == 0,
+            "rc": None if limit == "timeout" else rc,
+            "stdout": job.out.text(),
+            "stderr": stderr,
+            "stdout_bytes": job.out.total,
+            "stderr_bytes": job.err.total,
+            "truncated": job.out.truncated or job.err.truncated,
+            "limit": limit,
+            "wall_seconds": round(time.monotonic() - job.started, 4),
+            "cpu_user_seconds": round(ru.ru_utime, 4) if ru else None,
+            "cpu_system_seconds": round(ru.ru_stime, 4) if ru else None,
+            "max_rss_kb": rss,
+            # not above flyn's own peak: may be memory inherited before exec, not the command's
+            "max_rss_upper_bound": rss is not None and rss <= _rss_kb(resource.getrusage(resource.RUSAGE_SELF)),
+        }
+
+    def _run_pooled(self, commands: list[str]) -> Iterator[Dict[str, Any]]:
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from flyn.core.executor import run_command
+
+        def one(index: int, cmd: str) -> Dict[str, Any]:
+            t0 = time.monotonic()
+            res = run_command(cmd, timeout=int(self.timeout), dry_run=False)
+            res.update({"index": index, "limit": None, "wall_seconds": round(time.monotonic() - t0, 4),
+                        "cpu_user_seconds": None, "cpu_system_seconds": None, "max_rss_kb": None,
+                        "max_rss_upper_bound": None})
+            return res
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # each job gets a copy of the caller's context (the daemon request's config)
+            futures = [pool.submit(contextvars.copy_context().run, one, i, c) for i, c in enumerate(commands)]
+            for fut in as_completed(futures):
+                yield fut.result()
+
+def run_many(commands: Iterable[str], workers: Optional[int] = None, limits: Optional[Limits] = None,
+             timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Convenience wrapper: `Scheduler(...).run(commands)`.
+    """
+    return Scheduler(workers, limits, timeout).run(commands)
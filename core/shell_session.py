@@ -0,0 +1,246 @@
+"""
+shell_session.py
+One long-lived shell process that runs commands back to back (executor.mode = "session").
+
+Commands are evaluated by the same bash/zsh/sh process, so pipes, redirects and
+`&&` behave as in a terminal, `cd` and exported variables carry over, and no
+process is spawned per command beyond what the command itself starts.
+
+Framing: each command is sent as `eval '<cmd>' </dev/null` followed by printf
+calls that write a per-session random sentinel to stdout (with the exit code)
+and to stderr. Output before the sentinels belongs to the command. A command
+that overruns its timeout gets the whole session killed (its process group);
+the next command starts a fresh shell. If the shell itself exits (e.g. the
+command ran `exit`), it is restarted the same way.
+"""
+
+from __future__ import annotations
+import atexit
+import os
+import re
+import secrets
+import selectors
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from flyn.config.loader import get_config
+from flyn.core.executor import HeadTailBuffer, _echo_sink, _forward, _get_safe_workdir, _kill_tree
+
+_READ_CHUNK = 64 * 1024
+_RC_LINE = re.compile(rb"^:(-?\d+)\n")
+
+def session_shell() -> list[str]:
+    """
+    argv for the session shell: executor.session_shell, else general.shell or
+    $SHELL when it is bash/zsh, else /bin/sh. Startup files are skipped.
+    """
+    cfg = get_config()
+    shell = cfg.get("executor.session_shell") or cfg.get("general.shell") or os.getenv("SHELL") or ""
+    name = Path(shell).name
+    if name not in ("bash", "zsh", "sh", "dash", "ksh"):
+        shell, name = "", ""
+    path = shutil.which(shell) if shell else None
+    if path is None:
+        return ["/bin/sh"]
+    if name == "bash":
+        return [path, "--noprofile", "--norc"]
+    if name == "zsh":
+        return [path, "-f"]
+    return [path]
+
+class SessionError(RuntimeError):
+    pass
+
+class _Stream:
+    """
+    Collects one pipe's bytes for the current command until the sentinel shows up.
+    """
+
+    def __init__(self, marker: bytes, buf: HeadTailBuffer, echo: Any):
+        self.marker = marker
+        self.buf = buf
+        self.echo = echo
+        self.pending = bytearray()
+        self.found = False
+        self.trailer = b""
+
+    @property
+    def done(self) -> bool:
+        # the sentinel line is complete (stdout's carries the exit code)
+        return self.found and b"\n" in self.trailer
+
+    def feed(self, data: bytes) -> None:
+        if self.found:
+            self.trailer += data
+            return
+        self.pending += data
+        i = self.pending.find(self.marker)
+        if i >= 0:
+            self._emit(bytes(self.pending[:i]))
+            self.trailer = bytes(self.pending[i + len(self.marker):])
+            self.pending.clear()
+            self.found = True
+            return
+        # everything except a possible partial marker at the end is command output
+        keep = len(self.marker) - 1
+        if len(self.pending) > keep:
+            cut = len(self.pending) - keep
+            self._emit(bytes(self.pending[:cut]))
+            del self.pending[:cut]
+
+    def _emit(self, data: bytes) -> None:
+        if data:
+            self.buf.write(data)
+            if self.echo is not None:
+                _forward(self.echo, data)
+
+class ShellSession:
+    def __init__(self, argv: Optional[list[str]] = None, cwd: Optional[Path] = None):
+        self.argv = argv or session_shell()
+        self.cwd = Path(cwd) if cwd else _get_safe_workdir()
+        cfg = get_config()
+        self.head = int(cfg.get("executor.capture_head_bytes", 64 * 1024))
+        self.tail = int(cfg.get("executor.capture_tail_bytes", 64 * 1024))
+        self._proc: Optional[subprocess.Popen] = None
+        self._token = b""
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _start(self) -> None:
+        self._token = b"__FLYN_" + secrets.token_hex(8).encode("ascii") + b"__"
+        self._proc = subprocess.Popen(self.argv, cwd=str(self.cwd), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE, start_new_session=True)
+        for pipe in (self._proc.stdout, self._proc.stderr):
+            os.set_blocking(pipe.fileno(), False)
+
+    def close(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        if proc.poll() is None:
+            _kill_tree(proc)
+        proc.wait()
+        for pipe in (proc.stdin, proc.stdout, proc.stderr):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def restart(self) -> None:
+        self.close()
+        self.restarts += 1
+
+    def run(self, cmd: str, timeout: float = 30.0, echo: bool = False) -> Dict[str, Any]:
+        """
+        Run cmd in the session. Returns the same keys as executor.run_command.
+        """
+        with self._lock:
+            if not self.alive:
+                if self._proc is not None:
+                    self.restart()
+                self._start()
+            return self._run(cmd, timeout, echo)
+
+    def _run(self, cmd: str, timeout: float, echo: bool) -> Dict[str, Any]:
+        proc = self._proc
+        token = self._token.decode("ascii")
+        script = (f"eval {shlex.quote(cmd)} </dev/null\n"
+                  f"printf '\\n%s:%d\\n' '{token}' \"$?\"\n"
+                  f"printf '\\n%s\\n' '{token}' >&2\n")
+        out_buf, err_buf = HeadTailBuffer(self.head, self.tail), HeadTailBuffer(self.head, self.tail)
+        streams = {
+            proc.stdout.fileno(): _Stream(b"\n" + self._token, out_buf, _echo_sink(sys.stdout) if echo else None),
+            proc.stderr.fileno(): _Stream(b"\n" + self._token, err_buf, _echo_sink(sys.stderr) if echo else None),
+        }
+        t0 = time.monotonic()
+        deadline = t0 + timeout
+        try:
+            proc.stdin.write(script.encode("utf-8"))
+            proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.restart()
+            raise SessionError("shell session died before the command was sent")
+
+        sel = selectors.DefaultSelector()
+        for pipe in (proc.stdout, proc.stderr):
+            sel.register(pipe, selectors.EVENT_READ)
+        died = timed_out = False
+        try:
+            while not all(s.done for s in streams.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                events = sel.select(min(remaining, 0.25))
+                for key, _ in events:
+                    try:
+                        data = os.read(key.fd, _READ_CHUNK)
+                    except BlockingIOError:
+                        continue
+                    if not data:
+                        sel.unregister(key.fileobj)
+                        died = True
+                        continue
+                    streams[key.fd].feed(data)
+                if died and not sel.get_map():
+                    break
+        finally:
+            sel.close()
+
+        wall = round(time.monotonic() - t0, 4)
+        out, err = streams[proc.stdout.fileno()], streams[proc.stderr.fileno()]
+        # flush anything that turned out not to be a marker prefix
+        for s in (out, err):
+            if not s.found and s.pending:
+                s._emit(bytes(s.pending))
+                s.pending.clear()
+        result: Dict[str, Any] = {"session": True, "wall_seconds": wall}
+        stderr = err_buf.text()
+        if timed_out:
+            # the hung command and its shell go together; the next call starts fresh
+            self.restart()
+            stderr += f"timeout: command exceeded {timeout:g} seconds (session restarted)"
+            rc = None
+        elif not out.done:
+            proc.wait()
+            rc = proc.returncode
+            self.restart()
+            stderr += f"shell session exited (rc={rc}); restarted"
+        else:
+            m = _RC_LINE.match(out.trailer)
+            rc = int(m.group(1)) if m else None
+        result.update({
+            "ok": rc == 0 and not timed_out and out.done,
+            "rc": rc,
+            "stdout": out_buf.text(),
+            "stderr": stderr,
+            "stdout_bytes": out_buf.total,
+            "stderr_bytes": err_buf.total,
+            "truncated": out_buf.truncated or err_buf.truncated,
+        })
+        if echo:
+            result["streamed"] = True
+        return result
+
+_session: Optional[ShellSession] = None
+_session_lock = threading.Lock()
+
+def get_session() -> ShellSession:
+    """
+    The process-wide session (started lazily, killed at exit).
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = ShellSession()
+            atexit.register(_session.close)
+        return _session
@@ -0,0 +1,176 @@
+"""
+tracing.py
+Lightweight span timing for the generate -> parse -> validate -> execute pipeline.
+
+    with tracing.span("parse"):
+        ...
+
+Spans are only recorded while a trace is active in the current context (the
+CLI starts one per command); otherwise `span()` returns a shared no-op context
+manager, so instrumented hot paths pay one ContextVar lookup. Traces can be
+summarised per stage (`stage_totals`, stored with history entries), printed as
+a tree (`report`, behind `flyn --profile`) and exported as JSON lines or in
+Chrome trace format (`export`, behind `flyn --trace FILE`).
+"""
+
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("flyn_trace", default=None)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+    def set(self, **attrs) -> None:
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("trace", "name", "attrs", "start", "depth", "tid")
+
+    def __init__(self, trace: "Trace", name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.tid = threading.get_ident()
+        self.depth = self.trace._enter(self.tid)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace._exit(self, end)
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+class Trace:
+    def __init__(self, name: str = "flyn"):
+        self.name = name
+        self.origin = time.perf_counter_ns()
+        self.wall_start = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self._depths: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.end: Optional[int] = None
+
+    def _enter(self, tid: int) -> int:
+        with self._lock:
+            depth = self._depths.get(tid, 0)
+            self._depths[tid] = depth + 1
+        return depth
+
+    def _exit(self, span: _Span, end: int) -> None:
+        with self._lock:
+            self._depths[span.tid] = span.depth
+            self.spans.append({"name": span.name, "start_ns": span.start - self.origin, "dur_ns": end - span.start,
+                               "depth": span.depth, "tid": span.tid, "attrs": span.attrs})
+
+    @property
+    def total_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter_ns()
+        return (end - self.origin) / 1e6
+
+    def stage_totals(self) -> Dict[str, float]:
+        """
+        {span name: total milliseconds}; nested stages are also part of their parent's time.
+        """
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            totals[s["name"]] = totals.get(s["name"], 0.0) + s["dur_ns"] / 1e6
+        return {k: round(v, 3) for k, v in totals.items()}
+
+    def report(self) -> str:
+        """
+        Timing tree, aggregated by span path (name plus enclosing span names), in start order.
+        """
+        rows: Dict[tuple, list] = {}
+        stacks: Dict[int, list] = {}
+        for s in sorted(self.spans, key=lambda s: (s["tid"], s["start_ns"])):
+            stack = stacks.setdefault(s["tid"], [])
+            while stack and stack[-1][1] <= s["start_ns"]:
+                stack.pop()
+            path = tuple(name for name, _ in stack) + (s["name"],)
+            stack.append((s["name"], s["start_ns"] + s["dur_ns"]))
+            row = rows.setdefault(path, [s["start_ns"], 0, 0])
+            row[0] = min(row[0], s["start_ns"])
+            row[1] += s["dur_ns"]
+            row[2] += 1
+        lines = [f"Profile: {self.name} {self.total_ms:.1f} ms total"]
+        for path, (_, dur, count) in sorted(rows.items(), key=lambda kv: (kv[1][0], len(kv[0]))):
+            label = "  " * len(path) + path[-1] + (f" x{count}" if count > 1 else "")
+            lines.append(f"{label:<40} {dur / 1e6:10.2f} ms")
+        return "\n".join(lines)
+
+    def export(self, path: str) -> None:
+        """
+        Write the trace to path: Chrome trace format for *.json, JSON lines otherwise.
+        """
+        path = os.path.expanduser(path)
+        pid = os.getpid()
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                events = [{"name": s["name"], "ph": "X", "ts": s["start_ns"] / 1000, "dur": s["dur_ns"] / 1000,
+                           "pid": pid, "tid": s["tid"], "args": s["attrs"]} for s in self.spans]
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                           "otherData": {"trace": self.name, "wall_start": self.wall_start}}, f, default=str)
+            else:
+                for s in sorted(self.spans, key=lambda s: s["start_ns"]):
+                    f.write(json.dumps({"trace": self.name, "wall_start": self.wall_start, "name": s["name"],
+                                        "start_ms": s["start_ns"] / 1e6, "dur_ms": s["dur_ns"] / 1e6,
+                                        "depth": s["depth"], "tid": s["tid"], "attrs": s["attrs"]}, default=str) + "\n")
+
+def summarize(timings: Iterable[Dict[str, float]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Aggregate per-entry stage timings (as stored in history) into
+    {stage: {count, p50_ms, p95_ms, p99_ms, max_ms}}.
+    """
+    samples: Dict[str, List[float]] = {}
+    for entry in timings:
+        for name, ms in entry.items():
+            samples.setdefault(name, []).append(float(ms))
+    out: Dict[str, Dict[str, Any]] = {}
+    for name, values in sorted(samples.items()):
+        values.sort()
+        out[name] = {"count": len(values), "p50_ms": _pct(values, 0.5), "p95_ms": _pct(values, 0.95),
+                     "p99_ms": _pct(values, 0.99), "max_ms": values[-1]}
+    return out
+
+def _pct(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def span(name: str, **attrs):
+    trace = _current.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, attrs)
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+def start_trace(name: str = "flyn") -> Trace:
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+def end_trace(trace: Trace) -> Trace:
+    trace.end = time.perf_counter_ns()
+    if _current.get() is trace:
+        _current.set(None)
+    return trace
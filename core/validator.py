@@ -4,42 +4,70 @@ Validate parsed command and combine model-provided risk/confidence with internal
 """
 
 from __future__ import annotations
+from functools import lru_cache
 from typing import Dict, Any
-from pydantic import BaseModel, Field, confloat
 from flyn.core import safety
+from flyn.core import tracing
 from flyn.config.loader import get_config
 
-class GenOutput(BaseModel):
-    command: str
-    explanation: str
-    confidence: confloat(ge=0.0, le=1.0) = Field(default=0.5)
-    risk_tags: list[str] = Field(default_factory=list)
+@lru_cache(maxsize=None)
+def _gen_output_model():
+    # pydantic is imported on first validation, not when the CLI starts
+    from pydantic import BaseModel, Field, confloat
+
+    class GenOutput(BaseModel):
+        command: str
+        explanation: str
+        confidence: confloat(ge=0.0, le=1.0) = Field(default=0.5)
+        risk_tags: list[str] = Field(default_factory=list)
+
+    return GenOutput
+
+def __getattr__(name: str):
+    if name == "GenOutput":
+        return _gen_output_model()
+    raise AttributeError(name)
 
 def validate_generated(obj: Dict[str, Any]) -> Dict[str, Any]:
     """
     Accepts raw parsed dict (from parser.extract_json_like), returns structured dict:
-    { ok: bool, reason: str | None, command, confidence, risk, needs_confirmation }
+    { ok: bool, reason: str | None, command, confidence, risk, safety_rules, need_confirmation }
     """
+    with tracing.span("validate"):
+        return _validate(obj)
+
+def _validate(obj: Dict[str, Any]) -> Dict[str, Any]:
     cfg = get_config()
     try:
-        g = GenOutput(**obj)
+        g = _gen_output_model()(**obj)
     except Exception as e:
         return {"ok": False, "reason": f"invalid model output: {e}"}
 
     cmd = g.command.strip()
     model_conf = float(g.confidence or 0.0)
-    internal_risk = safety.risk_level(cmd)
-    needs_confirmation = safety.requires_confirmation(cmd)
+    # one scan gives risk, matched rules and the confirmation flag
+    verdict = safety.analyze(cmd)
 
     # If model confidence is low, mark it for review
     min_conf = float(cfg.get("safety.min_confidence_to_auto_run", 0.9))
     low_confidence = model_conf < min_conf
 
+    # commands that cannot run on this host: "flag" (ask first, default), "reject" or "off"
+    missing_mode = cfg.get("safety.missing_executables", "flag")
+    missing = []
+    if missing_mode != "off" and cmd:
+        from flyn.core.pathindex import missing_commands
+        with tracing.span("pathindex"):
+            missing = missing_commands(cmd)
+
     ok = True
     reason = None
-    if safety.is_dangerous(cmd):
+    if verdict.dangerous:
         ok = False
         reason = "command flagged as dangerous by internal policy"
+    elif missing and missing_mode == "reject":
+        ok = False
+        reason = f"not installed on this host: {', '.join(missing)}"
     elif low_confidence:
         ok = False
         reason = "model confidence below threshold"
@@ -49,7 +77,9 @@ def validate_generated(obj: Dict[str, Any]) -> Dict[str, Any]:
         "reason": reason,
         "command": cmd,
         "confidence": model_conf,
-        "risk": internal_risk,
-        "need_confirmation": needs_confirmation or low_confidence,
+        "risk": verdict.risk,
+        "safety_rules": list(verdict.matched_rules),
+        "need_confirmation": verdict.needs_confirmation or low_confidence or bool(missing),
+        "missing_executables": missing,
         "raw": g.dict()
     }